@@ -1,10 +1,14 @@
+import asyncio
 import logging
 import os
+import signal
 import tempfile
+import time
 import json
 import socket
 import typing
 import warnings
+from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from telegram.error import NetworkError, TimedOut
 from telegram.ext import (
@@ -15,43 +19,242 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler,
     CallbackQueryHandler,
+    TypeHandler,
 )
-from telegram.request import HTTPXRequest
+from telegram.request import BaseRequest
 from telegram.warnings import PTBUserWarning
 from config import (
     TELEGRAM_BOT_TOKEN, GOOGLE_SHEETS_CREDENTIALS_FILE,
-    SPREADSHEET_ID_MY, SPREADSHEET_ID_HER, SPREADSHEET_ID_COMMON
+    SPREADSHEET_ID_MY, SPREADSHEET_ID_HER, SPREADSHEET_ID_COMMON,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS, MAX_CONCURRENT_UPDATES,
+    PERSISTENCE_FILE, PERSISTENCE_UPDATE_INTERVAL, METRICS_HOST, METRICS_PORT,
+    HEALTH_HOST, HEALTH_PORT,
+    MONTH_ROLLOVER_DAYS_AHEAD, MONTH_ROLLOVER_CHECK_INTERVAL, SUMMARY_MODE,
+    SHEET_HEADERS,
 )
 
 from services.speech_service import SpeechService
 from services.sheets_service import GoogleSheetsService
 from services.category_service import CategoryService
-from services.auth_decorator import require_auth, is_user_allowed
-from services.telegram_utils import safe_edit_text, safe_reply_text
-
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+from services.import_service import ImportResult, StatementImportService
+from services.qr_service import QRService
+from services.receipt_index import ReceiptIndex
+from services.media_group import MediaGroupCollector
+from services.sheets_writer import ShardedSheetsWriter
+from services.outbox import Outbox, OutboxReplayer
+from services.row_index import ID_COLUMN_INDEX, RowIndex, RowRef
+from services.summary import SummaryAggregates, SummaryMaterializer
+from services.stats_chart import StatsChartCache, render_stats_chart
+from services.export_service import EXPORT_FORMATS, ExportService, sheets_read_limiter
+from services.search_index import SearchIndex
+from services.budget_service import BudgetService
+from services.transaction import (
+    Transaction,
+    TransactionType,
+    format_rubles,
+    kopecks_to_cell,
+    to_kopecks,
+)
+from services.spreadsheet_registry import SpreadsheetRegistry, parse_spreadsheet_id
+from services.keyboards import (
+    ALBUM_CANCEL, ALBUM_PREFIX, CATEGORY_PREFIX, TABLE_PREFIX,
+    CategoryKeyboards, TableKeyboards,
+)
+from services.auth_decorator import require_admin, require_auth, is_user_allowed
+from services.outbound_scheduler import PRIORITY_CONFIRMATION, PRIORITY_INFO
+from services.telegram_utils import (
+    TrackedHTTPXRequest,
+    outbound_scheduler,
+    safe_edit_text,
+    safe_reply_document,
+    safe_reply_photo,
+    safe_reply_text,
 )
+from services.update_latency import UpdateLatencyTracker
+from services.update_processor import PerUserUpdateProcessor
+from services.persistence import SQLitePersistence
+from services.metrics import HANDLER_LATENCY, REGISTRY, MetricsServer, timed
+from services.health import HEALTH
+from services.tracing import profiler, trace_update, traced
+from services.logging_setup import setup_logging
+
 logger = logging.getLogger(__name__)
 TELEGRAM_API_HOSTS = {"api.telegram.org", "api.telegram.org."}
+# Импорт выписок: как часто обновлять сообщение о прогрессе и
+# сколько строк разбирать между передачами управления event loop
+IMPORT_PROGRESS_INTERVAL_SECONDS = 2.0
+IMPORT_PARSE_CHUNK_SIZE = 500
 
 # States for conversation
 (
     WAITING_CATEGORY,
     WAITING_CONFIRMATION,
 ) = range(2)
-category_service = CategoryService()
-# Initialize services
-speech_service = SpeechService(category_service)
-# Создаём один экземпляр сервиса
-sheets_service = GoogleSheetsService()
-
-SPREADSHEET_IDS = [SPREADSHEET_ID_MY, SPREADSHEET_ID_HER, SPREADSHEET_ID_COMMON]
-
-def get_sheet_choices():
-    """Возвращает dict: {имя_таблицы: spreadsheet_id}"""
-    return dict(sheets_service.get_available_sheets(SPREADSHEET_IDS))
+# Сервисы создаются при запуске в init_services(), а не при импорте bot:
+# они читают и создают файлы в data/ и запускают фоновые задачи
+category_service: CategoryService
+speech_service: SpeechService
+sheets_service: GoogleSheetsService
+import_service: StatementImportService
+qr_service: QRService
+receipt_index: ReceiptIndex
+media_groups: MediaGroupCollector
+spreadsheet_registry: SpreadsheetRegistry
+sheets_writer: ShardedSheetsWriter
+outbox: Outbox
+outbox_replayer: OutboxReplayer
+summary_aggregates: SummaryAggregates
+summary_materializer: SummaryMaterializer
+stats_charts: StatsChartCache
+row_index: RowIndex
+export_service: ExportService
+search_index: SearchIndex
+budget_service: BudgetService
+category_keyboards: CategoryKeyboards
+http_servers: typing.List[MetricsServer]
+_services_initialized = False
+update_latency = UpdateLatencyTracker()
+HEALTH.set_last_update(lambda: update_latency.last_update_at)
+
+
+def init_services() -> None:
+    """Create the services and wire the sheets writer listeners; runs once."""
+    global category_service, speech_service, sheets_service, import_service
+    global qr_service, receipt_index, media_groups, spreadsheet_registry
+    global sheets_writer, outbox, outbox_replayer, summary_aggregates
+    global summary_materializer, stats_charts, row_index, export_service
+    global search_index, budget_service, category_keyboards, http_servers
+    global _services_initialized
+    if _services_initialized:
+        return
+    category_service = CategoryService()
+    speech_service = SpeechService(category_service)
+    sheets_service = GoogleSheetsService()
+    import_service = StatementImportService(category_service)
+    qr_service = QRService()
+    receipt_index = ReceiptIndex()
+    media_groups = MediaGroupCollector()
+    spreadsheet_registry = SpreadsheetRegistry()
+    sheets_writer = ShardedSheetsWriter()
+    outbox = Outbox()
+    outbox_replayer = OutboxReplayer(outbox, sheets_writer, sheets_service.get_row_ids)
+    summary_aggregates = SummaryAggregates(sheets_service)
+    summary_materializer = SummaryMaterializer(summary_aggregates, sheets_service)
+    stats_charts = StatsChartCache()
+    row_index = RowIndex()
+    export_service = ExportService(sheets_service)
+    search_index = SearchIndex(sheets_service)
+    budget_service = BudgetService()
+    sheets_writer.add_listener(summary_aggregates.on_rows_written)
+    sheets_writer.add_listener(search_index.on_rows_written)
+    sheets_writer.add_listener(row_index.on_rows_written)
+    if SUMMARY_MODE == "materialized":
+        sheets_writer.add_listener(summary_materializer.on_rows_written)
+    category_keyboards = CategoryKeyboards(category_service)
+
+    # /metrics и /health на одном сервере, если порты совпадают
+    http_servers = []
+    if METRICS_PORT:
+        http_servers.append(
+            MetricsServer(
+                REGISTRY,
+                METRICS_HOST,
+                METRICS_PORT,
+                health=HEALTH if HEALTH_PORT == METRICS_PORT else None,
+            )
+        )
+    if HEALTH_PORT and HEALTH_PORT != METRICS_PORT:
+        http_servers.append(MetricsServer(None, HEALTH_HOST, HEALTH_PORT, health=HEALTH))
+    _services_initialized = True
+
+# Общие таблицы из переменных окружения, доступные всем пользователям
+SPREADSHEET_IDS = [
+    spreadsheet_id
+    for spreadsheet_id in (SPREADSHEET_ID_MY, SPREADSHEET_ID_HER, SPREADSHEET_ID_COMMON)
+    if spreadsheet_id
+]
+# Названия таблиц меняются редко, запрашиваем их один раз: {spreadsheet_id: название}
+_sheet_choices_cache: typing.Dict[str, str] = {}
+# Общий запрос названий: обработчики, пришедшие до его окончания, ждут его же
+_sheet_choices_task: typing.Optional[asyncio.Task] = None
+# Если названия получены не для всех таблиц, повторяем не чаще раза в N секунд
+SHEET_CHOICES_RETRY_INTERVAL = 30
+_sheet_choices_retry_at = 0.0
+# Клавиатуры выбора таблицы по набору таблиц
+_table_keyboards: typing.Dict[typing.Tuple[typing.Tuple[str, str], ...], TableKeyboards] = {}
+
+
+class NoSpreadsheetsError(Exception):
+    """No table is available to the user: titles couldn't be loaded from Sheets."""
+
+
+NO_SPREADSHEETS_MESSAGE = "⚠️ Google Таблицы сейчас недоступны, попробуйте чуть позже."
+
+
+async def load_sheet_choices() -> None:
+    """
+    Fill the table title cache in a worker thread.
+
+    Concurrent callers await the same request. While some titles are
+    missing (Sheets unavailable at startup) the request is repeated at most
+    every SHEET_CHOICES_RETRY_INTERVAL seconds.
+    """
+    global _sheet_choices_task, _sheet_choices_retry_at
+    if len(_sheet_choices_cache) >= len(set(SPREADSHEET_IDS)):
+        return
+    if _sheet_choices_task is None:
+        if time.monotonic() < _sheet_choices_retry_at:
+            return
+        _sheet_choices_task = asyncio.create_task(
+            asyncio.to_thread(sheets_service.get_available_sheets, SPREADSHEET_IDS)
+        )
+    task = _sheet_choices_task
+    try:
+        # shield: отмена одного обработчика не отменяет общий запрос
+        titles = await asyncio.shield(task)
+        _sheet_choices_cache.update(
+            (spreadsheet_id, title) for title, spreadsheet_id in titles
+        )
+    except Exception:
+        if _sheet_choices_task is task:
+            # Ошибку общего запроса пишем один раз, а не в каждом ожидавшем обработчике
+            logger.warning("Failed to load spreadsheet titles", exc_info=True)
+    finally:
+        if _sheet_choices_task is task and task.done():
+            _sheet_choices_task = None
+            _sheet_choices_retry_at = time.monotonic() + SHEET_CHOICES_RETRY_INTERVAL
+
+
+def get_sheet_choices(user_id=None):
+    """
+    Возвращает dict: {spreadsheet_id: имя_таблицы} — общие и добавленные пользователем.
+
+    Таблицы выбираются по id: у разных таблиц может быть одно название.
+    Берёт названия из кэша, не обращаясь к Sheets; перед вызовом из
+    обработчика нужно дождаться load_sheet_choices().
+    """
+    # Общие таблицы всегда в порядке из конфигурации, как бы ни загружались названия
+    choices = {
+        spreadsheet_id: _sheet_choices_cache[spreadsheet_id]
+        for spreadsheet_id in SPREADSHEET_IDS
+        if spreadsheet_id in _sheet_choices_cache
+    }
+    if user_id is not None:
+        choices.update(spreadsheet_registry.for_user(user_id))
+    return choices
+
+def all_spreadsheet_ids() -> typing.Set[str]:
+    """Общие таблицы и таблицы, добавленные пользователями."""
+    return set(get_sheet_choices()) | set(spreadsheet_registry.all_ids())
+
+def get_table_keyboards(user_id) -> TableKeyboards:
+    """Клавиатуры выбора таблицы строятся один раз для каждого набора таблиц."""
+    tables = tuple(get_sheet_choices(user_id).items())
+    keyboards = _table_keyboards.get(tables)
+    if keyboards is None:
+        keyboards = _table_keyboards[tables] = TableKeyboards(tables)
+    return keyboards
 
 ALLOWED_USERS_PATH = 'data/allowed_users.json'
 
@@ -76,18 +279,62 @@ def get_user_entry(user_id):
             return user
     return None
 
-def get_spreadsheet_id_for_user(user_id):
+@traced("spreadsheet_lookup")
+async def get_spreadsheet_id_for_user(user_id):
+    await load_sheet_choices()
     users = load_allowed_users()
-    sheet_choices = get_sheet_choices()
-    user = get_user_entry(user_id)
+    sheet_choices = get_sheet_choices(user_id)
+    user = next((u for u in users if u["user_id"] == user_id), None)
     if user is None:
         # Неавторизованный пользователь
         raise Exception("User not allowed")
-    # Если не выбран лист — присваиваем первую таблицу
-    if not user.get("selected_sheet") or user["selected_sheet"] not in sheet_choices:
-        user["selected_sheet"] = next(iter(sheet_choices.keys()))
+    if not sheet_choices:
+        raise NoSpreadsheetsError("No spreadsheet titles loaded")
+    # Если таблица не выбрана или недоступна — присваиваем первую
+    if user.get("selected_spreadsheet_id") not in sheet_choices:
+        # Раньше выбор хранился названием таблицы
+        legacy_title = user.pop("selected_sheet", None)
+        user["selected_spreadsheet_id"] = next(
+            (
+                spreadsheet_id
+                for spreadsheet_id, title in sheet_choices.items()
+                if legacy_title and title == legacy_title
+            ),
+            next(iter(sheet_choices)),
+        )
         save_allowed_users(users)
-    return sheet_choices[user["selected_sheet"]]
+    return user["selected_spreadsheet_id"]
+
+
+async def save_rows(spreadsheet_id, rows_by_sheet, user_id=None, receipt_keys=None) -> bool:
+    """
+    Write rows to Sheets or, if that fails, keep them in the outbox.
+
+    Rows saved on behalf of a user are remembered for /delete and /edit,
+    together with receipt_keys ({transaction id: (fn, i, fp)}) of QR receipts.
+    Returns False when the rows were queued for a later replay.
+    """
+    if user_id is not None:
+        row_index.add(user_id, spreadsheet_id, rows_by_sheet, receipt_keys)
+    try:
+        await sheets_writer.write_rows(spreadsheet_id, rows_by_sheet)
+        return True
+    except Exception:
+        logger.warning(
+            "Sheets write to %s failed, %s rows go to the outbox",
+            spreadsheet_id,
+            sum(len(rows) for rows in rows_by_sheet.values()),
+            exc_info=True,
+        )
+        await asyncio.to_thread(outbox.add, spreadsheet_id, rows_by_sheet)
+        return False
+
+
+async def save_transactions(spreadsheet_id, transactions, source, user_id=None) -> bool:
+    """Write transactions with their ids to Sheets, falling back to the outbox."""
+    rows_by_sheet = sheets_service.transaction_rows_by_sheet(transactions, source)
+    receipt_keys = {t.id: t.receipt_key for t in transactions if t.receipt_key}
+    return await save_rows(spreadsheet_id, rows_by_sheet, user_id, receipt_keys)
 
 
 def force_ipv4_for_telegram() -> None:
@@ -142,12 +389,19 @@ async def error_handler(
     if isinstance(context.error, (TimedOut, NetworkError)):
         logger.warning("Transient Telegram API error while handling update", exc_info=context.error)
         return
+    if isinstance(context.error, NoSpreadsheetsError):
+        logger.warning("No spreadsheets available for update %s", update)
+        if isinstance(update, Update) and update.effective_message:
+            await send_or_edit_message(update, NO_SPREADSHEETS_MESSAGE)
+        return
 
     logger.exception("Unhandled exception while processing update %s", update, exc_info=context.error)
 
 
 
 
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
@@ -156,31 +410,46 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "Вы можете:\n"
         "• Отправить голосовое сообщение с описанием операции\n"
         "• Отправить фото с QR-кодом чека\n"
+        "• Отправить CSV-выписку банка для импорта\n"
         "• Использовать текстовые команды\n\n"
         "Доступные команды:\n"
-        "/stats - Показать статистику за месяц\n"
+        "/stats - Показать статистику за месяц (/stats chart — с графиком)\n"
         "/categories - Показать список категорий\n"
         "/delete - Удалить последнюю запись\n"
-        "/select_table - Выбрать, в какую таблицу записывать транзакции\n"
+        "/edit - Исправить последнюю запись (/edit 450, /edit категория Такси)\n"
+        "/export - Выгрузить месяц в CSV или XLSX (/export 2026-09 xlsx)\n"
+        "/find - Найти записи по комментарию (/find ветеринар)\n"
+        "/budget - Бюджеты по категориям (/budget Еда 30000)\n"
+        "/select_table - Выбрать таблицу для записи\n"
+        "/add_table - Подключить Google-таблицу (администратор)\n"
         "/help - Показать это сообщение\n\n"
         "🆕 Теперь вы можете выбрать, в какую Google Таблицу будут записываться ваши транзакции: свою личную или общую. Используйте /select_table!"
     )
     await send_user_message(update, welcome_message)
 
 
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
     help_message = (
         "📝 Доступные команды:\n\n"
         "/start - Начать работу с ботом\n"
-        "/stats - Показать статистику за месяц\n"
+        "/stats - Показать статистику за месяц (/stats chart — с графиком)\n"
         "/categories - Показать список категорий\n"
         "/delete - Удалить последнюю запись\n"
+        "/edit - Исправить последнюю запись (/edit 450, /edit категория Такси)\n"
+        "/export - Выгрузить месяц в CSV или XLSX (/export 2026-09 xlsx)\n"
+        "/find - Найти записи по комментарию (/find ветеринар)\n"
+        "/budget - Бюджеты по категориям (/budget Еда 30000)\n"
+        "/select_table - Выбрать таблицу для записи\n"
+        "/add_table - Подключить Google-таблицу (администратор)\n"
         "/help - Показать это сообщение\n\n"
         "Вы также можете:\n"
         "• Отправить голосовое сообщение\n"
         "• Отправить фото с QR-кодом\n"
+        "• Отправить CSV-выписку банка для импорта\n"
         "• Написать текст в формате: 'Доход/Расход Категория Сумма'"
     )
     await send_user_message(update, help_message)
@@ -192,40 +461,40 @@ async def process_transaction_text(
     context: ContextTypes.DEFAULT_TYPE
 ) -> int:
     transaction = speech_service.parse_transcription(text)
-    logger.info(f"Transaction: {transaction}")
+    logger.info("Transaction: %s", transaction)
 
-    if not transaction["amount"]:
+    if transaction is None:
         await send_user_message(update, "❌ Не удалось определить сумму.")
         return ConversationHandler.END
 
     context.user_data["transaction"] = transaction
     context.user_data["type"] = "text"
 
-    if not transaction["category"]:
-        keyboard = []
-        categories = (
-            category_service.get_categories("income")
-            if transaction["type"] == "Доход"
-            else category_service.get_categories("expense")
-        )
-        for category in categories:
-            keyboard.append([
-                InlineKeyboardButton(category, callback_data=f"category_{category}")
-            ])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await send_user_message(
-            update,
-            f"Вы сказали: {text}\n\n"
-            f"Тип: {transaction['type']}\n"
-            f"Сумма: {transaction['amount']} руб.\n\n"
-            "Выберите категорию:",
-            reply_markup=reply_markup,
-        )
-        return WAITING_CATEGORY
+    if not transaction.category:
+        return await ask_category(update, context, f"Вы сказали: {text}")
 
     return await confirm_transaction(update, context)
 
 
+async def ask_category(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, intro: str
+) -> int:
+    """Show category keyboard for the pending transaction."""
+    transaction = pending_transaction(context)
+    reply_markup = category_keyboards.keyboard(transaction.type.key)
+    await send_user_message(
+        update,
+        f"{intro}\n\n"
+        f"Тип: {transaction.type.value}\n"
+        f"Сумма: {format_rubles(transaction.amount)} руб.\n\n"
+        "Выберите категорию:",
+        reply_markup=reply_markup,
+    )
+    return WAITING_CATEGORY
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle voice messages."""
@@ -252,7 +521,7 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
                 "❌ Не удалось распознать голосовое сообщение. Попробуйте еще раз."
             )
             return ConversationHandler.END
-        logger.info(f"Transcribed text: {transcribed_text}")
+        logger.info("Transcribed text: %s", transcribed_text)
         context.user_data["type"] = "voice"
         # Используем общий обработчик
         return await process_transaction_text(transcribed_text, update, context)
@@ -266,6 +535,8 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         return ConversationHandler.END
 
 
+@timed(HANDLER_LATENCY)
+@trace_update
 async def handle_category_selection(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -281,13 +552,31 @@ async def handle_category_selection(
     query = update.callback_query
     await query.answer()
 
-    # Get selected category
-    category = query.data.replace("category_", "")
-    context.user_data["transaction"]["category"] = category
+    category = category_keyboards.decode(query.data)
+    if category is None:
+        # Кнопка со старой клавиатуры: категории изменились после отправки
+        transaction = pending_transaction(context)
+        await safe_edit_text(
+            query.message,
+            "Список категорий изменился. Выберите категорию ещё раз:",
+            reply_markup=category_keyboards.keyboard(transaction.type.key),
+        )
+        return WAITING_CATEGORY
+    pending_transaction(context).set_category(category)
 
     return await confirm_transaction(update, context)
 
 
+CONFIRM_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("✅ Да", callback_data="confirm_yes"),
+            InlineKeyboardButton("❌ Нет", callback_data="confirm_no"),
+        ]
+    ]
+)
+
+
 async def confirm_transaction(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -301,23 +590,10 @@ async def confirm_transaction(
             )
             return ConversationHandler.END
 
-    transaction = context.user_data["transaction"]
-
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ Да", callback_data="confirm_yes"),
-            InlineKeyboardButton("❌ Нет", callback_data="confirm_no"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    transaction = pending_transaction(context)
+    reply_markup = CONFIRM_KEYBOARD
 
-    message = (
-        f"Подтвердите транзакцию:\n\n"
-        f"Тип: {transaction['type']}\n"
-        f"Категория: {transaction['category']}\n"
-        f"Сумма: {transaction['amount']} руб.\n"
-        f"Комментарий: {transaction['comment']}"
-    )
+    message = "Подтвердите транзакцию:\n\n" + format_transaction(transaction)
 
     await send_or_edit_message(
         update,
@@ -327,6 +603,66 @@ async def confirm_transaction(
     return WAITING_CONFIRMATION
 
 
+def pending_transaction(context: ContextTypes.DEFAULT_TYPE) -> Transaction:
+    """Transaction awaiting a category or confirmation."""
+    transaction = context.user_data["transaction"]
+    if isinstance(transaction, dict):
+        # Сохранено в user_data версией бота со словарями
+        transaction = context.user_data["transaction"] = Transaction.from_dict(transaction)
+    return transaction
+
+
+def format_transaction(transaction: Transaction) -> str:
+    return (
+        f"Тип: {transaction.type.value}\n"
+        f"Категория: {transaction.category}\n"
+        f"Сумма: {format_rubles(transaction.amount)} руб.\n"
+        f"Комментарий: {transaction.comment}"
+    )
+
+
+def clear_pending_transaction(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop the confirmed transaction, keeping a pending receipt album if any."""
+    context.user_data.pop("transaction", None)
+    context.user_data.pop("type", None)
+
+
+def budget_alerts(spreadsheet_id: str, transactions: typing.List[Transaction]) -> str:
+    """
+    Budget warnings for just saved expenses, appended to the status message.
+
+    Uses the month aggregates, which the writer listener has already
+    updated, so the check is a couple of dict lookups per transaction.
+    """
+    added: typing.Dict[typing.Tuple[str, str], int] = {}
+    for transaction in transactions:
+        if transaction.type is not TransactionType.EXPENSE:
+            continue
+        sheet_name = sheets_service.get_sheet_name_for_date(transaction.date or datetime.now())
+        key = (sheet_name, transaction.category)
+        added[key] = added.get(key, 0) + transaction.amount
+
+    lines = []
+    for (sheet_name, category), amount in added.items():
+        month = summary_aggregates.peek(spreadsheet_id, sheet_name)
+        if month is None:
+            continue
+        spent = month.expense_by_category.get(category, 0)
+        thresholds = budget_service.crossed_thresholds(
+            spreadsheet_id, category, spent - amount, spent
+        )
+        if thresholds:
+            limit = budget_service.limit(spreadsheet_id, category)
+            icon = "🚨" if max(thresholds) >= 1 else "⚠️"
+            lines.append(
+                f"{icon} Бюджет «{category}»: {spent / 100:.0f} из {limit / 100:.0f} руб. "
+                f"({spent / limit:.0%})"
+            )
+    return "\n\n" + "\n".join(lines) if lines else ""
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
 async def handle_confirmation(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -342,36 +678,47 @@ async def handle_confirmation(
     query = update.callback_query
     await query.answer()
 
-    transaction = context.user_data["transaction"]
-    base_message = (
-        f"Транзакция:\n\n"
-        f"Тип: {transaction['type']}\n"
-        f"Категория: {transaction['category']}\n"
-        f"Сумма: {transaction['amount']} руб.\n"
-        f"Комментарий: {transaction['comment']}\n\n"
-    )
+    transaction = pending_transaction(context)
+    base_message = "Транзакция:\n\n" + format_transaction(transaction) + "\n\n"
 
     if query.data == "confirm_yes":
+        receipt_key = transaction.receipt_key
+        spreadsheet_id = None
         try:
             # Save transaction to Google Sheets
-            spreadsheet_id = get_spreadsheet_id_for_user(user_id)
-            sheets_service.add_transaction(
-                spreadsheet_id=spreadsheet_id,
-                transaction_type=transaction["type"],
-                category=transaction["category"],
-                amount=transaction["amount"],
-                source=context.user_data["type"],
-                comment=transaction["comment"],
+            spreadsheet_id = await get_spreadsheet_id_for_user(user_id)
+            if receipt_key and not receipt_index.reserve(spreadsheet_id, receipt_key):
+                await safe_edit_text(
+                    query.message,
+                    base_message + "❌ Статус: Этот чек уже сохранён в таблице.",
+                    reply_markup=None,
+                )
+                clear_pending_transaction(context)
+                return ConversationHandler.END
+
+            saved = await save_transactions(
+                spreadsheet_id, [transaction], context.user_data["type"], user_id
             )
+            if receipt_key:
+                receipt_index.commit(spreadsheet_id, receipt_key)
 
             await safe_edit_text(
                 query.message,
-                base_message + "✅ Статус: Транзакция успешно сохранена!",
+                base_message
+                + (
+                    "✅ Статус: Транзакция успешно сохранена!"
+                    + budget_alerts(spreadsheet_id, [transaction])
+                    if saved
+                    else "⏳ Статус: Google Таблицы недоступны. Транзакция сохранена "
+                    "и будет записана автоматически."
+                ),
                 reply_markup=None,
             )
 
         except Exception as e:
             logger.exception(e)
+            if receipt_key and spreadsheet_id:
+                receipt_index.release(spreadsheet_id, receipt_key)
             await safe_edit_text(
                 query.message,
                 base_message + "❌ Статус: Произошла ошибка при сохранении транзакции.",
@@ -385,17 +732,50 @@ async def handle_confirmation(
         )
 
     # Clear user data
-    context.user_data.clear()
+    clear_pending_transaction(context)
     return ConversationHandler.END
 
 
+STATS_CHART_ARGS = {"chart", "график"}
+
+
+async def send_stats_chart(update: Update, spreadsheet_id: str) -> None:
+    """
+    Reply with the chart of the current month.
+
+    The image is rendered and uploaded only when the month's aggregates
+    changed since the last chart; otherwise the cached file_id is re-sent.
+    """
+    sheet_name = sheets_service.get_current_sheet_name()
+    month = await summary_aggregates.get(spreadsheet_id, sheet_name)
+    caption = f"📊 {sheet_name}"
+    file_id = stats_charts.get(spreadsheet_id, sheet_name, month.version)
+    if file_id is not None:
+        await safe_reply_photo(update.message, file_id, caption=caption)
+        return
+
+    snapshot = month.snapshot()
+    photo = await asyncio.to_thread(render_stats_chart, sheet_name, snapshot)
+    message = await safe_reply_photo(update.message, photo, caption=caption)
+    if message is not None and message.photo:
+        stats_charts.put(spreadsheet_id, sheet_name, snapshot.version, message.photo[-1].file_id)
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send statistics when the command /stats is issued."""
     try:
         user_id = update.effective_user.id
-        spreadsheet_id = get_spreadsheet_id_for_user(user_id)
-        stats = sheets_service.get_monthly_statistics(spreadsheet_id)
+        spreadsheet_id = await get_spreadsheet_id_for_user(user_id)
+        if context.args and context.args[0].lower() in STATS_CHART_ARGS:
+            await send_stats_chart(update, spreadsheet_id)
+            return
+
+        stats = await asyncio.to_thread(
+            sheets_service.get_monthly_statistics, spreadsheet_id
+        )
 
         message = (
             f"📊 Статистика за текущий месяц:\n\n"
@@ -415,6 +795,8 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await send_user_message(update, "❌ Произошла ошибка при получении статистики.")
 
 
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def categories_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -425,20 +807,740 @@ async def categories_command(
     await send_user_message(update, "Категории...")
 
 
+# Удаление сдвигает строки листа, поэтому правки одной таблицы идут по очереди
+_row_change_locks: typing.Dict[str, asyncio.Lock] = {}
+
+EDIT_FIELDS = {"сумма": 3, "категория": 2, "комментарий": 5}
+EDIT_USAGE = (
+    "✏️ Исправление последней записи:\n"
+    "/edit 450 — новая сумма\n"
+    "/edit категория Такси\n"
+    "/edit комментарий обед с коллегами"
+)
+
+
+def format_row(values: typing.List) -> str:
+    """Короткое описание строки листа для ответа пользователю."""
+    date, transaction_type, category, amount, _, comment = (list(values) + [""] * 6)[:6]
+    text = f"{date} · {transaction_type} · {category} · {amount} руб."
+    return f"{text} · {comment}" if comment else text
+
+
+async def find_last_row(
+    user_id: int, spreadsheet_id: str
+) -> typing.Optional[typing.Tuple[RowRef, typing.Optional[typing.List]]]:
+    """
+    Last row the user added to the spreadsheet and its current values.
+
+    The remembered row number is checked against the ID column; if the
+    rows have moved, the row is looked up by the ID column only. Values are
+    None while the row is still waiting in the outbox.
+    """
+    while True:
+        ref = row_index.last(user_id, spreadsheet_id)
+        if ref is None:
+            return None
+        if ref.row is None:
+            return ref, None
+        values = await asyncio.to_thread(
+            sheets_service.get_row, spreadsheet_id, ref.sheet_name, ref.row
+        )
+        if values[ID_COLUMN_INDEX:ID_COLUMN_INDEX + 1] == [ref.transaction_id]:
+            return ref, values
+
+        row = await asyncio.to_thread(
+            sheets_service.find_row, spreadsheet_id, ref.sheet_name, ref.transaction_id
+        )
+        if row is not None:
+            row_index.set_row(ref, row)
+            values = await asyncio.to_thread(
+                sheets_service.get_row, spreadsheet_id, ref.sheet_name, row
+            )
+            return ref, values
+        # Строку удалили в самой таблице — забываем её и берём предыдущую
+        ref.row = None
+        row_index.remove_row(user_id, spreadsheet_id, ref)
+
+
+def summary_changed(spreadsheet_id: str) -> None:
+    """Обновить материализованный лист Summary после изменения строк."""
+    if SUMMARY_MODE == "materialized":
+        summary_materializer.mark_dirty(spreadsheet_id)
+
+
+def row_changed(
+    spreadsheet_id: str,
+    sheet_name: str,
+    old_values: typing.List,
+    new_values: typing.Optional[typing.List] = None,
+) -> None:
+    """Обновить итоги, поиск и Summary после удаления или правки строки."""
+    summary_aggregates.on_row_removed(spreadsheet_id, sheet_name, old_values)
+    search_index.remove(spreadsheet_id, old_values[ID_COLUMN_INDEX])
+    if new_values is not None:
+        rows = {sheet_name: [new_values]}
+        summary_aggregates.on_rows_written(spreadsheet_id, rows, {})
+        search_index.on_rows_written(spreadsheet_id, rows, {})
+    summary_changed(spreadsheet_id)
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Delete last transaction when the command /delete is issued."""
-    # TODO: Implement delete
-    await send_user_message(update, "🗑 Удаление последней записи...")
+    user_id = update.effective_user.id
+    try:
+        spreadsheet_id = await get_spreadsheet_id_for_user(user_id)
+        lock = _row_change_locks.setdefault(spreadsheet_id, asyncio.Lock())
+        async with lock:
+            found = await find_last_row(user_id, spreadsheet_id)
+            if found is None:
+                await send_user_message(update, "🤷 Нет недавних записей для удаления.")
+                return
+            ref, values = found
+            if values is None:
+                await send_user_message(
+                    update,
+                    "⏳ Последняя запись ещё не попала в таблицу. Попробуйте позже.",
+                )
+                return
+            await asyncio.to_thread(
+                sheets_service.delete_row, spreadsheet_id, ref.sheet_name, ref.row
+            )
+            row_index.remove_row(user_id, spreadsheet_id, ref)
+            if ref.receipt_key is not None:
+                # Строки чека больше нет — его снова можно сохранить
+                await asyncio.to_thread(receipt_index.remove, spreadsheet_id, ref.receipt_key)
+        row_changed(spreadsheet_id, ref.sheet_name, values)
+        await send_user_message(update, f"🗑 Запись удалена:\n{format_row(values)}")
+    except Exception as e:
+        logger.exception(e)
+        await send_user_message(update, "❌ Не удалось удалить запись.")
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_auth
+async def edit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Change amount, category or comment of the last transaction: /edit."""
+    args = context.args or []
+    if not args:
+        await send_user_message(update, EDIT_USAGE)
+        return
+    field = args[0].lower()
+    if field in EDIT_FIELDS:
+        value = " ".join(args[1:]).strip()
+    else:
+        field, value = "сумма", " ".join(args).strip()
+    if not value:
+        await send_user_message(update, EDIT_USAGE)
+        return
+
+    user_id = update.effective_user.id
+    try:
+        spreadsheet_id = await get_spreadsheet_id_for_user(user_id)
+        lock = _row_change_locks.setdefault(spreadsheet_id, asyncio.Lock())
+        async with lock:
+            found = await find_last_row(user_id, spreadsheet_id)
+            if found is None:
+                await send_user_message(update, "🤷 Нет недавних записей для исправления.")
+                return
+            ref, values = found
+            if values is None:
+                await send_user_message(
+                    update,
+                    "⏳ Последняя запись ещё не попала в таблицу. Попробуйте позже.",
+                )
+                return
+
+            new_values = (list(values) + [""] * len(SHEET_HEADERS))[: len(SHEET_HEADERS)]
+            if field == "сумма":
+                amount = to_kopecks(value)
+                if amount is None or amount <= 0:
+                    await send_user_message(update, "❌ Не понял сумму.")
+                    return
+                new_values[EDIT_FIELDS[field]] = kopecks_to_cell(amount)
+            elif field == "категория":
+                transaction_type = TransactionType.from_label(values[1]).key
+                categories = {
+                    category.lower(): category
+                    for category in category_service.get_categories(transaction_type)
+                }
+                if value.lower() not in categories:
+                    await send_user_message(
+                        update,
+                        "❌ Нет такой категории. Доступны: " + ", ".join(categories.values()),
+                    )
+                    return
+                new_values[EDIT_FIELDS[field]] = categories[value.lower()]
+            else:
+                new_values[EDIT_FIELDS[field]] = value
+
+            column_index = EDIT_FIELDS[field]
+            await asyncio.to_thread(
+                sheets_service.update_cell,
+                spreadsheet_id,
+                ref.sheet_name,
+                ref.row,
+                column_index,
+                new_values[column_index],
+            )
+        row_changed(spreadsheet_id, ref.sheet_name, values, new_values)
+        await send_user_message(update, f"✏️ Запись изменена:\n{format_row(new_values)}")
+    except Exception as e:
+        logger.exception(e)
+        await send_user_message(update, "❌ Не удалось изменить запись.")
+
+
+FIND_LIMIT = 10
+FIND_USAGE = (
+    "🔎 Поиск по комментариям:\n"
+    "/find ветеринар\n"
+    "/find такси категория:Транспорт месяц:2026-09 таблица:Общая"
+)
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_auth
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Search transaction comments: /find слова [категория:..] [месяц:ГГГГ-ММ] [таблица:..]."""
+    words, category, sheet_name, table = [], None, None, None
+    for arg in context.args or []:
+        key, _, value = arg.partition(":")
+        key = key.lower()
+        if value and key == "категория":
+            category = value
+        elif value and key == "месяц":
+            try:
+                month = datetime.strptime(value, "%Y-%m")
+            except ValueError:
+                await send_user_message(update, FIND_USAGE)
+                return
+            sheet_name = sheets_service.get_sheet_name_for_date(month)
+        elif value and key == "таблица":
+            table = value.lower()
+        else:
+            words.append(arg)
+    if not words:
+        await send_user_message(update, FIND_USAGE)
+        return
+
+    # Ищем только в таблицах, доступных пользователю
+    await load_sheet_choices()
+    titles = get_sheet_choices(update.effective_user.id)
+    spreadsheet_ids = {
+        spreadsheet_id
+        for spreadsheet_id, title in titles.items()
+        if table is None or title.lower().startswith(table)
+    }
+    started_at = time.perf_counter()
+    documents = search_index.search(
+        " ".join(words), spreadsheet_ids, category, sheet_name, FIND_LIMIT
+    )
+    logger.debug(
+        "/find %r: %s results in %.2f ms",
+        words,
+        len(documents),
+        (time.perf_counter() - started_at) * 1000,
+    )
+    if not documents:
+        await send_user_message(update, "🔎 Ничего не найдено.")
+        return
+
+    lines = [f"🔎 Найдено (последние {len(documents)}):"]
+    for document in documents:
+        amount = format_rubles(document.amount) if document.amount is not None else "?"
+        line = (
+            f"• {document.date[:10]} · {document.category} · {amount} руб. — {document.comment}"
+        )
+        if len(spreadsheet_ids) > 1:
+            line += f" ({titles.get(document.spreadsheet_id, '')})"
+        lines.append(line)
+    await send_user_message(update, "\n".join(lines))
+
+
+BUDGET_USAGE = (
+    "💰 Бюджеты расходов на месяц:\n"
+    "/budget — текущие лимиты\n"
+    "/budget Еда 30000 — установить лимит\n"
+    "/budget Еда 0 — убрать лимит"
+)
 
 
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def budget_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show or set monthly category budgets: /budget [категория сумма]."""
+    try:
+        spreadsheet_id = await get_spreadsheet_id_for_user(update.effective_user.id)
+        args = context.args or []
+        if args:
+            amount = to_kopecks(args[-1]) if len(args) > 1 else None
+            if amount is None or amount < 0:
+                await send_user_message(update, BUDGET_USAGE)
+                return
+            categories = {
+                category.lower(): category
+                for category in category_service.get_categories("expense")
+            }
+            category = categories.get(" ".join(args[:-1]).lower())
+            if category is None:
+                await send_user_message(
+                    update,
+                    "❌ Нет такой категории. Доступны: " + ", ".join(categories.values()),
+                )
+                return
+            budget_service.set_limit(spreadsheet_id, category, amount)
+            await send_user_message(
+                update,
+                f"💰 Бюджет «{category}»: {amount / 100:.0f} руб. в месяц"
+                if amount
+                else f"💰 Бюджет «{category}» убран",
+            )
+            return
+
+        limits = budget_service.limits(spreadsheet_id)
+        if not limits:
+            await send_user_message(update, "Бюджеты не заданы.\n\n" + BUDGET_USAGE)
+            return
+        sheet_name = sheets_service.get_sheet_name_for_date(datetime.now())
+        month = await summary_aggregates.get(spreadsheet_id, sheet_name)
+        lines = [f"💰 Бюджеты на {sheet_name}:"]
+        for category, limit in sorted(limits.items()):
+            spent = month.expense_by_category.get(category, 0)
+            icon = "🚨" if spent >= limit else "⚠️" if spent >= 0.8 * limit else "•"
+            lines.append(
+                f"{icon} {category}: {spent / 100:.0f} из {limit / 100:.0f} руб. "
+                f"({spent / limit:.0%})"
+            )
+        await send_user_message(update, "\n".join(lines))
+    except Exception as e:
+        logger.exception(e)
+        await send_user_message(update, "❌ Не удалось получить бюджеты.")
+
+
+EXPORT_MAX_MONTHS = 24
+EXPORT_USAGE = (
+    "📤 Выгрузка в файл:\n"
+    "/export — текущий месяц в CSV\n"
+    "/export 2026-09 xlsx — один месяц\n"
+    "/export 2026-01 2026-06 csv — несколько месяцев"
+)
+
+
+def parse_export_args(
+    args: typing.List[str],
+) -> typing.Optional[typing.Tuple[typing.List[datetime], str]]:
+    """Месяцы и формат из аргументов /export, None если их не удалось разобрать."""
+    export_format = "csv"
+    bounds = []
+    for arg in args:
+        if arg.lower() in EXPORT_FORMATS:
+            export_format = arg.lower()
+            continue
+        for month_format in ("%Y-%m", "%m.%Y"):
+            try:
+                bounds.append(datetime.strptime(arg, month_format))
+                break
+            except ValueError:
+                pass
+        else:
+            return None
+    if len(bounds) > 2:
+        return None
+    if not bounds:
+        bounds = [datetime.now().replace(day=1)]
+
+    first, last = min(bounds), max(bounds)
+    months = []
+    month = first
+    while month <= last and len(months) <= EXPORT_MAX_MONTHS:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    if len(months) > EXPORT_MAX_MONTHS:
+        return None
+    return months, export_format
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_auth
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Export month sheets to a CSV or XLSX file: /export [месяц [месяц]] [csv|xlsx]."""
+    parsed = parse_export_args(context.args or [])
+    if parsed is None:
+        await send_user_message(update, EXPORT_USAGE)
+        return
+    months, export_format = parsed
+    spreadsheet_id = await get_spreadsheet_id_for_user(update.effective_user.id)
+    status = await send_user_message(
+        update, "📤 Готовлю выгрузку...", priority=PRIORITY_INFO
+    )
+    # Выгрузка может идти долго, остальные сообщения пользователя не ждут её
+    context.application.create_task(
+        run_export(update, spreadsheet_id, months, export_format, status), update=update
+    )
+
+
+async def run_export(
+    update: Update,
+    spreadsheet_id: str,
+    months: typing.List[datetime],
+    export_format: str,
+    status,
+) -> None:
+    """Write the export file in the background and send it as a document."""
+    sheet_names = [sheets_service.get_sheet_name_for_date(month) for month in months]
+
+    async def report_progress(exported: int) -> None:
+        if status is not None:
+            await safe_edit_text(
+                status, f"📤 Выгружено строк: {exported}", priority=PRIORITY_INFO
+            )
+
+    path = None
+    try:
+        path = await export_service.export(
+            spreadsheet_id, sheet_names, export_format, report_progress
+        )
+        if path is None:
+            await send_user_message(update, "🤷 За выбранные месяцы записей нет.")
+            return
+        period = months[0].strftime("%Y-%m")
+        if len(months) > 1:
+            period += "_" + months[-1].strftime("%Y-%m")
+        with open(path, "rb") as document:
+            await safe_reply_document(
+                update.message,
+                document,
+                filename=f"transactions_{period}.{export_format}",
+                caption="📤 " + ", ".join(sheet_names),
+            )
+    except Exception as e:
+        logger.exception(e)
+        await send_user_message(update, "❌ Не удалось выгрузить данные.")
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_auth
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle photos with QR codes."""
-    # TODO: Implement QR code handling
-    await send_user_message(update, "📷 Обрабатываю фото с QR-кодом...")
+    if update.message.media_group_id:
+        # Альбом обрабатывается целиком после сбора всех фото
+        if media_groups.add(update.message):
+            await send_user_message(
+                update, "📷 Обрабатываю альбом с чеками...", priority=PRIORITY_INFO
+            )
+            context.application.create_task(
+                process_receipt_album(update, context), update=update
+            )
+        return ConversationHandler.END
+
+    await send_user_message(
+        update, "📷 Обрабатываю фото с QR-кодом...", priority=PRIORITY_INFO
+    )
+    try:
+        result = await qr_service.decode_photo(update.message.photo)
+    except Exception as e:
+        logger.exception(e)
+        await send_user_message(update, "❌ Произошла ошибка при обработке фото.")
+        return ConversationHandler.END
+
+    if not result.data:
+        await send_user_message(
+            update,
+            "❌ Не удалось найти QR-код на фото. Попробуйте сфотографировать чек ближе.",
+        )
+        return ConversationHandler.END
+
+    transaction = qr_service.parse_qr_data(result.data)
+    if not transaction:
+        await send_user_message(update, "❌ Этот QR-код не похож на кассовый чек.")
+        return ConversationHandler.END
+
+    # Дубликаты отсекаем до любых запросов к Google Sheets
+    spreadsheet_id = await get_spreadsheet_id_for_user(update.effective_user.id)
+    if receipt_index.contains(spreadsheet_id, transaction.receipt_key):
+        await send_user_message(update, "⚠️ Этот чек уже сохранён в таблице.")
+        return ConversationHandler.END
+
+    context.user_data["transaction"] = transaction
+    context.user_data["type"] = "qr"
+    return await ask_category(
+        update,
+        context,
+        f"🧾 Чек от {transaction.date.strftime('%d.%m.%Y %H:%M')}",
+    )
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+async def process_receipt_album(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Decode all receipts of an album in parallel and ask for one confirmation."""
+    messages = await media_groups.collect(update.message.media_group_id)
+    spreadsheet_id = await get_spreadsheet_id_for_user(update.effective_user.id)
+
+    results = await asyncio.gather(
+        *(qr_service.decode_photo(message.photo) for message in messages),
+        return_exceptions=True,
+    )
+
+    transactions = []
+    seen_keys = set()
+    failed = duplicates = 0
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Failed to decode album photo: %s", result)
+            failed += 1
+            continue
+        transaction = qr_service.parse_qr_data(result.data) if result.data else None
+        if not transaction:
+            failed += 1
+            continue
+        receipt_key = transaction.receipt_key
+        if receipt_key in seen_keys or receipt_index.contains(spreadsheet_id, receipt_key):
+            duplicates += 1
+            continue
+        seen_keys.add(receipt_key)
+        transactions.append(transaction)
+
+    if not transactions:
+        await send_user_message(
+            update,
+            f"❌ В альбоме не найдено новых чеков.\n"
+            f"Не распознано: {failed}, уже сохранено: {duplicates}",
+        )
+        return
+
+    context.user_data["album"] = transactions
+    lines = [
+        f"• {t.date.strftime('%d.%m %H:%M')} — {t.type.value} {format_rubles(t.amount)} руб."
+        for t in transactions
+    ]
+    pending_type = album_pending_type(transactions)
+    await send_user_message(
+        update,
+        f"🧾 Чеков в альбоме: {len(transactions)}\n\n"
+        + "\n".join(lines)
+        + f"\n\nИтого: {album_totals(transactions)}\n"
+        f"Не распознано: {failed}, уже сохранено: {duplicates}\n\n"
+        + album_category_prompt(transactions, pending_type),
+        reply_markup=category_keyboards.album_keyboard(pending_type.key),
+    )
+
+
+def album_pending_type(transactions) -> typing.Optional[TransactionType]:
+    """Type of album receipts still without a category: expenses first, then income."""
+    for transaction_type in (TransactionType.EXPENSE, TransactionType.INCOME):
+        if any(t.type is transaction_type and t.category is None for t in transactions):
+            return transaction_type
+    return None
+
+
+def album_totals(transactions) -> str:
+    """Album sums per type: income receipts (refunds) are not added to expenses."""
+    parts = []
+    for transaction_type, label in (
+        (TransactionType.EXPENSE, "расходы"),
+        (TransactionType.INCOME, "доходы"),
+    ):
+        amount = sum(t.amount for t in transactions if t.type is transaction_type)
+        if amount:
+            parts.append(f"{label} {format_rubles(amount)} руб.")
+    return ", ".join(parts)
+
+
+def album_category_prompt(transactions, transaction_type: TransactionType) -> str:
+    count = sum(1 for t in transactions if t.type is transaction_type)
+    if all(t.type is transaction_type for t in transactions):
+        return "Выберите категорию, чтобы сохранить все чеки:"
+    if transaction_type is TransactionType.INCOME:
+        return f"Выберите категорию для чеков возврата прихода ({count}):"
+    return f"Выберите категорию для чеков расхода ({count}):"
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+async def album_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Save or cancel all receipts of a pending album."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if not is_user_allowed(user_id):
+        await query.answer("❌ У вас нет доступа к этому боту.", show_alert=True)
+        return
+
+    transactions = context.user_data.get("album")
+    await query.answer()
+    if transactions:
+        transactions = [
+            Transaction.from_dict(t) if isinstance(t, dict) else t for t in transactions
+        ]
+    if not transactions:
+        await safe_edit_text(query.message, "❌ Альбом уже обработан.", reply_markup=None)
+        return
+    if query.data == ALBUM_CANCEL:
+        context.user_data.pop("album", None)
+        await safe_edit_text(query.message, "❌ Сохранение чеков отменено.", reply_markup=None)
+        return
+
+    # Расходы и возвраты прихода получают категории своего типа, по очереди
+    pending_type = album_pending_type(transactions)
+    category = category_keyboards.decode(query.data)
+    if category is None or category not in category_service.get_categories(pending_type.key):
+        await safe_edit_text(
+            query.message,
+            "Список категорий изменился. "
+            + album_category_prompt(transactions, pending_type),
+            reply_markup=category_keyboards.album_keyboard(pending_type.key),
+        )
+        return
+    for transaction in transactions:
+        if transaction.type is pending_type:
+            transaction.set_category(category)
+    next_type = album_pending_type(transactions)
+    if next_type is not None:
+        context.user_data["album"] = transactions
+        await safe_edit_text(
+            query.message,
+            f"Категория «{category}» выбрана. "
+            + album_category_prompt(transactions, next_type),
+            reply_markup=category_keyboards.album_keyboard(next_type.key),
+        )
+        return
+    context.user_data.pop("album", None)
+
+    spreadsheet_id = await get_spreadsheet_id_for_user(user_id)
+    reserved = [
+        t for t in transactions
+        if receipt_index.reserve(spreadsheet_id, t.receipt_key)
+    ]
+    try:
+        saved = await save_transactions(spreadsheet_id, reserved, "qr", user_id)
+    except Exception as e:
+        logger.exception(e)
+        for transaction in reserved:
+            receipt_index.release(spreadsheet_id, transaction.receipt_key)
+        await safe_edit_text(
+            query.message,
+            "❌ Статус: Произошла ошибка при сохранении чеков.",
+            reply_markup=None,
+        )
+        return
+
+    for transaction in reserved:
+        receipt_index.commit(spreadsheet_id, transaction.receipt_key)
+    status = (
+        "✅ Статус: Сохранено"
+        if saved
+        else "⏳ Статус: Google Таблицы недоступны, будет записано автоматически"
+    )
+    categories = ", ".join(dict.fromkeys(t.category for t in reserved))
+    await safe_edit_text(
+        query.message,
+        f"{status} чеков: {len(reserved)}, {album_totals(reserved) or '0 руб.'} "
+        f"(категория: {categories})"
+        + (budget_alerts(spreadsheet_id, reserved) if saved else ""),
+        reply_markup=None,
+    )
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_auth
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Import a bank statement CSV sent as a document."""
+    user_id = update.effective_user.id
+    progress_message = await send_user_message(
+        update, "📥 Загружаю выписку...", priority=PRIORITY_INFO
+    )
+    last_progress_at = time.monotonic()
+
+    async def report_progress(text: str, force: bool = False) -> None:
+        nonlocal last_progress_at
+        now = time.monotonic()
+        if progress_message is None:
+            return
+        if not force and now - last_progress_at < IMPORT_PROGRESS_INTERVAL_SECONDS:
+            return
+        last_progress_at = now
+        await safe_edit_text(
+            progress_message,
+            text,
+            priority=PRIORITY_CONFIRMATION if force else PRIORITY_INFO,
+        )
+
+    temp_filename = None
+    try:
+        document = await update.message.document.get_file()
+        with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as temp_file:
+            temp_filename = temp_file.name
+        await document.download_to_drive(temp_filename)
+
+        spreadsheet_id = await get_spreadsheet_id_for_user(user_id)
+        result = ImportResult()
+        for index, parsed in enumerate(import_service.iter_statement(temp_filename), 1):
+            if parsed is None:
+                result.skipped += 1
+            else:
+                date, row = parsed
+                sheet_name = sheets_service.get_sheet_name_for_date(date)
+                result.rows_by_sheet.setdefault(sheet_name, []).append(row)
+                result.imported += 1
+            if index % IMPORT_PARSE_CHUNK_SIZE == 0:
+                await report_progress(f"📥 Разобрано строк: {index}")
+                # Отдаём управление другим обработчикам
+                await asyncio.sleep(0)
+
+        total_sheets = len(result.rows_by_sheet)
+        queued = 0
+        for number, (sheet_name, rows) in enumerate(result.rows_by_sheet.items(), 1):
+            await report_progress(
+                f"📤 Записываю {sheet_name} ({number}/{total_sheets}), строк: {len(rows)}"
+            )
+            # Id строк выписки постоянны: повторный импорт не дублирует записи
+            try:
+                existing_ids = await asyncio.to_thread(
+                    sheets_service.get_row_ids, spreadsheet_id, sheet_name
+                )
+            except Exception:
+                # Таблица недоступна: строки уйдут в outbox, он сверит id при записи
+                logger.warning("Failed to read ids of %s", sheet_name, exc_info=True)
+                existing_ids = set()
+            new_rows = [row for row in rows if row[ID_COLUMN_INDEX] not in existing_ids]
+            result.duplicates += len(rows) - len(new_rows)
+            if new_rows and not await save_rows(spreadsheet_id, {sheet_name: new_rows}):
+                queued += len(new_rows)
+
+        await report_progress(
+            f"✅ Импорт завершён.\n\n"
+            f"Записано операций: {result.imported - result.duplicates - queued}\n"
+            + (f"Ожидают записи (таблица недоступна): {queued}\n" if queued else "")
+            + (f"Уже были в таблице: {result.duplicates}\n" if result.duplicates else "")
+            + f"Пропущено строк: {result.skipped}\n"
+            f"Листов: {total_sheets}",
+            force=True,
+        )
+    except ValueError as e:
+        await report_progress(f"❌ Не удалось разобрать выписку: {e}", force=True)
+    except Exception as e:
+        logger.exception(e)
+        await report_progress("❌ Произошла ошибка при импорте выписки.", force=True)
+    finally:
+        if temp_filename and os.path.exists(temp_filename):
+            os.unlink(temp_filename)
 
 
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle text messages."""
@@ -447,29 +1549,88 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 
 
+@timed(HANDLER_LATENCY)
+@trace_update
 @require_auth
 async def select_table_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    sheet_choices = get_sheet_choices()
     user = get_user_entry(user_id)
-    current = user["selected_sheet"] if user else None
-    keyboard = []
-    for name in sheet_choices:
-        text = f"{'✅ ' if name == current else ''}{name}"
-        keyboard.append([
-            InlineKeyboardButton(text, callback_data=f"select_table_{name}")
-        ])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    current = user.get("selected_spreadsheet_id") if user else None
+    await load_sheet_choices()
+    reply_markup = get_table_keyboards(user_id).keyboard(current)
     await send_user_message(
         update,
         "В какую таблицу будем записывать транзакции?",
         reply_markup=reply_markup
     )
 
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_admin
+async def add_table_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Register a spreadsheet for a user: /add_table <ссылка или id> [user_id].
+
+    Admin only: the service account can open the tables of every household,
+    so knowing an id must not be enough to write to a table or read it
+    through /export and /find.
+    """
+    args = list(context.args or [])
+    user_id = update.effective_user.id
+    if len(args) > 1 and args[-1].isdigit():
+        user_id = int(args.pop())
+    spreadsheet_id = parse_spreadsheet_id(" ".join(args)) if args else None
+    if not spreadsheet_id:
+        await send_user_message(
+            update,
+            "Использование: /add_table <ссылка на Google-таблицу или её id> [user_id]\n\n"
+            "Без user_id таблица добавляется вам. Перед этим откройте доступ к "
+            "таблице на редактирование для "
+            f"{sheets_service.credentials.service_account_email}",
+        )
+        return
+    if not is_user_allowed(user_id):
+        await send_user_message(update, f"❌ Пользователь {user_id} не найден в списке доступа.")
+        return
+
+    sheets = await asyncio.to_thread(sheets_service.get_available_sheets, [spreadsheet_id])
+    if not sheets:
+        await send_user_message(
+            update,
+            "❌ Не удалось открыть таблицу. Проверьте ссылку и доступ для "
+            f"{sheets_service.credentials.service_account_email}",
+        )
+        return
+
+    title = sheets[0][0]
+    spreadsheet_registry.register(spreadsheet_id, title, user_id)
+    await asyncio.to_thread(
+        sheets_service.ensure_summary_sheet,
+        spreadsheet_id,
+        SUMMARY_MODE == "materialized",
+    )
+    summary_changed(spreadsheet_id)
+    users = load_allowed_users()
+    for user in users:
+        if user["user_id"] == user_id:
+            user.pop("selected_sheet", None)
+            user["selected_spreadsheet_id"] = spreadsheet_id
+    save_allowed_users(users)
+    if user_id == update.effective_user.id:
+        text = f"✅ Таблица «{title}» добавлена. Новые транзакции будут записываться в неё."
+    else:
+        text = (
+            f"✅ Таблица «{title}» добавлена пользователю {user_id}. "
+            "Его новые транзакции будут записываться в неё."
+        )
+    await send_user_message(update, text)
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
 async def select_table_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     user_id = query.from_user.id
-    sheet_choices = get_sheet_choices()
     users = load_allowed_users()
     user = None
     for u in users:
@@ -479,61 +1640,352 @@ async def select_table_callback(update: Update, context: ContextTypes.DEFAULT_TY
     if not user:
         await query.answer("Нет доступа", show_alert=True)
         return
-    # Получаем выбранное имя таблицы
-    sheet_name = query.data.replace("select_table_", "")
-    if sheet_name not in sheet_choices:
-        await query.answer("Ошибка выбора", show_alert=True)
+    await load_sheet_choices()
+    keyboards = get_table_keyboards(user_id)
+    spreadsheet_id = keyboards.decode(query.data)
+    if spreadsheet_id is None:
+        # Клавиатура устарела: список таблиц изменился после её отправки
+        await query.answer()
+        await safe_edit_text(
+            query.message,
+            "Список таблиц изменился. Выберите таблицу ещё раз:",
+            reply_markup=keyboards.keyboard(user.get("selected_spreadsheet_id")),
+        )
         return
-    user["selected_sheet"] = sheet_name
+    user.pop("selected_sheet", None)
+    user["selected_spreadsheet_id"] = spreadsheet_id
     save_allowed_users(users)
     await query.answer()
     await safe_edit_text(
         query.message,
-        f"Готово. Все новые транзакции будут записываться в таблицу: {sheet_name}",
+        "Готово. Все новые транзакции будут записываться в таблицу: "
+        f"{keyboards.label(spreadsheet_id)}",
+    )
+
+
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_admin
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Включает профилирование каждого N-го обновления: /profile N или /profile off."""
+    argument = context.args[0] if context.args else ""
+    if argument in ("off", "0"):
+        profiler.configure(0)
+        await send_user_message(update, "Профилирование выключено.")
+        return
+    if not argument.isdigit():
+        state = (
+            f"каждое {profiler.sample_every}-е обновление"
+            if profiler.sample_every
+            else "выключено"
+        )
+        await send_user_message(
+            update,
+            f"Профилирование: {state}.\n"
+            "Использование: /profile N — профилировать каждое N-е обновление, "
+            "/profile off — выключить.",
+        )
+        return
+    profiler.configure(int(argument))
+    await send_user_message(
+        update,
+        f"Профилирование включено: каждое {profiler.sample_every}-е обновление, "
+        "результаты пишутся в лог.",
     )
 
 
-def build_application() -> Application:
-    """Create and configure the Telegram application."""
-    request = HTTPXRequest(
-        connect_timeout=10.0,
-        read_timeout=30.0,
-        write_timeout=30.0,
-        pool_timeout=10.0,
+@timed(HANDLER_LATENCY)
+@trace_update
+@require_admin
+async def outbox_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает очередь транзакций, ожидающих записи: /outbox [replay]."""
+    replay = bool(context.args) and context.args[0] == "replay"
+    if replay:
+        # Повторяем сразу всё, включая строки, исчерпавшие попытки
+        await asyncio.to_thread(outbox.retry_all)
+        outbox_replayer.wake()
+    counts, dead, oldest = await asyncio.to_thread(outbox.summary)
+    if not counts and not dead:
+        await send_user_message(update, "✅ Очередь записи пуста.")
+        return
+    await load_sheet_choices()
+    titles = get_sheet_choices()
+    lines = [
+        f"• {titles.get(spreadsheet_id, spreadsheet_id)}: {counts.get(spreadsheet_id, 0)}"
+        + (f" (не записываются: {dead[spreadsheet_id]})" if spreadsheet_id in dead else "")
+        for spreadsheet_id in sorted(counts.keys() | dead.keys())
+    ]
+    header = f"⏳ Ожидают записи в Google Таблицы: {sum(counts.values())}\n"
+    if oldest is not None:
+        header += f"Самая старая: {(time.time() - oldest) / 60:.0f} мин. назад\n"
+    if dead:
+        header += (
+            f"❌ Не удалось записать после {outbox.max_attempts} попыток: {sum(dead.values())}"
+            " — проверьте доступ к таблице и повторите /outbox replay\n"
+        )
+    if replay:
+        lines.append("\nЗапущена повторная запись.")
+    await send_user_message(update, header + "\n" + "\n".join(lines))
+
+
+# (spreadsheet_id, лист месяца), уже подготовленные задачей смены месяца
+_prepared_month_sheets: typing.Set[typing.Tuple[str, str]] = set()
+
+
+async def prepare_month_sheets(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Create the current and, close to the month end, the next month sheet in
+    every table so the first transaction of a month doesn't wait for it.
+    """
+    now = datetime.now()
+    months = [now]
+    next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1)
+    if next_month - now <= timedelta(days=MONTH_ROLLOVER_DAYS_AHEAD):
+        months.append(next_month)
+
+    await load_sheet_choices()
+    for month in months:
+        sheet_name = sheets_service.get_sheet_name_for_date(month)
+        for spreadsheet_id in all_spreadsheet_ids():
+            if (spreadsheet_id, sheet_name) in _prepared_month_sheets:
+                continue
+            try:
+                await asyncio.to_thread(
+                    sheets_service.prepare_month_sheet,
+                    spreadsheet_id,
+                    sheet_name,
+                    SUMMARY_MODE == "materialized",
+                )
+            except Exception:
+                logger.warning(
+                    "Failed to prepare sheet %s in %s", sheet_name, spreadsheet_id, exc_info=True
+                )
+                continue
+            _prepared_month_sheets.add((spreadsheet_id, sheet_name))
+            logger.info("Prepared sheet %s in %s", sheet_name, spreadsheet_id)
+    # После смены месяца агрегаты нового листа нужны для проверки бюджетов
+    await load_current_month(all_spreadsheet_ids())
+
+
+async def load_current_month(spreadsheet_ids: typing.Iterable[str]) -> None:
+    """Load aggregates of the current month so budget checks don't wait for Sheets."""
+    sheet_name = sheets_service.get_sheet_name_for_date(datetime.now())
+    for spreadsheet_id in spreadsheet_ids:
+        if summary_aggregates.peek(spreadsheet_id, sheet_name) is not None:
+            continue
+        try:
+            await sheets_read_limiter.acquire()
+            await summary_aggregates.get(spreadsheet_id, sheet_name)
+        except Exception:
+            logger.warning(
+                "Failed to load %s of %s", sheet_name, spreadsheet_id, exc_info=True
+            )
+
+
+async def prepare_summary_sheets(spreadsheet_ids: typing.Iterable[str]) -> None:
+    """Check the Summary sheets of all tables in parallel threads."""
+    spreadsheet_ids = list(spreadsheet_ids)
+    results = await asyncio.gather(
+        *(
+            asyncio.to_thread(
+                sheets_service.ensure_summary_sheet,
+                spreadsheet_id,
+                materialized=SUMMARY_MODE == "materialized",
+            )
+            for spreadsheet_id in spreadsheet_ids
+        ),
+        return_exceptions=True,
+    )
+    for spreadsheet_id, result in zip(spreadsheet_ids, results):
+        if isinstance(result, Exception):
+            logger.warning(
+                "Failed to prepare Summary in %s", spreadsheet_id, exc_info=result
+            )
+        elif SUMMARY_MODE == "materialized":
+            summary_materializer.mark_dirty(spreadsheet_id)
+
+
+async def warm_up() -> None:
+    """
+    Background startup work, so polling starts without waiting for Sheets:
+    the API client and table titles, Summary sheets, month aggregates and
+    the search index.
+    """
+    started_at = time.perf_counter()
+    await load_sheet_choices()
+    spreadsheet_ids = all_spreadsheet_ids()
+    await prepare_summary_sheets(spreadsheet_ids)
+    await load_current_month(spreadsheet_ids)
+    logger.info("Sheets warm-up done in %.1f s", time.perf_counter() - started_at)
+    await search_index.build(spreadsheet_ids, sheets_read_limiter)
+
+
+# Загрузка агрегатов и поискового индекса после запуска
+_warm_up_task: typing.Optional[asyncio.Task] = None
+
+
+async def post_init(application: Application) -> None:
+    """Start background services once the event loop is running."""
+    outbound_scheduler.start()
+    outbox_replayer.start()
+    if SUMMARY_MODE == "materialized":
+        summary_materializer.start()
+    global _warm_up_task
+    _warm_up_task = asyncio.create_task(warm_up())
+    for server in http_servers:
+        await server.start()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Release resources owned by services."""
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+    await outbound_scheduler.stop()
+    await outbox_replayer.stop()
+    await summary_materializer.stop()
+    await sheets_writer.stop()
+    outbox.close()
+    await asyncio.to_thread(row_index.flush)
+    for server in http_servers:
+        await server.stop()
+    qr_service.shutdown()
+
+
+def build_application(
+    token: typing.Optional[str] = None,
+    request: typing.Optional[BaseRequest] = None,
+    persistence_file: str = PERSISTENCE_FILE,
+) -> Application:
+    """
+    Create the services and the configured Telegram application.
+
+    The arguments let tools run the real handlers against a fake Bot API;
+    a given request also serves getUpdates.
+    """
+    init_services()
+    builder = Application.builder()
+    if request is None:
+        request = TrackedHTTPXRequest(
+            connect_timeout=10.0,
+            read_timeout=30.0,
+            write_timeout=30.0,
+            pool_timeout=10.0,
+        )
+        # Отдельный клиент для getUpdates, как у PTB по умолчанию, но с учётом в HEALTH
+        builder.get_updates_request(TrackedHTTPXRequest())
+    else:
+        builder.get_updates_request(request)
+    application = (
+        builder.token(token or TELEGRAM_BOT_TOKEN)
+        .request(request)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .persistence(SQLitePersistence(persistence_file, PERSISTENCE_UPDATE_INTERVAL))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
     )
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).request(request).build()
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(
+            prepare_month_sheets, interval=MONTH_ROLLOVER_CHECK_INTERVAL, first=10
+        )
+    else:
+        logger.warning("JobQueue is unavailable, month sheets will be created on first write")
 
     voice_and_txt_handler = ConversationHandler(
         entry_points=[
             MessageHandler(filters.VOICE, handle_voice),
             MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text),
+            MessageHandler(filters.PHOTO, handle_photo),
         ],
         states={
             WAITING_CATEGORY: [
-                CallbackQueryHandler(handle_category_selection, pattern="^category_")
+                CallbackQueryHandler(
+                    handle_category_selection, pattern=f"^{CATEGORY_PREFIX}:"
+                )
             ],
             WAITING_CONFIRMATION: [
                 CallbackQueryHandler(handle_confirmation, pattern="^confirm_")
             ],
         },
         fallbacks=[],
+        name="transactions",
+        persistent=True,
     )
 
+    # Группа -1 срабатывает раньше всех обработчиков
+    application.add_handler(TypeHandler(Update, update_latency.handle_update), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(CommandHandler("categories", categories_command))
     application.add_handler(CommandHandler("delete", delete_command))
+    application.add_handler(CommandHandler("edit", edit_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("find", find_command))
+    application.add_handler(CommandHandler("budget", budget_command))
     application.add_handler(voice_and_txt_handler)
-    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+    application.add_handler(
+        MessageHandler(filters.Document.FileExtension("csv"), handle_document)
+    )
     application.add_handler(CommandHandler("select_table", select_table_command))
-    application.add_handler(CallbackQueryHandler(select_table_callback, pattern="^select_table_"))
+    application.add_handler(CommandHandler("add_table", add_table_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("outbox", outbox_command))
+    application.add_handler(CallbackQueryHandler(select_table_callback, pattern=f"^{TABLE_PREFIX}:"))
+    application.add_handler(CallbackQueryHandler(album_callback, pattern=f"^{ALBUM_PREFIX}:"))
     application.add_error_handler(error_handler)
+    register_queue_gauges(application)
     return application
 
 
+def register_queue_gauges(application: Application) -> None:
+    """Expose queue depths of the application and services as metrics and in /health."""
+    HEALTH.add_queue("update_queue", application.update_queue.qsize)
+    HEALTH.add_queue("user_queued_updates", lambda: application.update_processor.queued_updates)
+    HEALTH.add_queue("outbound_queue", lambda: outbound_scheduler.queue_size)
+    HEALTH.add_queue("sheets_writer_queue", lambda: sheets_writer.queue_size)
+    HEALTH.add_queue("outbox_rows", lambda: outbox.size)
+    HEALTH.add_queue("persistence_pending_writes", lambda: application.persistence.pending_writes)
+    REGISTRY.gauge(
+        "bot_update_queue_size",
+        "Updates received but not yet picked up",
+        application.update_queue.qsize,
+    )
+    REGISTRY.gauge(
+        "bot_user_queued_updates",
+        "Updates waiting for or holding a per-user lock",
+        lambda: application.update_processor.queued_updates,
+    )
+    REGISTRY.gauge(
+        "bot_outbound_queue_size",
+        "Telegram sends waiting for rate budget",
+        lambda: outbound_scheduler.queue_size,
+    )
+    REGISTRY.gauge(
+        "bot_sheets_writer_queue_size",
+        "Sheets writes waiting for a writer worker",
+        lambda: sheets_writer.queue_size,
+    )
+    REGISTRY.gauge(
+        "bot_outbox_rows",
+        "Rows waiting in the outbox for Sheets to become available",
+        lambda: outbox.size,
+    )
+    REGISTRY.gauge(
+        "bot_persistence_pending_writes",
+        "Changed persistence entries not yet written",
+        lambda: application.persistence.pending_writes,
+    )
+    REGISTRY.gauge(
+        "bot_persistence_last_flush_seconds",
+        "Duration of the last persistence write",
+        lambda: application.persistence.last_flush_ms / 1000,
+    )
+
+
 def main() -> None:
     """Start the bot."""
+    setup_logging()
     warnings.filterwarnings(
         "ignore",
         message=r"If 'per_message=False'.*",
@@ -541,22 +1993,61 @@ def main() -> None:
     )
     force_ipv4_for_telegram()
 
-    users = load_allowed_users()
-    sheet_choices = get_sheet_choices()
-
-    for user in users:
-        user["selected_sheet"] = next(iter(sheet_choices.keys()))
-
-    save_allowed_users(users)
-    for spreadsheet_id in sheet_choices.values():
-        sheets_service.ensure_summary_sheet(spreadsheet_id)
+    if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET_TOKEN):
+        # Без секрета любой, кто знает адрес, может прислать поддельное обновление
+        # от имени разрешённого пользователя
+        raise SystemExit("BOT_MODE=webhook requires WEBHOOK_URL and WEBHOOK_SECRET_TOKEN")
 
+    # Обращения к Google Sheets (названия таблиц, листы Summary) идут в фоне
+    # после запуска, см. warm_up(); выбор таблицы пользователя проверяется
+    # при обращении в get_spreadsheet_id_for_user
     application = build_application()
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+        return
+
+    # В режиме polling /health следит, что getUpdates проходит
+    HEALTH.polling = True
     application.run_polling(
         allowed_updates=Update.ALL_TYPES,
         bootstrap_retries=-1,
     )
 
 
+async def run_webhook(application: Application) -> None:
+    """Serve updates through the embedded webhook server until stopped."""
+    from services.webhook_server import WebhookServer
+
+    server = WebhookServer(
+        application,
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET_TOKEN,
+        latency_tracker=update_latency,
+    )
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    async with application:
+        await post_init(application)
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            await post_shutdown(application)
+
+
 if __name__ == "__main__":
     main()
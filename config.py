@@ -6,16 +6,101 @@ load_dotenv(override=True)
 
 # Telegram Bot settings
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Update delivery: "polling" or "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Webhook settings (used when BOT_MODE=webhook)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public base URL, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')  # required in webhook mode
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Upper bound for updates processed concurrently (one at a time per user)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
 
 # Google Sheets settings
 GOOGLE_SHEETS_CREDENTIALS_FILE = os.getenv('GOOGLE_SHEETS_CREDENTIALS_FILE')
 SPREADSHEET_ID_MY = os.getenv('SPREADSHEET_ID_MY')
 SPREADSHEET_ID_HER = os.getenv('SPREADSHEET_ID_HER')
 SPREADSHEET_ID_COMMON = os.getenv('SPREADSHEET_ID_COMMON')
+# Spreadsheets registered by users with /add_table
+SPREADSHEET_REGISTRY_FILE = os.getenv('SPREADSHEET_REGISTRY_FILE', 'data/spreadsheets.json')
+# Sheets writer: worker processes (sharded by spreadsheet id), per-shard
+# request budget and how long to collect writes into one batch
+SHEETS_WRITER_SHARDS = int(os.getenv('SHEETS_WRITER_SHARDS', '2'))
+SHEETS_SHARD_REQUESTS_PER_MINUTE = int(os.getenv('SHEETS_SHARD_REQUESTS_PER_MINUTE', '60'))
+SHEETS_WRITE_BATCH_WINDOW = float(os.getenv('SHEETS_WRITE_BATCH_WINDOW', '0.05'))
+# Month rollover: next month's sheet is created this many days in advance,
+# the job checks every MONTH_ROLLOVER_CHECK_INTERVAL seconds
+MONTH_ROLLOVER_DAYS_AHEAD = int(os.getenv('MONTH_ROLLOVER_DAYS_AHEAD', '3'))
+MONTH_ROLLOVER_CHECK_INTERVAL = float(os.getenv('MONTH_ROLLOVER_CHECK_INTERVAL', '3600'))
+# Summary sheet: 'formulas' (INDIRECT/QUERY over whole columns) or
+# 'materialized' (the bot writes the tables as values after each write)
+SUMMARY_MODE = os.getenv('SUMMARY_MODE', 'formulas')
+SUMMARY_REFRESH_DELAY = float(os.getenv('SUMMARY_REFRESH_DELAY', '5'))
+# TrueType font with Cyrillic glyphs for /stats chart images
+STATS_CHART_FONT = os.getenv('STATS_CHART_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+# Recent rows per user and spreadsheet remembered for /delete and /edit
+ROW_INDEX_FILE = os.getenv('ROW_INDEX_FILE', 'data/row_index.json')
+ROW_INDEX_SIZE = int(os.getenv('ROW_INDEX_SIZE', '20'))
+# Budget for Sheets reads of background jobs such as /export
+SHEETS_READS_PER_MINUTE = int(os.getenv('SHEETS_READS_PER_MINUTE', '60'))
+SHEETS_READ_BURST = int(os.getenv('SHEETS_READ_BURST', '5'))
+# /export reads month sheets in pages of EXPORT_PAGE_ROWS rows, several per batchGet
+EXPORT_PAGE_ROWS = int(os.getenv('EXPORT_PAGE_ROWS', '1000'))
+EXPORT_PAGES_PER_REQUEST = int(os.getenv('EXPORT_PAGES_PER_REQUEST', '5'))
+# /find indexes comments of this many most recent month sheets at startup
+SEARCH_INDEX_MONTHS = int(os.getenv('SEARCH_INDEX_MONTHS', '12'))
+# Monthly category budgets, kept next to categories.json
+BUDGETS_FILE = os.getenv('BUDGETS_FILE', 'data/budgets.json')
+# Outbox for transactions that couldn't be written while Sheets was unavailable
+OUTBOX_FILE = os.getenv('OUTBOX_FILE', 'data/outbox.sqlite3')
+OUTBOX_REPLAY_INTERVAL = float(os.getenv('OUTBOX_REPLAY_INTERVAL', '30'))
+OUTBOX_REPLAY_BATCH = int(os.getenv('OUTBOX_REPLAY_BATCH', '500'))
+# Failed replays of a row before it is dead-lettered until /outbox replay
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '100'))
 # SaluteSpeech settings
 SALUTE_SPEECH_AUTH_KEY = os.getenv("SALUTE_SPEECH_AUTH_KEY")
 SALUTE_SPEECH_API_URL = os.getenv('SALUTE_SPEECH_API_URL', 'https://smartspeech.sber.ru/rest/v1')
 SALUTE_SPEECH_API_AUTH_URL = os.getenv('SALUTE_SPEECH_API_AUTH_URL', 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth')
 
+# Local Prometheus metrics endpoint (port 0 disables it)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+# /health and /ready endpoint; served by the metrics server when the ports
+# match, by its own server otherwise, so disabling metrics keeps the checks
+# (port 0 disables it)
+HEALTH_HOST = os.getenv('HEALTH_HOST', METRICS_HOST)
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '9100'))
+# Health thresholds: a dependency is failing after this
+# many failed calls in a row, polling is stalled when getUpdates hasn't
+# succeeded for HEALTH_POLLING_STALL seconds, and more queued updates than
+# HEALTH_MAX_UPDATE_BACKLOG make the bot not ready
+HEALTH_FAILURE_THRESHOLD = int(os.getenv('HEALTH_FAILURE_THRESHOLD', '3'))
+HEALTH_POLLING_STALL = float(os.getenv('HEALTH_POLLING_STALL', '120'))
+HEALTH_MAX_UPDATE_BACKLOG = int(os.getenv('HEALTH_MAX_UPDATE_BACKLOG', '100'))
+# Calls per dependency kept for the rolling latency percentiles
+HEALTH_LATENCY_WINDOW = int(os.getenv('HEALTH_LATENCY_WINDOW', '100'))
+
+# Logging: level and sampling of repeated messages (at most BURST records of
+# one message template per INTERVAL seconds; 0 disables sampling)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_INTERVAL = float(os.getenv('LOG_SAMPLE_INTERVAL', '10'))
+LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', '20'))
+
+# Updates handled slower than this are logged with their span tree
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '2000'))
+# Telegram user ids allowed to run admin commands such as /profile
+ADMIN_USER_IDS = {
+    int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()
+}
+
+# Conversation state persistence (pending transactions survive restarts)
+PERSISTENCE_FILE = os.getenv('PERSISTENCE_FILE', 'data/bot_state.sqlite3')
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '5'))
+
+# QR receipts: number of worker processes for decoding
+QR_DECODE_WORKERS = int(os.getenv('QR_DECODE_WORKERS', '2'))
+
 # Google Sheets structure
-SHEET_HEADERS = ['Дата', 'Тип', 'Категория', 'Сумма', 'Источник', 'Комментарий'] 
\ No newline at end of file
+SHEET_HEADERS = ['Дата', 'Тип', 'Категория', 'Сумма', 'Источник', 'Комментарий', 'ID'] 
\ No newline at end of file
@@ -4,7 +4,9 @@ import os
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from config import ADMIN_USER_IDS
 from services.telegram_utils import safe_reply_text
+from services.tracing import traced
 
 
 def require_auth(func):
@@ -31,6 +33,26 @@ def require_auth(func):
     return wrapper
 
 
+def require_admin(func):
+    """Декоратор для команд, доступных только администраторам."""
+
+    @functools.wraps(func)
+    async def wrapper(
+        update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs
+    ):
+        if update.effective_user.id not in ADMIN_USER_IDS:
+            if update.message:
+                await safe_reply_text(
+                    update.message, "❌ Команда доступна только администратору."
+                )
+            return
+
+        return await func(update, context, *args, **kwargs)
+
+    return wrapper
+
+
+@traced("auth")
 def is_user_allowed(user_id: int) -> bool:
     """Проверяет, разрешен ли доступ пользователю."""
     try:
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from config import BUDGETS_FILE
+from services.transaction import kopecks_to_cell, to_kopecks
+
+logger = logging.getLogger(__name__)
+
+# Доли лимита, при пересечении которых отправляется предупреждение
+BUDGET_ALERT_THRESHOLDS = (0.8, 1.0)
+
+
+class BudgetService:
+    """
+    Monthly expense limits per category.
+
+    Stored next to categories.json as
+    {"budgets": {"Еда": 30000}, "spreadsheets": {"<id>": {"Еда": 50000}}}:
+    limits of a spreadsheet override the common ones, 0 means no limit.
+    The file holds rubles, the service works in kopecks like the month
+    aggregates the spending comes from.
+    """
+
+    def __init__(self, budgets_file: str = BUDGETS_FILE):
+        self.budgets_file = budgets_file
+        self._lock = threading.Lock()
+        self._common: Dict[str, int] = {}
+        self._by_spreadsheet: Dict[str, Dict[str, int]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.budgets_file):
+            return
+        try:
+            with open(self.budgets_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            logger.exception("Failed to load budgets %s", self.budgets_file)
+            return
+        self._common = {
+            category: to_kopecks(limit) or 0
+            for category, limit in data.get("budgets", {}).items()
+        }
+        self._by_spreadsheet = {
+            spreadsheet_id: {
+                category: to_kopecks(limit) or 0 for category, limit in limits.items()
+            }
+            for spreadsheet_id, limits in data.get("spreadsheets", {}).items()
+        }
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.budgets_file) or ".", exist_ok=True)
+        data = {
+            "budgets": {
+                category: kopecks_to_cell(limit) for category, limit in self._common.items()
+            },
+            "spreadsheets": {
+                spreadsheet_id: {
+                    category: kopecks_to_cell(limit) for category, limit in limits.items()
+                }
+                for spreadsheet_id, limits in self._by_spreadsheet.items()
+            },
+        }
+        temp_file = f"{self.budgets_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.budgets_file)
+
+    def limit(self, spreadsheet_id: str, category: str) -> Optional[int]:
+        limits = self._by_spreadsheet.get(spreadsheet_id)
+        if limits is not None and category in limits:
+            return limits[category]
+        return self._common.get(category)
+
+    def limits(self, spreadsheet_id: str) -> Dict[str, int]:
+        """All limits that apply to the spreadsheet."""
+        limits = {**self._common, **self._by_spreadsheet.get(spreadsheet_id, {})}
+        return {category: limit for category, limit in limits.items() if limit}
+
+    def set_limit(self, spreadsheet_id: str, category: str, limit: int) -> None:
+        """Set the limit of a category for one spreadsheet; 0 turns it off."""
+        with self._lock:
+            self._by_spreadsheet.setdefault(spreadsheet_id, {})[category] = limit
+            self._save()
+
+    def crossed_thresholds(
+        self, spreadsheet_id: str, category: str, spent_before: int, spent_after: int
+    ) -> List[float]:
+        """Thresholds the category passed with this spending, as shares of its limit."""
+        limit = self.limit(spreadsheet_id, category)
+        if not limit:
+            return []
+        return [
+            threshold
+            for threshold in BUDGET_ALERT_THRESHOLDS
+            if spent_before < threshold * limit <= spent_after
+        ]
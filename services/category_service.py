@@ -1,7 +1,11 @@
 import json
+import logging
 import os
 from typing import Dict, List, Optional
 import re
+import zlib
+
+logger = logging.getLogger(__name__)
 
 
 class CategoryService:
@@ -9,12 +13,22 @@ class CategoryService:
         self.categories_file = categories_file
         self._ensure_categories_file()
         self.categories = self._load_categories()
+        self._update_version()
+
+    def _update_version(self) -> None:
+        """Recompute the version that changes whenever the category lists change."""
+        names = "\n".join(
+            self.get_categories("income") + ["|"] + self.get_categories("expense")
+        )
+        self.version = format(zlib.crc32(names.encode("utf-8")), "x")
 
     def _ensure_categories_file(self) -> None:
         """Ensure categories file exists."""
         os.makedirs(os.path.dirname(self.categories_file), exist_ok=True)
         if not os.path.exists(self.categories_file):
-            self._save_categories(
+            # Пишем исходный формат файла напрямую: _save_categories ждёт
+            # внутреннюю структуру после _load_categories
+            self._write_categories_file(
                 {
                     "keywords": {
                         "income": [
@@ -44,10 +58,15 @@ class CategoryService:
                         "Здоровье": ["аптека", "врач"],
                         "Развлечения": ["кино", "театр", "ресторан", "кафе"],
                         "Перевод": ["перевод", "поступление"],
+                        "Другое": [],
                     },
                 }
             )
 
+    def _write_categories_file(self, raw_categories: Dict) -> None:
+        with open(self.categories_file, "w", encoding="utf-8") as f:
+            json.dump(raw_categories, f, ensure_ascii=False, indent=4)
+
     @staticmethod
     def synonyms_to_category(
         category_to_synonyms: Dict[str, List[str]],
@@ -92,7 +111,7 @@ class CategoryService:
             return categories
 
         except Exception as e:
-            print(f"Error loading categories: {e}")
+            logger.error("Error loading categories: %s", e)
             return {
                 "keywords": {"income": {}, "expense": {}},
                 "income": {"categories": [], "keywords": {}},
@@ -124,11 +143,11 @@ class CategoryService:
                             synonyms.append(keyword)
                     original_format[transaction_type][category] = synonyms
 
-            with open(self.categories_file, "w", encoding="utf-8") as f:
-                json.dump(original_format, f, ensure_ascii=False, indent=4)
+            self._write_categories_file(original_format)
             self.categories = categories
+            self._update_version()
         except Exception as e:
-            print(f"Error saving categories: {e}")
+            logger.error("Error saving categories: %s", e)
 
     def get_categories(self, transaction_type: str) -> List[str]:
         """Get list of categories for transaction type."""
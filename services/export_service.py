@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+import csv
+import logging
+import os
+import tempfile
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from config import (
+    EXPORT_PAGE_ROWS,
+    EXPORT_PAGES_PER_REQUEST,
+    SHEET_HEADERS,
+    SHEETS_READ_BURST,
+    SHEETS_READS_PER_MINUTE,
+)
+from services.rate_limit import TokenBucket
+from services.sheets_service import LAST_COLUMN, GoogleSheetsService
+from services.summary import AMOUNT_COLUMN
+from services.transaction import kopecks_to_cell, to_kopecks
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "xlsx")
+
+# Общий бюджет чтений Google Sheets для фоновых выгрузок
+sheets_read_limiter = TokenBucket(SHEETS_READS_PER_MINUTE / 60, SHEETS_READ_BURST)
+
+
+class CsvExportWriter:
+    """CSV for Excel: UTF-8 with BOM and ';' as separator."""
+
+    extension = "csv"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file, delimiter=";")
+        self._writer.writerow(SHEET_HEADERS)
+
+    def write_rows(self, rows: List[List]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class XlsxExportWriter:
+    """XLSX written in openpyxl write-only mode, rows go straight to disk."""
+
+    extension = "xlsx"
+
+    def __init__(self, path: str):
+        from openpyxl import Workbook
+
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Транзакции")
+        self._sheet.append(SHEET_HEADERS)
+
+    def write_rows(self, rows: List[List]) -> None:
+        for row in rows:
+            amount = to_kopecks(row[AMOUNT_COLUMN])
+            if amount is not None:
+                row = row[:AMOUNT_COLUMN] + [kopecks_to_cell(amount)] + row[AMOUNT_COLUMN + 1:]
+            self._sheet.append(row)
+
+    def close(self) -> None:
+        self._workbook.save(self.path)
+
+
+class ExportService:
+    """
+    Month sheets exported to a CSV or XLSX file.
+
+    Sheets are read page by page with values().batchGet, each page goes to
+    the file writer before the next one is requested, so memory use doesn't
+    depend on the size of the export. Every batchGet waits for the shared
+    Sheets read limiter.
+    """
+
+    def __init__(
+        self,
+        sheets_service: GoogleSheetsService,
+        read_limiter: TokenBucket = sheets_read_limiter,
+        page_rows: int = EXPORT_PAGE_ROWS,
+        pages_per_request: int = EXPORT_PAGES_PER_REQUEST,
+    ):
+        self.sheets_service = sheets_service
+        self.read_limiter = read_limiter
+        self.page_rows = page_rows
+        self.pages_per_request = pages_per_request
+
+    async def iter_pages(self, spreadsheet_id: str, sheet_name: str) -> AsyncIterator[List[List]]:
+        """Pages of rows of a month sheet, padded to the sheet columns."""
+        width = len(SHEET_HEADERS)
+        start = 2
+        while True:
+            ranges = []
+            for page in range(self.pages_per_request):
+                first = start + page * self.page_rows
+                ranges.append(f"{sheet_name}!A{first}:{LAST_COLUMN}{first + self.page_rows - 1}")
+            await self.read_limiter.acquire()
+            pages = await asyncio.to_thread(
+                self.sheets_service.get_row_pages, spreadsheet_id, ranges
+            )
+            for rows in pages:
+                rows = [(row + [""] * width)[:width] for row in rows if any(row)]
+                if rows:
+                    yield rows
+            if len(pages[-1]) < self.page_rows:
+                return
+            start += self.pages_per_request * self.page_rows
+
+    async def export(
+        self,
+        spreadsheet_id: str,
+        sheet_names: List[str],
+        export_format: str,
+        progress: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> Optional[str]:
+        """
+        Write the month sheets to a temporary file and return its path.
+
+        Returns None if there were no rows. The caller removes the file.
+        """
+        writer_class = XlsxExportWriter if export_format == "xlsx" else CsvExportWriter
+        fd, path = tempfile.mkstemp(suffix=f".{writer_class.extension}", prefix="export-")
+        os.close(fd)
+        writer = await asyncio.to_thread(writer_class, path)
+        exported = 0
+        try:
+            for sheet_name in sheet_names:
+                async for rows in self.iter_pages(spreadsheet_id, sheet_name):
+                    await asyncio.to_thread(writer.write_rows, rows)
+                    exported += len(rows)
+                    if progress is not None:
+                        await progress(exported)
+            await asyncio.to_thread(writer.close)
+        except BaseException:
+            with contextlib.suppress(Exception):
+                writer.close()
+            os.remove(path)
+            raise
+        if not exported:
+            os.remove(path)
+            return None
+        logger.info("Exported %s rows of %s to %s", exported, spreadsheet_id, path)
+        return path
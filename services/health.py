@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from config import (
+    HEALTH_FAILURE_THRESHOLD,
+    HEALTH_LATENCY_WINDOW,
+    HEALTH_MAX_UPDATE_BACKLOG,
+    HEALTH_POLLING_STALL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Зависимость для getUpdates: её задержка — длина long polling, а не ответа API
+POLLING = "telegram_polling"
+
+
+def _age(moment: Optional[float], now: float) -> Optional[float]:
+    return round(now - moment, 1) if moment is not None else None
+
+
+class DependencyHealth:
+    """Outcome and rolling latency of calls to one external service."""
+
+    def __init__(self, name: str, window: int = HEALTH_LATENCY_WINDOW):
+        self.name = name
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.calls = 0
+        self.consecutive_failures = 0
+        self.last_success: Optional[float] = None
+        self.last_failure: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, duration: Optional[float], error: Optional[str] = None) -> None:
+        """Register a finished call; duration is in seconds, None to skip latency."""
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            if duration is not None:
+                self._latencies.append(duration)
+            if error is None:
+                self.last_success = now
+                self.consecutive_failures = 0
+            else:
+                self.last_failure = now
+                self.last_error = error[:200]
+                self.consecutive_failures += 1
+
+    @property
+    def failing(self) -> bool:
+        return self.consecutive_failures >= HEALTH_FAILURE_THRESHOLD
+
+    def snapshot(self, now: float) -> Dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not self.calls:
+            state = "unknown"
+        elif self.failing:
+            state = "failing"
+        elif self.consecutive_failures:
+            state = "degraded"
+        else:
+            state = "ok"
+        result = {
+            "state": state,
+            "calls": self.calls,
+            "consecutive_failures": self.consecutive_failures,
+            "last_success_age_s": _age(self.last_success, now),
+            "last_failure_age_s": _age(self.last_failure, now),
+            "last_error": self.last_error,
+        }
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            result["latency_ms"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 1),
+                "p95": round(p95 * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1),
+            }
+        return result
+
+
+class HealthMonitor:
+    """
+    Liveness and readiness of the bot for /health and /ready.
+
+    Services record their calls to Sheets, SaluteSpeech and Telegram here.
+    The bot is alive while the event loop answers and, in polling mode,
+    getUpdates keeps succeeding. It is ready when it is alive, no dependency
+    has failed HEALTH_FAILURE_THRESHOLD times in a row and the update queue
+    is below HEALTH_MAX_UPDATE_BACKLOG.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.polling = False
+        self._dependencies: Dict[str, DependencyHealth] = {}
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Callable[[], float]] = {}
+        self._values: Dict[str, Callable[[], Optional[float]]] = {}
+        self._last_update: Optional[Callable[[], Optional[float]]] = None
+
+    def dependency(self, name: str) -> DependencyHealth:
+        dependency = self._dependencies.get(name)
+        if dependency is None:
+            with self._lock:
+                dependency = self._dependencies.setdefault(name, DependencyHealth(name))
+        return dependency
+
+    def record(self, name: str, duration: Optional[float], error: Optional[str] = None) -> None:
+        self.dependency(name).record(duration, error)
+
+    @contextmanager
+    def track(self, name: str):
+        """Record duration and outcome of the block; exceptions mark a failure."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            self.record(name, time.perf_counter() - started_at, f"{type(exc).__name__}: {exc}")
+            raise
+        self.record(name, time.perf_counter() - started_at)
+
+    def add_queue(self, name: str, callback: Callable[[], float]) -> None:
+        self._queues[name] = callback
+
+    def add_value(self, name: str, callback: Callable[[], Optional[float]]) -> None:
+        self._values[name] = callback
+
+    def set_last_update(self, callback: Callable[[], Optional[float]]) -> None:
+        """Callback returning the monotonic time of the last received update."""
+        self._last_update = callback
+
+    @staticmethod
+    def _read(callbacks: Dict[str, Callable]) -> Dict:
+        result = {}
+        for name, callback in callbacks.items():
+            try:
+                result[name] = callback()
+            except Exception:
+                logger.warning("Failed to read health value %s", name, exc_info=True)
+                result[name] = None
+        return result
+
+    def _polling_stalled(self, now: float) -> bool:
+        if not self.polling:
+            return False
+        last_poll = self.dependency(POLLING).last_success
+        if last_poll is None:
+            last_poll = self.started_at
+        return now - last_poll > HEALTH_POLLING_STALL
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            items = sorted(self._dependencies.items())
+        dependencies = {name: dependency.snapshot(now) for name, dependency in items}
+        queues = self._read(self._queues)
+        stalled = self._polling_stalled(now)
+        problems = ["telegram polling stalled"] if stalled else []
+        problems.extend(
+            f"{name} failing"
+            for name, dependency in dependencies.items()
+            if dependency["state"] == "failing"
+        )
+        if (queues.get("update_queue") or 0) > HEALTH_MAX_UPDATE_BACKLOG:
+            problems.append("update backlog")
+
+        return {
+            "live": not stalled,
+            "ready": not problems,
+            "problems": problems,
+            "uptime_s": _age(self.started_at, now),
+            "last_update_age_s": _age(self._last_update() if self._last_update else None, now),
+            "dependencies": dependencies,
+            "queues": queues,
+            **self._read(self._values),
+        }
+
+
+HEALTH = HealthMonitor()
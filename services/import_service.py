@@ -0,0 +1,256 @@
+import csv
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.category_service import CategoryService
+from services.transaction import TransactionType, kopecks_to_cell, to_kopecks
+
+logger = logging.getLogger(__name__)
+
+# Размер образца для определения кодировки и разделителя
+SNIFF_SAMPLE_SIZE = 64 * 1024
+FALLBACK_ENCODING = "cp1251"
+DEFAULT_INCOME_CATEGORY = "Перевод"
+DEFAULT_EXPENSE_CATEGORY = "Другое"
+
+# Заголовки колонок в выгрузках разных банков (в нижнем регистре)
+DATE_COLUMNS = ("дата операции", "дата", "дата транзакции", "date", "transaction date")
+AMOUNT_COLUMNS = (
+    "сумма операции",
+    "сумма в валюте счета",
+    "сумма",
+    "amount",
+    "сумма платежа",
+)
+INCOME_COLUMNS = ("приход", "поступление", "зачисление", "credit")
+EXPENSE_COLUMNS = ("расход", "списание", "debit")
+DESCRIPTION_COLUMNS = (
+    "описание",
+    "назначение платежа",
+    "описание операции",
+    "комментарий",
+    "description",
+    "details",
+)
+CATEGORY_COLUMNS = ("категория", "category")
+STATUS_COLUMNS = ("статус", "status")
+FAILED_STATUSES = {"failed", "отклонена", "отменена"}
+
+DATE_FORMATS = (
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+)
+
+
+def statement_transaction_id(
+    date: str, transaction_type: str, amount: int, description: str, occurrence: int
+) -> str:
+    """
+    Id of an imported row derived from its content.
+
+    occurrence numbers identical operations within the statement, so
+    re-importing the same or an overlapping statement yields the same ids
+    and the rows can be recognised by the ID column.
+    """
+    key = "\x1f".join((date, transaction_type, str(amount), description, str(occurrence)))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass
+class ImportResult:
+    """Результат разбора банковской выписки."""
+
+    rows_by_sheet: Dict[str, List[List]] = field(default_factory=dict)
+    imported: int = 0
+    skipped: int = 0
+    # Строки, уже записанные в таблицу прошлым импортом
+    duplicates: int = 0
+
+
+class StatementImportService:
+    """Потоковый импорт CSV-выписок банков в месячные листы."""
+
+    def __init__(self, category_service: CategoryService):
+        self.category_service = category_service
+
+    @staticmethod
+    def _detect_format(path: str) -> Tuple[str, csv.Dialect]:
+        """Detect file encoding and CSV dialect from the beginning of the file."""
+        with open(path, "rb") as f:
+            raw_sample = f.read(SNIFF_SAMPLE_SIZE)
+
+        try:
+            sample = raw_sample.decode("utf-8-sig")
+            encoding = "utf-8-sig"
+        except UnicodeDecodeError as e:
+            # Образец мог оборвать многобайтовый символ
+            if e.start >= len(raw_sample) - 3:
+                sample = raw_sample[: e.start].decode("utf-8-sig")
+                encoding = "utf-8-sig"
+            else:
+                sample = raw_sample.decode(FALLBACK_ENCODING)
+                encoding = FALLBACK_ENCODING
+
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        except csv.Error:
+            delimiter = ";" if sample.count(";") > sample.count(",") else ","
+            dialect = type("StatementDialect", (csv.excel,), {"delimiter": delimiter})
+        return encoding, dialect
+
+    @staticmethod
+    def _find_column(header: List[str], names: Tuple[str, ...]) -> Optional[int]:
+        """Find index of the first header matching one of the names."""
+        normalized = [h.strip().strip('"').lower() for h in header]
+        for name in names:
+            if name in normalized:
+                return normalized.index(name)
+        return None
+
+    @staticmethod
+    def _parse_amount(value: str) -> Optional[int]:
+        """Parse amounts like '-1 234,56' or '1234.56' into kopecks."""
+        value = (
+            value.strip()
+            .replace("\xa0", "")
+            .replace(" ", "")
+            .replace(",", ".")
+            .replace("−", "-")
+        )
+        if not value:
+            return None
+        return to_kopecks(value)
+
+    def _default_category(self, transaction_type: str, preferred: str) -> str:
+        """Category for unrecognised rows: the preferred one if it exists, else the last one."""
+        categories = self.category_service.get_categories(transaction_type)
+        if preferred in categories or not categories:
+            return preferred
+        return categories[-1]
+
+    @staticmethod
+    def _parse_date(value: str) -> Optional[datetime]:
+        value = value.strip()
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+        return None
+
+    def iter_statement(self, path: str) -> Iterator[Optional[Tuple[datetime, List]]]:
+        """
+        Построчно разбирает выписку, не загружая файл целиком.
+
+        Возвращает пары (дата, строка листа в формате SHEET_HEADERS)
+        либо None для пропущенных строк.
+        """
+        encoding, dialect = self._detect_format(path)
+
+        with open(path, "r", encoding=encoding, newline="") as f:
+            reader = csv.reader(f, dialect)
+            header = next(reader, None)
+            if not header:
+                return
+
+            date_col = self._find_column(header, DATE_COLUMNS)
+            amount_col = self._find_column(header, AMOUNT_COLUMNS)
+            income_col = self._find_column(header, INCOME_COLUMNS)
+            expense_col = self._find_column(header, EXPENSE_COLUMNS)
+            description_col = self._find_column(header, DESCRIPTION_COLUMNS)
+            category_col = self._find_column(header, CATEGORY_COLUMNS)
+            status_col = self._find_column(header, STATUS_COLUMNS)
+
+            if date_col is None or (
+                amount_col is None and income_col is None and expense_col is None
+            ):
+                raise ValueError("Не удалось найти колонки с датой и суммой")
+
+            # Кэш категоризации: в выписках описания сильно повторяются
+            category_cache: Dict[Tuple[str, str], str] = {}
+            income_categories = set(self.category_service.get_categories("income"))
+            expense_categories = set(self.category_service.get_categories("expense"))
+            default_categories = {
+                "income": self._default_category("income", DEFAULT_INCOME_CATEGORY),
+                "expense": self._default_category("expense", DEFAULT_EXPENSE_CATEGORY),
+            }
+            # Сколько раз уже встретилась одинаковая операция
+            occurrences: Dict[Tuple[str, str, int, str], int] = {}
+
+            for row in reader:
+                if not row or len(row) <= date_col:
+                    yield None
+                    continue
+
+                if (
+                    status_col is not None
+                    and len(row) > status_col
+                    and row[status_col].strip().lower() in FAILED_STATUSES
+                ):
+                    yield None
+                    continue
+
+                date = self._parse_date(row[date_col])
+                amount = None
+                if amount_col is not None and len(row) > amount_col:
+                    amount = self._parse_amount(row[amount_col])
+                if not amount and income_col is not None and len(row) > income_col:
+                    amount = self._parse_amount(row[income_col])
+                    amount = abs(amount) if amount else None
+                if not amount and expense_col is not None and len(row) > expense_col:
+                    amount = self._parse_amount(row[expense_col])
+                    amount = -abs(amount) if amount else None
+
+                if date is None or not amount:
+                    yield None
+                    continue
+
+                transaction_type = "income" if amount > 0 else "expense"
+                description = (
+                    row[description_col].strip()
+                    if description_col is not None and len(row) > description_col
+                    else ""
+                )
+                bank_category = (
+                    row[category_col].strip()
+                    if category_col is not None and len(row) > category_col
+                    else ""
+                )
+
+                cache_key = (transaction_type, f"{description} {bank_category}")
+                category = category_cache.get(cache_key)
+                if category is None:
+                    known = (
+                        income_categories
+                        if transaction_type == "income"
+                        else expense_categories
+                    )
+                    category = (
+                        self.category_service.detect_category(
+                            transaction_type, cache_key[1]
+                        )
+                        or (bank_category if bank_category in known else None)
+                        or default_categories[transaction_type]
+                    )
+                    category_cache[cache_key] = category
+
+                date_value = date.strftime("%Y-%m-%d %H:%M:%S")
+                operation = (date_value, transaction_type, abs(amount), description)
+                occurrences[operation] = occurrences.get(operation, 0) + 1
+                yield date, [
+                    date_value,
+                    TransactionType.from_key(transaction_type).value,
+                    category,
+                    kopecks_to_cell(abs(amount)),
+                    "import",
+                    description,
+                    statement_transaction_id(*operation, occurrences[operation]),
+                ]
@@ -0,0 +1,137 @@
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from services.category_service import CategoryService
+
+# callback_data имеет вид "<префикс>:<поля>" и всегда укладывается в 64 байта
+CATEGORY_PREFIX = "c"
+ALBUM_PREFIX = "a"
+TABLE_PREFIX = "t"
+ALBUM_CANCEL = f"{ALBUM_PREFIX}:x"
+
+TRANSACTION_TYPE_CODES = {"income": "i", "expense": "e"}
+_CODE_TRANSACTION_TYPES = {code: name for name, code in TRANSACTION_TYPE_CODES.items()}
+
+
+class CategoryKeyboards:
+    """
+    Category keyboards built once per version of the category list.
+
+    Buttons carry "<prefix>:<type>:<index>:<version>" instead of category
+    names. The version makes buttons of an outdated keyboard decode to None
+    rather than to whatever category now has the same index.
+    """
+
+    def __init__(self, category_service: CategoryService):
+        self.category_service = category_service
+        self._version: Optional[str] = None
+        self._categories: Dict[str, List[str]] = {}
+        self._keyboards: Dict[str, Dict[str, InlineKeyboardMarkup]] = {}
+
+    def _ensure_current(self) -> None:
+        version = self.category_service.version
+        if version == self._version:
+            return
+        self._categories = {
+            transaction_type: list(self.category_service.get_categories(transaction_type))
+            for transaction_type in TRANSACTION_TYPE_CODES
+        }
+        self._keyboards = {CATEGORY_PREFIX: {}, ALBUM_PREFIX: {}}
+        for transaction_type, code in TRANSACTION_TYPE_CODES.items():
+            for prefix in (CATEGORY_PREFIX, ALBUM_PREFIX):
+                keyboard = [
+                    [
+                        InlineKeyboardButton(
+                            category,
+                            callback_data=f"{prefix}:{code}:{index}:{version}",
+                        )
+                    ]
+                    for index, category in enumerate(self._categories[transaction_type])
+                ]
+                if prefix == ALBUM_PREFIX:
+                    keyboard.append(
+                        [InlineKeyboardButton("❌ Отмена", callback_data=ALBUM_CANCEL)]
+                    )
+                self._keyboards[prefix][transaction_type] = InlineKeyboardMarkup(keyboard)
+        self._version = version
+
+    def keyboard(self, transaction_type: str) -> InlineKeyboardMarkup:
+        """Keyboard for choosing the category of a single transaction."""
+        self._ensure_current()
+        return self._keyboards[CATEGORY_PREFIX][transaction_type]
+
+    def album_keyboard(self, transaction_type: str = "expense") -> InlineKeyboardMarkup:
+        """Keyboard for choosing one category for a whole receipt album."""
+        self._ensure_current()
+        return self._keyboards[ALBUM_PREFIX][transaction_type]
+
+    def decode(self, data: str) -> Optional[str]:
+        """Return the category encoded in callback data, None if it is stale or invalid."""
+        self._ensure_current()
+        try:
+            _, code, index, version = data.split(":")
+            if version != self._version:
+                return None
+            return self._categories[_CODE_TRANSACTION_TYPES[code]][int(index)]
+        except (ValueError, KeyError, IndexError):
+            return None
+
+
+class TableKeyboards:
+    """
+    Table selection keyboards, one per currently selected table.
+
+    Tables are (spreadsheet_id, title) pairs: buttons are labelled with
+    titles but select ids, since two tables may share a title. Buttons
+    carry "<prefix>:<index>:<version>", the version being a crc32 of the
+    table list, so a tap on a keyboard built for another list (titles
+    loaded later, a table added) is rejected instead of picking the table
+    that now has the same index.
+    """
+
+    def __init__(self, tables: Sequence[Tuple[str, str]]):
+        self.tables = list(tables)
+        self.version = format(
+            zlib.crc32("\n".join(f"{sid}\t{title}" for sid, title in self.tables).encode()),
+            "x",
+        )
+        self._keyboards: Dict[Optional[str], InlineKeyboardMarkup] = {}
+
+    def keyboard(self, current: Optional[str]) -> InlineKeyboardMarkup:
+        """Keyboard with the spreadsheet id `current` marked as selected."""
+        keyboard = self._keyboards.get(current)
+        if keyboard is None:
+            keyboard = self._keyboards[current] = InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            f"{'✅ ' if spreadsheet_id == current else ''}{self.label(spreadsheet_id)}",
+                            callback_data=f"{TABLE_PREFIX}:{index}:{self.version}",
+                        )
+                    ]
+                    for index, (spreadsheet_id, title) in enumerate(self.tables)
+                ]
+            )
+        return keyboard
+
+    def decode(self, data: str) -> Optional[str]:
+        """Return the spreadsheet id encoded in callback data, None if it is stale or invalid."""
+        try:
+            _, index, version = data.split(":")
+            if version != self.version:
+                return None
+            return self.tables[int(index)][0]
+        except (ValueError, IndexError):
+            return None
+
+    def title(self, spreadsheet_id: str) -> str:
+        return dict(self.tables).get(spreadsheet_id, spreadsheet_id)
+
+    def label(self, spreadsheet_id: str) -> str:
+        """Title of the table; repeated titles get the end of the id to tell them apart."""
+        title = self.title(spreadsheet_id)
+        if sum(1 for _, other in self.tables if other == title) > 1:
+            return f"{title} (…{spreadsheet_id[-4:]})"
+        return title
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple, Union
+
+from config import LOG_LEVEL, LOG_SAMPLE_BURST, LOG_SAMPLE_INTERVAL
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Сообщения, отформатированные до вызова логгера, дают новый шаблон каждый раз
+MAX_SAMPLED_TEMPLATES = 1024
+
+_listener: Optional[QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate limit for repetitive log records.
+
+    Records are grouped by logger and message template (not the formatted
+    text), at most `burst` records of a group pass per `interval` seconds.
+    The next record that passes says how many were dropped. ERROR and above
+    always pass.
+    """
+
+    def __init__(self, interval: float = LOG_SAMPLE_INTERVAL, burst: int = LOG_SAMPLE_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        # (logger, шаблон) -> [начало окна, записей в окне, пропущено]
+        self._windows: Dict[Tuple[str, object], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or not self.interval:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else None)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window is not None else 0
+                if window is None and len(self._windows) >= MAX_SAMPLED_TEMPLATES:
+                    self._windows.clear()
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                dropped = 0
+            else:
+                window[2] += 1
+                return False
+        if dropped:
+            if isinstance(record.args, tuple) and record.args:
+                record.msg = f"{record.msg} (пропущено похожих: %d)"
+                record.args = record.args + (dropped,)
+            else:
+                record.msg = f"{record.msg} (пропущено похожих: {dropped})"
+        return True
+
+
+class _InProcessQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats the message in the calling thread to make
+    the record picklable; records here never leave the process.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: Union[int, str] = LOG_LEVEL) -> QueueListener:
+    """
+    Route all logging through a queue drained by a background thread.
+
+    Handlers in the event loop only put records on the queue; formatting and
+    writing to stderr happen in the listener thread. Safe to call twice.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _InProcessQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def setup_worker_logging(level: Union[int, str] = LOG_LEVEL) -> None:
+    """
+    Plain stderr logging for ProcessPoolExecutor workers.
+
+    A forked worker inherits the queue handler but not the listener thread,
+    so records put on the queue there would never be written.
+    """
+    global _listener
+    _listener = None
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(stream_handler)
+    root.setLevel(level)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Dict, List
+
+from telegram import Message
+
+# Сколько ждать остальные фото альбома после первого
+MEDIA_GROUP_WINDOW_SECONDS = 1.5
+
+
+class MediaGroupCollector:
+    """
+    Collects messages of one Telegram album (shared media_group_id).
+
+    Telegram delivers every album photo as a separate update. The first
+    message opens a collection window; the caller processes the whole
+    album once the window closes.
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW_SECONDS):
+        self.window = window
+        self._groups: Dict[str, List[Message]] = {}
+
+    def add(self, message: Message) -> bool:
+        """Add album message. Returns True if it opened a new group."""
+        group = self._groups.get(message.media_group_id)
+        if group is None:
+            self._groups[message.media_group_id] = [message]
+            return True
+        group.append(message)
+        return False
+
+    async def collect(self, media_group_id: str) -> List[Message]:
+        """Wait for the window to close and return the album messages in order."""
+        await asyncio.sleep(self.window)
+        messages = self._groups.pop(media_group_id, [])
+        return sorted(messages, key=lambda message: message.message_id)
@@ -0,0 +1,262 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+    from services.health import HealthMonitor
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _HistogramChild:
+    """Histogram for one label set. Observing is a bisect and three additions."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        # Без блокировки: под GIL редкие гонки из потоков Sheets допустимы
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _HistogramChild(self.buckets)
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *values: str, amount: float = 1) -> None:
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            logger.warning("Failed to read gauge %s", self.name, exc_info=True)
+            return []
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {value}",
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Histogram:
+        metric = self._metrics[name] = Histogram(name, documentation, label_names)
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = self._metrics[name] = Counter(name, documentation, label_names)
+        return metric
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        metric = self._metrics[name] = Gauge(name, documentation, callback)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    "bot_handler_duration_seconds", "Telegram handler duration", ["handler"]
+)
+SHEETS_LATENCY = REGISTRY.histogram(
+    "bot_sheets_duration_seconds", "GoogleSheetsService method duration", ["method"]
+)
+SHEETS_REQUESTS = REGISTRY.counter(
+    "bot_sheets_requests_total", "Google Sheets API requests executed"
+)
+SPEECH_LATENCY = REGISTRY.histogram(
+    "bot_speech_duration_seconds", "SaluteSpeech call duration", ["operation"]
+)
+QR_DECODE_LATENCY = REGISTRY.histogram(
+    "bot_qr_decode_duration_seconds", "Receipt photo download and decode duration"
+)
+UPDATE_LATENCY = REGISTRY.histogram(
+    "bot_update_latency_seconds", "Delay between receiving an update and handling it"
+)
+TELEGRAM_RETRIES = REGISTRY.counter(
+    "bot_telegram_retries_total", "Retried Telegram requests", ["operation", "reason"]
+)
+
+
+def timed(histogram: Histogram, label: Optional[str] = None):
+    """
+    Decorator observing call duration of a sync or async function.
+
+    The label defaults to the function name. The histogram child is
+    resolved once at decoration time to keep the per-call cost low.
+    """
+
+    def decorator(func):
+        child = histogram.labels(label or func.__name__)
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - started_at)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started_at)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsServer:
+    """
+    Local HTTP server exposing the registry in Prometheus text format.
+
+    With a health monitor it also serves /health (liveness) and /ready
+    (readiness): JSON with the details, status 503 when the check fails.
+    Without a registry it serves only the health checks.
+    """
+
+    def __init__(
+        self,
+        registry: Optional[MetricsRegistry],
+        host: str,
+        port: int,
+        health: Optional["HealthMonitor"] = None,
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.health = health
+        self._runner = None
+
+    async def _handle_metrics(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        return web.Response(
+            text=self.registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def _handle_health(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        snapshot = self.health.snapshot()
+        check = "ready" if request.path == "/ready" else "live"
+        return web.json_response(snapshot, status=200 if snapshot[check] else 503)
+
+    async def start(self) -> None:
+        # aiohttp импортируется только когда сервер метрик включён
+        from aiohttp import web
+
+        app = web.Application()
+        if self.registry is not None:
+            app.router.add_get("/metrics", self._handle_metrics)
+        if self.health is not None:
+            app.router.add_get("/health", self._handle_health)
+            app.router.add_get("/ready", self._handle_health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(
+            "%s server listening on %s:%s",
+            "Metrics" if self.registry is not None else "Health",
+            self.host,
+            self.port,
+        )
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
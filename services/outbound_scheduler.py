@@ -0,0 +1,258 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+from services.metrics import TELEGRAM_RETRIES
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API
+GLOBAL_MESSAGES_PER_SECOND = 30
+PRIVATE_CHAT_MESSAGES_PER_SECOND = 1
+GROUP_CHAT_MESSAGES_PER_SECOND = 20 / 60
+CHAT_BURST = 3
+
+# Чем меньше число, тем раньше уходит сообщение
+PRIORITY_CONFIRMATION = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_INFO = 2
+
+
+@dataclass(order=True)
+class _OutboundJob:
+    priority: int
+    sequence: int
+    chat_id: int = field(compare=False)
+    send: Callable[[], Awaitable[Any]] = field(compare=False)
+    merge_key: Optional[Hashable] = field(compare=False, default=None)
+    futures: List[asyncio.Future] = field(compare=False, default_factory=list)
+    attempt: int = field(compare=False, default=1)
+    not_before: float = field(compare=False, default=0.0)
+    chat_budget: bool = field(compare=False, default=True)
+
+
+class OutboundScheduler:
+    """
+    Proactive scheduler for outgoing Telegram requests.
+
+    Keeps sends within the global and per-chat budgets instead of reacting
+    to RetryAfter. Jobs are dispatched by priority, one in flight per chat so
+    messages within a chat stay ordered, and a pending edit of a message is
+    replaced by a newer edit of the same message.
+
+    Jobs submitted with chat_budget=False (confirmation edits of the message
+    the user just tapped) skip the per-chat bucket: a text → category →
+    confirm flow would otherwise wait for it with a single user. They still
+    count against the global budget and wait out RetryAfter pauses.
+    """
+
+    def __init__(self, retry_attempts: int, retry_delay: float):
+        self.retry_attempts = retry_attempts
+        self.retry_delay = retry_delay
+        self._queue: List[_OutboundJob] = []
+        self._sequence = itertools.count()
+        self._global_bucket = TokenBucket(
+            GLOBAL_MESSAGES_PER_SECOND, GLOBAL_MESSAGES_PER_SECOND
+        )
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._busy_chats: Set[int] = set()
+        self._paused_until: Dict[int, float] = {}
+        self._pending_merges: Dict[Hashable, _OutboundJob] = {}
+        self._in_flight: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> None:
+        if not self.running:
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker and cancel requests that were not sent yet."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        for job in self._queue:
+            for future in job.futures:
+                future.cancel()
+        self._queue.clear()
+        self._pending_merges.clear()
+
+    async def submit(
+        self,
+        chat_id: int,
+        send: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_DEFAULT,
+        merge_key: Optional[Hashable] = None,
+        chat_budget: bool = True,
+    ) -> Any:
+        """Queue a send and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+
+        pending = self._pending_merges.get(merge_key) if merge_key is not None else None
+        if pending is not None:
+            # Более новая правка того же сообщения заменяет ожидающую
+            pending.send = send
+            pending.futures.append(future)
+            pending.chat_budget = pending.chat_budget and chat_budget
+            if priority < pending.priority:
+                pending.priority = priority
+                heapq.heapify(self._queue)
+        else:
+            job = _OutboundJob(
+                priority,
+                next(self._sequence),
+                chat_id,
+                send,
+                merge_key,
+                [future],
+                chat_budget=chat_budget,
+            )
+            if merge_key is not None:
+                self._pending_merges[merge_key] = job
+            heapq.heappush(self._queue, job)
+            self._wakeup.set()
+
+        return await future
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = (
+                GROUP_CHAT_MESSAGES_PER_SECOND
+                if chat_id < 0
+                else PRIVATE_CHAT_MESSAGES_PER_SECOND
+            )
+            bucket = TokenBucket(rate, CHAT_BURST)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _chat_delay(self, job: _OutboundJob, now: float) -> Optional[float]:
+        """Seconds until the job's chat may send, None while the chat is busy."""
+        if job.chat_id in self._busy_chats:
+            return None
+        return max(
+            self._paused_until.get(job.chat_id, 0.0) - now,
+            job.not_before - now,
+            self._chat_bucket(job.chat_id).delay() if job.chat_budget else 0.0,
+            0.0,
+        )
+
+    def _dispatch_ready(self) -> Optional[float]:
+        """Dispatch every job allowed by the budgets. Returns seconds to next check."""
+        now = time.monotonic()
+        deferred = []
+        next_check = None
+        while self._queue:
+            global_delay = self._global_bucket.delay()
+            if global_delay:
+                next_check = global_delay
+                break
+            job = heapq.heappop(self._queue)
+            chat_delay = self._chat_delay(job, now)
+            if chat_delay is None or chat_delay > 0:
+                deferred.append(job)
+                if chat_delay:
+                    next_check = min(next_check or chat_delay, chat_delay)
+                continue
+            self._global_bucket.try_acquire()
+            if job.chat_budget:
+                self._chat_bucket(job.chat_id).try_acquire()
+            self._dispatch(job)
+
+        for job in deferred:
+            heapq.heappush(self._queue, job)
+        return next_check
+
+    def _dispatch(self, job: _OutboundJob) -> None:
+        if self._pending_merges.get(job.merge_key) is job:
+            del self._pending_merges[job.merge_key]
+        self._busy_chats.add(job.chat_id)
+        task = asyncio.create_task(self._send(job))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    def _requeue(self, job: _OutboundJob, not_before: float) -> None:
+        job.attempt += 1
+        job.not_before = not_before
+        if job.merge_key is not None:
+            newer = self._pending_merges.get(job.merge_key)
+            if newer is not None:
+                # Пока ждали повтора, пришла более новая правка
+                newer.futures.extend(job.futures)
+                return
+            self._pending_merges[job.merge_key] = job
+        heapq.heappush(self._queue, job)
+
+    async def _send(self, job: _OutboundJob) -> None:
+        try:
+            result = await job.send()
+        except RetryAfter as exc:
+            retry_at = time.monotonic() + float(exc.retry_after)
+            self._paused_until[job.chat_id] = retry_at
+            logger.warning(
+                "Telegram requested retry after %s seconds for chat %s",
+                exc.retry_after,
+                job.chat_id,
+            )
+            if job.attempt < self.retry_attempts:
+                TELEGRAM_RETRIES.inc("scheduled", "retry_after")
+                self._requeue(job, retry_at)
+            else:
+                self._fail(job, exc)
+        except (TimedOut, NetworkError) as exc:
+            logger.warning(
+                "Transient Telegram send failure on attempt %s/%s",
+                job.attempt,
+                self.retry_attempts,
+                exc_info=True,
+            )
+            if job.attempt < self.retry_attempts:
+                TELEGRAM_RETRIES.inc("scheduled", "network")
+                self._requeue(job, time.monotonic() + self.retry_delay)
+            else:
+                self._fail(job, exc)
+        except Exception as exc:
+            self._fail(job, exc)
+        else:
+            for future in job.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._busy_chats.discard(job.chat_id)
+            self._wakeup.set()
+
+    @staticmethod
+    def _fail(job: _OutboundJob, exc: BaseException) -> None:
+        for future in job.futures:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _run(self) -> None:
+        while True:
+            next_check = self._dispatch_ready()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=next_check)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from config import (
+    OUTBOX_FILE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_REPLAY_BATCH,
+    OUTBOX_REPLAY_INTERVAL,
+    SHEET_HEADERS,
+)
+from services.sheets_writer import ShardedSheetsWriter
+
+logger = logging.getLogger(__name__)
+
+# Индекс колонки ID в строке транзакции
+ID_COLUMN_INDEX = SHEET_HEADERS.index("ID")
+# Паузы между попытками, пока Sheets недоступен, растут до этого предела
+MAX_REPLAY_BACKOFF = 600
+
+
+class Outbox:
+    """
+    Durable queue of sheet rows that couldn't be written to Google Sheets.
+
+    Rows are kept in SQLite with their spreadsheet and month sheet until the
+    replayer confirms they are in the sheet. Every failed attempt postpones
+    the row (next_attempt_at) so other spreadsheets are replayed meanwhile;
+    after max_attempts the row is dead-lettered and waits for /outbox replay.
+    """
+
+    def __init__(self, filepath: str = OUTBOX_FILE, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.filepath = filepath
+        self.max_attempts = max_attempts
+        self._connection = sqlite3.connect(filepath, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, spreadsheet_id TEXT, "
+            "sheet_name TEXT, row TEXT, created_at REAL, attempts INTEGER DEFAULT 0, "
+            "next_attempt_at REAL DEFAULT 0, dead INTEGER DEFAULT 0)"
+        )
+        # Очередь, созданная до появления попыток и dead-letter
+        columns = {column[1] for column in self._connection.execute("PRAGMA table_info(outbox)")}
+        for column, definition in (
+            ("attempts", "INTEGER DEFAULT 0"),
+            ("next_attempt_at", "REAL DEFAULT 0"),
+            ("dead", "INTEGER DEFAULT 0"),
+        ):
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE outbox ADD COLUMN {column} {definition}")
+        self._connection.commit()
+        self._lock = threading.Lock()
+        # Строки, которые ещё будут повторяться (без dead-letter); меняется
+        # только под self._lock, методы вызываются из разных потоков
+        self.size = self._count()
+
+    def _count(self) -> int:
+        """Rows to be replayed; called with self._lock held or before it is shared."""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM outbox WHERE dead = 0"
+        ).fetchone()[0]
+
+    def add(self, spreadsheet_id: str, rows_by_sheet: Dict[str, List[List]]) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO outbox (spreadsheet_id, sheet_name, row, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (spreadsheet_id, sheet_name, json.dumps(row, ensure_ascii=False), now)
+                    for sheet_name, rows in rows_by_sheet.items()
+                    for row in rows
+                ],
+            )
+            self.size += sum(len(rows) for rows in rows_by_sheet.values())
+
+    def next_batch(self, limit: int) -> Tuple[Optional[str], Dict[str, List[Tuple[int, List]]]]:
+        """
+        Oldest due rows of one spreadsheet: (spreadsheet_id, {sheet: [(entry_id, row)]}).
+
+        Rows postponed after a failure are skipped until their next_attempt_at.
+        """
+        now = time.time()
+        with self._lock:
+            first = self._connection.execute(
+                "SELECT spreadsheet_id FROM outbox WHERE dead = 0 AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if first is None:
+                return None, {}
+            entries = self._connection.execute(
+                "SELECT id, sheet_name, row FROM outbox WHERE spreadsheet_id = ? "
+                "AND dead = 0 AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (first[0], now, limit),
+            ).fetchall()
+        batch: Dict[str, List[Tuple[int, List]]] = {}
+        for entry_id, sheet_name, row in entries:
+            batch.setdefault(sheet_name, []).append((entry_id, json.loads(row)))
+        return first[0], batch
+
+    def remove(self, entry_ids: List[int]) -> None:
+        if not entry_ids:
+            return
+        placeholders = ",".join("?" * len(entry_ids))
+        with self._lock, self._connection:
+            pending = self._connection.execute(
+                f"SELECT COUNT(*) FROM outbox WHERE dead = 0 AND id IN ({placeholders})",
+                entry_ids,
+            ).fetchone()[0]
+            self._connection.execute(f"DELETE FROM outbox WHERE id IN ({placeholders})", entry_ids)
+            self.size -= pending
+
+    def postpone(self, entry_ids: List[int], interval: float, max_delay: float) -> int:
+        """
+        Register a failed attempt: the delay doubles with every attempt up to
+        max_delay, rows reaching max_attempts are dead-lettered. Returns the
+        number of rows dead-lettered now.
+        """
+        params = [(time.time(), max_delay, interval, entry_id) for entry_id in entry_ids]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, "
+                "next_attempt_at = ? + MIN(?, ? * (1 << MIN(attempts, 20))) WHERE id = ?",
+                params,
+            )
+            dead = self._connection.execute(
+                f"UPDATE outbox SET dead = 1 WHERE dead = 0 AND attempts >= ? "
+                f"AND id IN ({','.join('?' * len(entry_ids))})",
+                (self.max_attempts, *entry_ids),
+            ).rowcount
+            self.size -= dead
+        return dead
+
+    def retry_all(self) -> None:
+        """Make every row, including dead-lettered ones, due right away."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE outbox SET attempts = 0, next_attempt_at = 0, dead = 0"
+            )
+            self.size = self._count()
+
+    def summary(self) -> Tuple[Dict[str, int], Dict[str, int], Optional[float]]:
+        """
+        Pending and dead-lettered rows per spreadsheet and the creation time
+        of the oldest pending row.
+        """
+        with self._lock:
+            counts: Dict[str, int] = {}
+            dead: Dict[str, int] = {}
+            for spreadsheet_id, is_dead, count in self._connection.execute(
+                "SELECT spreadsheet_id, dead, COUNT(*) FROM outbox GROUP BY spreadsheet_id, dead"
+            ):
+                (dead if is_dead else counts)[spreadsheet_id] = count
+            oldest = self._connection.execute(
+                "SELECT MIN(created_at) FROM outbox WHERE dead = 0"
+            ).fetchone()[0]
+        return counts, dead, oldest
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class OutboxReplayer:
+    """
+    Background task writing outbox rows once Sheets responds again.
+
+    Before writing, the ID column of the target sheet is read and rows whose
+    id is already there are dropped: they landed during the outage even
+    though the call reported an error.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        writer: ShardedSheetsWriter,
+        get_row_ids: Callable[[str, str], Set[str]],
+        interval: float = OUTBOX_REPLAY_INTERVAL,
+        batch_size: int = OUTBOX_REPLAY_BATCH,
+    ):
+        self.outbox = outbox
+        self.writer = writer
+        self.get_row_ids = get_row_ids
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        """Try replaying now instead of waiting for the next interval."""
+        self._wakeup.set()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def replay_batch(self) -> int:
+        """
+        Replay one batch. Returns the number of rows attempted, 0 when no
+        row is due.
+
+        If the spreadsheet of the batch fails, its rows are postponed and the
+        next call moves on to other spreadsheets.
+        """
+        spreadsheet_id, batch = await asyncio.to_thread(
+            self.outbox.next_batch, self.batch_size
+        )
+        if spreadsheet_id is None:
+            return 0
+
+        done: List[int] = []
+        rows_by_sheet: Dict[str, List[List]] = {}
+        try:
+            for sheet_name, entries in batch.items():
+                existing = await asyncio.to_thread(self.get_row_ids, spreadsheet_id, sheet_name)
+                for entry_id, row in entries:
+                    done.append(entry_id)
+                    if row[ID_COLUMN_INDEX] not in existing:
+                        rows_by_sheet.setdefault(sheet_name, []).append(row)
+
+            if rows_by_sheet:
+                await self.writer.write_rows(spreadsheet_id, rows_by_sheet)
+        except Exception:
+            entry_ids = [entry_id for entries in batch.values() for entry_id, _ in entries]
+            dead = await asyncio.to_thread(
+                self.outbox.postpone, entry_ids, self.interval, MAX_REPLAY_BACKOFF
+            )
+            logger.warning(
+                "Outbox replay to %s failed, %s rows postponed, %s dead-lettered",
+                spreadsheet_id,
+                len(entry_ids) - dead,
+                dead,
+                exc_info=True,
+            )
+            return len(entry_ids)
+        await asyncio.to_thread(self.outbox.remove, done)
+        logger.info(
+            "Replayed %s outbox rows to %s, %s were already there",
+            len(done),
+            spreadsheet_id,
+            len(done) - sum(len(rows) for rows in rows_by_sheet.values()),
+        )
+        return len(done)
+
+    async def _run(self) -> None:
+        # Паузы после сбоев хранятся у строк; здесь только ошибки самой очереди
+        delay = self.interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while self.outbox.size and await self.replay_batch():
+                    pass
+                delay = self.interval
+            except Exception:
+                delay = min(delay * 2, MAX_REPLAY_BACKOFF)
+                logger.warning(
+                    "Outbox replay failed, %s rows pending, next attempt in %s s",
+                    self.outbox.size,
+                    delay,
+                    exc_info=True,
+                )
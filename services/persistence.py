@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Отметка удаления записи в очереди на запись
+_DELETED = object()
+# Запись дольше этого порога попадает в лог как предупреждение
+SLOW_FLUSH_MS = 100
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Application persistence storing user_data and conversation states in SQLite.
+
+    Only entries that actually changed are written: every entry is pickled
+    separately and compared with the last written bytes. Writes of one
+    Application.update_persistence() run are batched into a single
+    transaction executed in a worker thread, off the handlers' critical path.
+    """
+
+    def __init__(self, filepath: str, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.filepath = filepath
+        self._connection = sqlite3.connect(filepath, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "name TEXT, key TEXT, state BLOB, PRIMARY KEY (name, key))"
+        )
+        self._connection.commit()
+        self._db_lock = threading.Lock()
+
+        # Последние записанные байты, чтобы не перезаписывать неизменённое
+        self._written: Dict[Tuple[str, Any], bytes] = {}
+        self._staged: Dict[Tuple[str, Any], Any] = {}
+        self._write_task: Optional[asyncio.Task] = None
+        self.last_flush_ms = 0.0
+        self.last_flush_entries = 0
+
+    @property
+    def pending_writes(self) -> int:
+        return len(self._staged)
+
+    def _stage(self, entry: Tuple[str, Any], data: Any) -> None:
+        if data is not _DELETED:
+            data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        if entry not in self._staged and (
+            self._written.get(entry, _DELETED) == data
+        ):
+            return
+        self._staged[entry] = data
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_staged())
+
+    async def _write_staged(self) -> None:
+        # Даём update_persistence поставить в очередь все изменения этого прохода
+        await asyncio.sleep(0)
+        while self._staged:
+            staged, self._staged = self._staged, {}
+            await asyncio.to_thread(self._write, staged)
+
+    def _write(self, staged: Dict[Tuple[str, Any], Any]) -> None:
+        started_at = time.perf_counter()
+        with self._db_lock, self._connection:
+            for (table, key), data in staged.items():
+                if table == "user_data":
+                    if data is _DELETED:
+                        self._connection.execute(
+                            "DELETE FROM user_data WHERE user_id = ?", (key,)
+                        )
+                    else:
+                        self._connection.execute(
+                            "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                            (key, data),
+                        )
+                else:
+                    name, conversation_key = key
+                    if data is _DELETED:
+                        self._connection.execute(
+                            "DELETE FROM conversations WHERE name = ? AND key = ?",
+                            (name, conversation_key),
+                        )
+                    else:
+                        self._connection.execute(
+                            "INSERT OR REPLACE INTO conversations (name, key, state) "
+                            "VALUES (?, ?, ?)",
+                            (name, conversation_key, data),
+                        )
+        for entry, data in staged.items():
+            if data is _DELETED:
+                self._written.pop(entry, None)
+            else:
+                self._written[entry] = data
+
+        self.last_flush_ms = (time.perf_counter() - started_at) * 1000
+        self.last_flush_entries = len(staged)
+        logger.log(
+            logging.WARNING if self.last_flush_ms > SLOW_FLUSH_MS else logging.DEBUG,
+            "Persisted %s changed entries in %.2f ms",
+            len(staged),
+            self.last_flush_ms,
+        )
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        with self._db_lock:
+            rows = self._connection.execute("SELECT user_id, data FROM user_data").fetchall()
+        result = {}
+        for user_id, data in rows:
+            self._written[("user_data", user_id)] = data
+            result[user_id] = pickle.loads(data)
+        return result
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[int, ...], object]:
+        with self._db_lock:
+            rows = self._connection.execute(
+                "SELECT key, state FROM conversations WHERE name = ?", (name,)
+            ).fetchall()
+        result = {}
+        for key, state in rows:
+            self._written[("conversations", (name, key))] = state
+            result[tuple(json.loads(key))] = pickle.loads(state)
+        return result
+
+    async def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        entry = ("conversations", (name, json.dumps(key)))
+        self._stage(entry, _DELETED if new_state is None else new_state)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._stage(("user_data", user_id), data if data else _DELETED)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage(("user_data", user_id), _DELETED)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Write everything still staged and close the database."""
+        if self._write_task is not None:
+            await self._write_task
+        if self._staged:
+            staged, self._staged = self._staged, {}
+            await asyncio.to_thread(self._write, staged)
+        with self._db_lock:
+            self._connection.close()
@@ -1,31 +1,191 @@
-from PIL import Image
-from pyzbar.pyzbar import decode
+import asyncio
 import io
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+from telegram import PhotoSize
+
+from config import QR_DECODE_WORKERS
+from services.logging_setup import setup_worker_logging
+from services.metrics import QR_DECODE_LATENCY
+from services.transaction import Transaction, TransactionType, to_kopecks
+
+logger = logging.getLogger(__name__)
+
+# Минимальная сторона фото, на которой QR-код чека обычно читается
+QR_MIN_PHOTO_SIDE = 640
+# Перед декодированием изображение уменьшается до этого размера
+QR_MAX_DECODE_SIDE = 1280
+
+# Признак расчёта (n) в QR-коде фискального чека
+RECEIPT_OPERATION_TYPES = {
+    "1": TransactionType.EXPENSE,  # приход (покупка)
+    "2": TransactionType.INCOME,  # возврат прихода
+    "3": TransactionType.INCOME,  # расход (продавец платит нам)
+    "4": TransactionType.EXPENSE,  # возврат расхода
+}
+
+
+def decode_qr_image(image_data: bytes, max_side: int = QR_MAX_DECODE_SIDE) -> Optional[str]:
+    """
+    Decode QR code from image data after grayscale conversion and downscaling.
+
+    Module-level so it can be pickled into worker processes. Pillow and
+    pyzbar (which needs libzbar) are imported here, in the worker, so
+    importing the bot doesn't depend on them.
+    """
+    from PIL import Image
+    from pyzbar.pyzbar import ZBarSymbol, decode
+
+    image = Image.open(io.BytesIO(image_data))
+    # zbar works on 8-bit grayscale anyway, converting early shrinks the buffer
+    image = image.convert("L")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    decoded_objects = decode(image, symbols=[ZBarSymbol.QRCODE])
+    if not decoded_objects:
+        return None
+    return decoded_objects[0].data.decode("utf-8")
+
+
+@dataclass
+class QRDecodeResult:
+    """Результат распознавания QR-кода с фото."""
+
+    data: Optional[str]
+    latency_ms: float
+    attempts: int
+    width: Optional[int] = None
+    height: Optional[int] = None
 
 
 class QRService:
-    def __init__(self):
-        pass
+    def __init__(self, max_workers: int = QR_DECODE_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=setup_worker_logging
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        """Stop decoder worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
     def decode_qr(self, image_data: bytes) -> str:
         """Decode QR code from image data."""
         try:
-            # Convert bytes to image
-            image = Image.open(io.BytesIO(image_data))
+            return decode_qr_image(image_data)
+        except Exception as e:
+            logger.warning("Error decoding QR code: %s", e)
+            return None
+
+    async def decode_qr_async(self, image_data: bytes) -> Optional[str]:
+        """Decode QR code in the worker pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(), decode_qr_image, image_data
+            )
+        except Exception as e:
+            logger.warning("Error decoding QR code: %s", e)
+            return None
 
-            # Decode QR codes
-            decoded_objects = decode(image)
+    @staticmethod
+    def select_photo_sizes(photo_sizes: Sequence[PhotoSize]) -> List[PhotoSize]:
+        """
+        Order photo sizes for decoding attempts.
 
-            if not decoded_objects:
-                return None
+        The smallest size that is still likely to decode goes first, larger
+        sizes follow as fallbacks. Thumbnails below QR_MIN_PHOTO_SIDE are only
+        tried when nothing bigger exists.
+        """
+        ordered = sorted(photo_sizes, key=lambda size: size.width * size.height)
+        usable = [
+            size for size in ordered if min(size.width, size.height) >= QR_MIN_PHOTO_SIDE
+        ]
+        return usable or ordered[-1:]
 
-            # Return the first QR code data
-            return decoded_objects[0].data.decode("utf-8")
+    async def decode_photo(self, photo_sizes: Sequence[PhotoSize]) -> QRDecodeResult:
+        """Download and decode a Telegram photo, escalating to larger sizes on failure."""
+        started_at = time.perf_counter()
+        attempts = 0
+        for size in self.select_photo_sizes(photo_sizes):
+            attempts += 1
+            photo_file = await size.get_file()
+            image_data = bytes(await photo_file.download_as_bytearray())
+            data = await self.decode_qr_async(image_data)
+            if data:
+                latency_ms = (time.perf_counter() - started_at) * 1000
+                QR_DECODE_LATENCY.labels().observe(latency_ms / 1000)
+                logger.info(
+                    "QR decoded from %sx%s photo in %.1f ms (%s attempt(s))",
+                    size.width,
+                    size.height,
+                    latency_ms,
+                    attempts,
+                )
+                return QRDecodeResult(
+                    data, latency_ms, attempts, size.width, size.height
+                )
 
-        except Exception as e:
-            print(f"Error decoding QR code: {e}")
+        latency_ms = (time.perf_counter() - started_at) * 1000
+        QR_DECODE_LATENCY.labels().observe(latency_ms / 1000)
+        logger.info(
+            "QR not found after %s attempt(s) in %.1f ms", attempts, latency_ms
+        )
+        return QRDecodeResult(None, latency_ms, attempts)
+
+    @staticmethod
+    def parse_qr_data(qr_data: str) -> Optional[Transaction]:
+        """
+        Parse a fiscal receipt QR string into a transaction.
+
+        Expected format: t=20240301T1530&s=1234.50&fn=...&i=...&fp=...&n=1.
+        Returns None if the string is not a fiscal receipt.
+        """
+        fields = {}
+        for part in qr_data.strip().split("&"):
+            key, sep, value = part.partition("=")
+            if sep:
+                fields[key] = value
+
+        fn, number, fp = fields.get("fn"), fields.get("i"), fields.get("fp")
+        if not (fn and number and fp and "s" in fields and "t" in fields):
+            return None
+
+        amount = to_kopecks(fields["s"])
+        if amount is None:
+            return None
+
+        # Разбираем время срезами: strptime заметно медленнее
+        t = fields["t"]
+        try:
+            date = datetime(
+                int(t[0:4]),
+                int(t[4:6]),
+                int(t[6:8]),
+                int(t[9:11]),
+                int(t[11:13]),
+                int(t[13:15]) if len(t) >= 15 else 0,
+            )
+        except ValueError:
             return None
 
-    def parse_qr_data(self, qr_data: str) -> dict:
-        # TODO
-        ...
+        return Transaction(
+            RECEIPT_OPERATION_TYPES.get(fields.get("n", "1"), TransactionType.EXPENSE),
+            amount,
+            comment=f"Чек ФН {fn} ФД {number}",
+            date=date,
+            receipt_key=(fn, number, fp),
+        )
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+from typing import Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ReceiptKey = Tuple[str, str, str]
+
+
+class ReceiptIndex:
+    """
+    Persistent index of saved fiscal receipts keyed by (fn, i, fp).
+
+    Keys are scoped by spreadsheet, so the same receipt can't be saved twice
+    into one table, even by different users. The index is an append-only
+    file loaded into a set at startup, so lookups are O(1).
+    """
+
+    def __init__(self, index_file: str = "data/receipts_index.txt"):
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        self._saved: Set[str] = set()
+        self._pending: Set[str] = set()
+        self._load()
+
+    @staticmethod
+    def _make_key(spreadsheet_id: str, receipt_key: ReceiptKey) -> str:
+        return "\t".join((spreadsheet_id, *receipt_key))
+
+    def _load(self) -> None:
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            self._saved = {line.rstrip("\n") for line in f if line.strip()}
+        logger.info("Loaded %s receipts into index", len(self._saved))
+
+    def contains(self, spreadsheet_id: str, receipt_key: ReceiptKey) -> bool:
+        """Check whether the receipt is already saved or being saved."""
+        key = self._make_key(spreadsheet_id, receipt_key)
+        return key in self._saved or key in self._pending
+
+    def reserve(self, spreadsheet_id: str, receipt_key: ReceiptKey) -> bool:
+        """Mark the receipt as being saved. Returns False for duplicates."""
+        key = self._make_key(spreadsheet_id, receipt_key)
+        with self._lock:
+            if key in self._saved or key in self._pending:
+                return False
+            self._pending.add(key)
+            return True
+
+    def release(self, spreadsheet_id: str, receipt_key: ReceiptKey) -> None:
+        """Drop a reservation after a failed save."""
+        with self._lock:
+            self._pending.discard(self._make_key(spreadsheet_id, receipt_key))
+
+    def commit(self, spreadsheet_id: str, receipt_key: ReceiptKey) -> None:
+        """Persist a successfully saved receipt."""
+        key = self._make_key(spreadsheet_id, receipt_key)
+        with self._lock:
+            self._pending.discard(key)
+            if key in self._saved:
+                return
+            with open(self.index_file, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+            self._saved.add(key)
+
+    def remove(self, spreadsheet_id: str, receipt_key: ReceiptKey) -> None:
+        """Forget a receipt whose row was deleted, so it can be saved again."""
+        key = self._make_key(spreadsheet_id, receipt_key)
+        with self._lock:
+            if key not in self._saved:
+                return
+            self._saved.discard(key)
+            # Удаления редки: переписываем файл целиком, атомарно
+            temp_file = f"{self.index_file}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                f.writelines(saved + "\n" for saved in self._saved)
+            os.replace(temp_file, self.index_file)
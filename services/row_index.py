@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import ROW_INDEX_FILE, ROW_INDEX_SIZE, SHEET_HEADERS
+from services.receipt_index import ReceiptKey
+
+logger = logging.getLogger(__name__)
+
+ID_COLUMN_INDEX = SHEET_HEADERS.index("ID")
+# Изменения за это время записываются в файл одним разом
+SAVE_DELAY = 1.0
+
+
+@dataclass
+class RowRef:
+    """Where a transaction row of a user ended up in a month sheet."""
+
+    transaction_id: str
+    sheet_name: str
+    # Номер строки листа; None, пока запись не подтверждена (например, в outbox)
+    row: Optional[int] = None
+    # (fn, i, fp) чека, из которого создана строка: при удалении его снимают с учёта
+    receipt_key: Optional[ReceiptKey] = None
+
+
+class RowIndex:
+    """
+    Bounded index of the rows a user recently appended, per spreadsheet.
+
+    Rows are registered with their transaction ids before the write and get
+    their row numbers from the sheets writer listener (`updatedRange` of the
+    append). Deleting a row shifts the rows below it in every user's index.
+    Row numbers are still a hint: callers verify the ID column before
+    changing a row. Stored as JSON, rewritten atomically in a worker thread
+    at most once per SAVE_DELAY, not on every change in the event loop;
+    flush() writes pending changes at shutdown.
+    """
+
+    def __init__(self, index_file: str = ROW_INDEX_FILE, size: int = ROW_INDEX_SIZE):
+        self.index_file = index_file
+        self.size = size
+        self._lock = threading.Lock()
+        # (user_id, spreadsheet_id) -> последние строки, новые в конце
+        self._refs: Dict[Tuple[int, str], Deque[RowRef]] = {}
+        # (spreadsheet_id, transaction_id) -> RowRef
+        self._by_id: Dict[Tuple[str, str], RowRef] = {}
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._file_lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            logger.exception("Failed to load row index %s", self.index_file)
+            return
+        for entry in data.get("users", []):
+            refs = self._refs.setdefault(
+                (entry["user_id"], entry["spreadsheet_id"]), deque(maxlen=self.size)
+            )
+            for ref_data in entry["rows"]:
+                ref = RowRef(**ref_data)
+                if ref.receipt_key is not None:
+                    ref.receipt_key = tuple(ref.receipt_key)
+                refs.append(ref)
+                self._by_id[(entry["spreadsheet_id"], ref.transaction_id)] = ref
+
+    def _save(self) -> None:
+        """Schedule a write of the index; called with self._lock held."""
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (утилиты) пишем сразу
+            self._dirty = False
+            self._write(self._snapshot())
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(SAVE_DELAY)
+            await asyncio.to_thread(self.flush)
+
+    def flush(self) -> None:
+        """Write pending changes to the file."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = self._snapshot()
+        self._write(data)
+
+    def _snapshot(self) -> Dict:
+        return {
+            "users": [
+                {
+                    "user_id": user_id,
+                    "spreadsheet_id": spreadsheet_id,
+                    "rows": [asdict(ref) for ref in refs],
+                }
+                for (user_id, spreadsheet_id), refs in self._refs.items()
+                if refs
+            ]
+        }
+
+    def _write(self, data: Dict) -> None:
+        with self._file_lock:
+            os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+            temp_file = f"{self.index_file}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_file, self.index_file)
+
+    def add(
+        self,
+        user_id: int,
+        spreadsheet_id: str,
+        rows_by_sheet: Dict[str, List[List]],
+        receipt_keys: Optional[Dict[str, ReceiptKey]] = None,
+    ) -> None:
+        """
+        Remember rows about to be written on behalf of the user.
+
+        receipt_keys maps transaction ids of rows created from QR receipts
+        to their receipt keys.
+        """
+        receipt_keys = receipt_keys or {}
+        with self._lock:
+            refs = self._refs.setdefault((user_id, spreadsheet_id), deque(maxlen=self.size))
+            for sheet_name, rows in rows_by_sheet.items():
+                for row in rows:
+                    if (spreadsheet_id, row[ID_COLUMN_INDEX]) in self._by_id:
+                        # Повторная запись той же транзакции
+                        continue
+                    if len(refs) == refs.maxlen:
+                        evicted = refs[0]
+                        self._by_id.pop((spreadsheet_id, evicted.transaction_id), None)
+                    ref = RowRef(
+                        row[ID_COLUMN_INDEX],
+                        sheet_name,
+                        receipt_key=receipt_keys.get(row[ID_COLUMN_INDEX]),
+                    )
+                    refs.append(ref)
+                    self._by_id[(spreadsheet_id, ref.transaction_id)] = ref
+            self._save()
+
+    def on_rows_written(
+        self,
+        spreadsheet_id: str,
+        rows_by_sheet: Dict[str, List[List]],
+        first_rows: Dict[str, Optional[int]],
+    ) -> None:
+        """Sheets writer listener: fill in row numbers of indexed transactions."""
+        with self._lock:
+            changed = False
+            for sheet_name, rows in rows_by_sheet.items():
+                first_row = first_rows.get(sheet_name)
+                if first_row is None:
+                    continue
+                for offset, row in enumerate(rows):
+                    ref = self._by_id.get((spreadsheet_id, row[ID_COLUMN_INDEX]))
+                    if ref is not None:
+                        ref.row = first_row + offset
+                        changed = True
+            if changed:
+                self._save()
+
+    def last(self, user_id: int, spreadsheet_id: str) -> Optional[RowRef]:
+        refs = self._refs.get((user_id, spreadsheet_id))
+        return refs[-1] if refs else None
+
+    def set_row(self, ref: RowRef, row: int) -> None:
+        """Correct the row number of a reference after verifying it."""
+        with self._lock:
+            ref.row = row
+            self._save()
+
+    def remove_row(self, user_id: int, spreadsheet_id: str, ref: RowRef) -> None:
+        """Forget a deleted row and move the rows below it up by one."""
+        with self._lock:
+            refs = self._refs.get((user_id, spreadsheet_id))
+            if refs is not None and ref in refs:
+                refs.remove(ref)
+            self._by_id.pop((spreadsheet_id, ref.transaction_id), None)
+            if ref.row is not None:
+                for (other_spreadsheet_id, _), other in self._by_id.items():
+                    if (
+                        other_spreadsheet_id == spreadsheet_id
+                        and other.sheet_name == ref.sheet_name
+                        and other.row is not None
+                        and other.row > ref.row
+                    ):
+                        other.row -= 1
+            self._save()
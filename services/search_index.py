@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import SEARCH_INDEX_MONTHS, SHEET_HEADERS
+from services.rate_limit import TokenBucket
+from services.sheets_service import SUMMARY_SHEET, GoogleSheetsService
+from services.transaction import to_kopecks
+
+logger = logging.getLogger(__name__)
+
+DATE_COLUMN = SHEET_HEADERS.index("Дата")
+TYPE_COLUMN = SHEET_HEADERS.index("Тип")
+CATEGORY_COLUMN = SHEET_HEADERS.index("Категория")
+AMOUNT_COLUMN = SHEET_HEADERS.index("Сумма")
+COMMENT_COLUMN = SHEET_HEADERS.index("Комментарий")
+ID_COLUMN = SHEET_HEADERS.index("ID")
+
+_TOKEN = re.compile(r"\w+")
+# Окончания, которые отрезаются, чтобы «ветеринару» и «ветеринара» совпадали
+_ENDINGS = sorted(
+    (
+        "ами ями ого его ому ему ыми ими ой ей ий ый ая яя ое ее ую юю ам ям ах ях "
+        "ом ем ов ев ы и а я о е у ю ь"
+    ).split(),
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 3
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercased word stems of a text, without duplicates."""
+    stems = []
+    for token in _TOKEN.findall(str(text).lower().replace("ё", "е")):
+        if len(token) < 2:
+            continue
+        for ending in _ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+                token = token[: -len(ending)]
+                break
+        if token not in stems:
+            stems.append(token)
+    return stems
+
+
+class SearchDocument:
+    """One indexed transaction row."""
+
+    __slots__ = (
+        "spreadsheet_id", "sheet_name", "date", "transaction_type", "category",
+        "amount", "comment", "transaction_id",
+    )
+
+    def __init__(self, spreadsheet_id: str, sheet_name: str, row: List):
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.date = str(row[DATE_COLUMN])
+        self.transaction_type = row[TYPE_COLUMN]
+        self.category = row[CATEGORY_COLUMN]
+        # Сумма в копейках, None если в ячейке не число
+        self.amount = to_kopecks(row[AMOUNT_COLUMN])
+        self.comment = row[COMMENT_COLUMN]
+        self.transaction_id = row[ID_COLUMN] if len(row) > ID_COLUMN else ""
+
+
+class SearchIndex:
+    """
+    Inverted index from comment word stems to transactions.
+
+    Built from the month sheets of the last SEARCH_INDEX_MONTHS months at
+    startup and extended by the sheets writer listener, so /find never
+    reads Sheets. Deleted transactions are left in the postings and skipped
+    when matching.
+    """
+
+    def __init__(self, sheets_service: GoogleSheetsService):
+        self.sheets_service = sheets_service
+        self._documents: List[Optional[SearchDocument]] = []
+        self._postings: Dict[str, List[int]] = {}
+        # (spreadsheet_id, transaction_id) -> номер документа
+        self._by_id: Dict[Tuple[str, str], int] = {}
+
+    def add_rows(self, spreadsheet_id: str, sheet_name: str, rows: Iterable[List]) -> None:
+        for row in rows:
+            if len(row) <= COMMENT_COLUMN or not row[COMMENT_COLUMN]:
+                continue
+            document = SearchDocument(spreadsheet_id, sheet_name, row)
+            key = (spreadsheet_id, document.transaction_id)
+            if document.transaction_id and key in self._by_id:
+                continue
+            number = len(self._documents)
+            self._documents.append(document)
+            if document.transaction_id:
+                self._by_id[key] = number
+            for stem in normalize_tokens(document.comment):
+                self._postings.setdefault(stem, []).append(number)
+
+    def on_rows_written(
+        self,
+        spreadsheet_id: str,
+        rows_by_sheet: Dict[str, List[List]],
+        first_rows: Dict[str, Optional[int]],
+    ) -> None:
+        """Sheets writer listener."""
+        for sheet_name, rows in rows_by_sheet.items():
+            self.add_rows(spreadsheet_id, sheet_name, rows)
+
+    def remove(self, spreadsheet_id: str, transaction_id: str) -> None:
+        number = self._by_id.pop((spreadsheet_id, transaction_id), None)
+        if number is not None:
+            self._documents[number] = None
+
+    def search(
+        self,
+        query: str,
+        spreadsheet_ids: Set[str],
+        category: Optional[str] = None,
+        sheet_name: Optional[str] = None,
+        limit: int = 10,
+    ) -> List[SearchDocument]:
+        """Documents containing every word of the query, newest first."""
+        stems = normalize_tokens(query)
+        if not stems:
+            return []
+        postings = []
+        for stem in stems:
+            numbers = self._postings.get(stem)
+            if not numbers:
+                return []
+            postings.append(numbers)
+        postings.sort(key=len)
+        matches: Iterable[int] = postings[0]
+        if len(postings) > 1:
+            matches = set(postings[0])
+            for numbers in postings[1:]:
+                matches.intersection_update(numbers)
+                if not matches:
+                    return []
+
+        category = category.lower() if category else None
+        found = []
+        for number in matches:
+            document = self._documents[number]
+            if (
+                document is None
+                or document.spreadsheet_id not in spreadsheet_ids
+                or (category and document.category.lower() != category)
+                or (sheet_name and document.sheet_name != sheet_name)
+            ):
+                continue
+            found.append(document)
+        return heapq.nlargest(limit, found, key=lambda document: document.date)
+
+    async def build(self, spreadsheet_ids: Iterable[str], read_limiter: TokenBucket) -> None:
+        """Index the recent month sheets of the spreadsheets."""
+        started_at = time.perf_counter()
+        for spreadsheet_id in spreadsheet_ids:
+            try:
+                await read_limiter.acquire()
+                sheet_names = await asyncio.to_thread(
+                    self.sheets_service.get_sheet_names, spreadsheet_id
+                )
+                months = []
+                for sheet_name in sheet_names:
+                    if sheet_name == SUMMARY_SHEET:
+                        continue
+                    try:
+                        months.append((datetime.strptime(sheet_name, "%B %Y"), sheet_name))
+                    except ValueError:
+                        continue
+                for _, sheet_name in sorted(months, reverse=True)[:SEARCH_INDEX_MONTHS]:
+                    await read_limiter.acquire()
+                    rows = await asyncio.to_thread(
+                        self.sheets_service.get_month_rows, spreadsheet_id, sheet_name
+                    )
+                    self.add_rows(spreadsheet_id, sheet_name, rows)
+            except Exception:
+                logger.warning("Failed to index %s for search", spreadsheet_id, exc_info=True)
+        logger.info(
+            "Search index built: %s transactions, %s stems in %.1f s",
+            len(self._documents),
+            len(self._postings),
+            time.perf_counter() - started_at,
+        )
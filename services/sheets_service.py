@@ -1,22 +1,105 @@
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List, Optional, Set, Tuple
+import logging
 import os
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import random
+import threading
+import time
+import uuid
+from googleapiclient.errors import HttpError
 from config import GOOGLE_SHEETS_CREDENTIALS_FILE, SHEET_HEADERS
+from services.health import HEALTH
+from services.metrics import SHEETS_LATENCY, SHEETS_REQUESTS, timed
+from services.tracing import span, traced
+from services.transaction import Transaction, TransactionType, to_kopecks
+
+logger = logging.getLogger(__name__)
+
+# Последняя колонка листа месяца; в ней хранится ID транзакции
+LAST_COLUMN = "G"
+SUMMARY_SHEET = "Summary"
+
+
+def new_transaction_id() -> str:
+    """Generate the id stored in the ID column of a transaction row."""
+    return uuid.uuid4().hex[:12]
 
 
 class GoogleSheetsService:
     def __init__(self):
-        # Get absolute path to credentials file
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        credentials_path = os.path.join(base_dir, GOOGLE_SHEETS_CREDENTIALS_FILE)
-
-        self.credentials = service_account.Credentials.from_service_account_file(
-            credentials_path, scopes=["https://www.googleapis.com/auth/spreadsheets"]
-        )
-        self.service = build("sheets", "v4", credentials=self.credentials)
+        # Клиент API создаётся при первом запросе: импорт google-библиотек,
+        # чтение ключа и разбор discovery-документа не задерживают запуск
+        self._credentials = None
+        self._service = None
+        self._connect_lock = threading.Lock()
+        # httplib2 is not thread-safe, so every thread gets its own connection
+        self._local = threading.local()
+        # (spreadsheet_id, sheet_name) листов, которые точно существуют
+        self._known_sheets: Set[Tuple[str, str]] = set()
+        # (spreadsheet_id, sheet_name) -> sheetId для запросов batchUpdate
+        self._sheet_ids: Dict[Tuple[str, str], int] = {}
+
+    def connect(self) -> None:
+        """Load the credentials and build the API client if not done yet."""
+        with self._connect_lock:
+            if self._service is not None:
+                return
+            from google.oauth2 import service_account
+            from googleapiclient.discovery import build
+
+            # Get absolute path to credentials file
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            credentials_path = os.path.join(base_dir, GOOGLE_SHEETS_CREDENTIALS_FILE)
+
+            self._credentials = service_account.Credentials.from_service_account_file(
+                credentials_path, scopes=["https://www.googleapis.com/auth/spreadsheets"]
+            )
+            self._service = build("sheets", "v4", credentials=self._credentials)
+
+    @property
+    def credentials(self):
+        if self._credentials is None:
+            self.connect()
+        return self._credentials
+
+    @property
+    def service(self):
+        if self._service is None:
+            self.connect()
+        return self._service
+
+    def _http(self):
+        """Return the authorized HTTP client bound to the current thread."""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+            self._local.http = http
+        return http
+
+    def _execute(self, request):
+        """Execute an API request using the current thread's HTTP client."""
+        SHEETS_REQUESTS.inc()
+        with span(f"sheets.api.{getattr(request, 'methodId', 'request')}"):
+            started_at = time.perf_counter()
+            error = None
+            try:
+                return request.execute(http=self._http())
+            except HttpError as e:
+                # 4xx кроме 429 — ответ API на сам запрос, сервис доступен
+                if e.resp.status >= 500 or e.resp.status == 429:
+                    error = f"HTTP {e.resp.status}"
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                HEALTH.record("sheets", time.perf_counter() - started_at, error)
 
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.get_available_sheets")
     def get_available_sheets(self, spreadsheet_ids):
         """
         Возвращает список кортежей (имя_таблицы, spreadsheet_id) для всех таблиц из списка spreadsheet_ids.
@@ -25,81 +108,416 @@ class GoogleSheetsService:
         sheets = []
         for spreadsheet_id in spreadsheet_ids:
             try:
-                spreadsheet = self.service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+                spreadsheet = self._execute(self.service.spreadsheets().get(spreadsheetId=spreadsheet_id))
                 title = spreadsheet["properties"]["title"]
                 sheets.append((title, spreadsheet_id))
             except Exception as e:
-                print(f"Не удалось получить имя таблицы для {spreadsheet_id}: {e}")
+                logger.warning("Не удалось получить имя таблицы для %s: %s", spreadsheet_id, e)
         return sheets
 
     def get_current_sheet_name(self) -> str:
         """Get current month sheet name in format 'Month YYYY'."""
-        return datetime.now().strftime("%B %Y")
+        return self.get_sheet_name_for_date(datetime.now())
+
+    @staticmethod
+    def get_sheet_name_for_date(date: datetime) -> str:
+        """Get month sheet name for the given date in format 'Month YYYY'."""
+        return date.strftime("%B %Y")
 
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.ensure_sheet_exists")
     def ensure_sheet_exists(self, spreadsheet_id: str, sheet_name: str) -> None:
         """Create sheet if it doesn't exist."""
+        if (spreadsheet_id, sheet_name) in self._known_sheets:
+            return
         try:
             # Try to get the sheet
-            self.service.spreadsheets().get(
-                spreadsheetId=spreadsheet_id, ranges=[sheet_name]
-            ).execute()
+            self._execute(
+                self.service.spreadsheets().get(
+                    spreadsheetId=spreadsheet_id, ranges=[sheet_name]
+                )
+            )
         except Exception:
             # Create new sheet
             body = {"requests": [{"addSheet": {"properties": {"title": sheet_name}}}]}
-            self.service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet_id, body=body
-            ).execute()
+            self._execute(
+                self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id, body=body
+                )
+            )
 
             # Add headers
-            self.service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=f"{sheet_name}!A1:F1",
-                valueInputOption="RAW",
-                body={"values": [SHEET_HEADERS]},
-            ).execute()
+            self._execute(
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!A1:{LAST_COLUMN}1",
+                    valueInputOption="RAW",
+                    body={"values": [SHEET_HEADERS]},
+                )
+            )
+        self._known_sheets.add((spreadsheet_id, sheet_name))
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.prepare_month_sheet")
+    def prepare_month_sheet(
+        self, spreadsheet_id: str, sheet_name: str, materialized: bool = False
+    ) -> None:
+        """
+        Create a month sheet ahead of time and offer it in the Summary dropdown.
 
+        Takes one get of sheet properties and one batchUpdate: the sheet with
+        its header row (if missing) and the month list validation of Summary!E1.
+        With materialized=True the bot writes the current month into E1 itself,
+        so the dropdown is removed instead.
+        """
+        spreadsheet = self._execute(
+            self.service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id, fields="sheets.properties(sheetId,title)"
+            )
+        )
+        sheets = {
+            sheet["properties"]["title"]: sheet["properties"]["sheetId"]
+            for sheet in spreadsheet.get("sheets", [])
+        }
+        requests = []
+        if sheet_name not in sheets:
+            sheet_id = self._new_sheet_id(set(sheets.values()))
+            requests.append(
+                {"addSheet": {"properties": {"sheetId": sheet_id, "title": sheet_name}}}
+            )
+            requests.append(
+                {
+                    "updateCells": {
+                        "start": {"sheetId": sheet_id, "rowIndex": 0, "columnIndex": 0},
+                        "rows": [
+                            {
+                                "values": [
+                                    {"userEnteredValue": {"stringValue": header}}
+                                    for header in SHEET_HEADERS
+                                ]
+                            }
+                        ],
+                        "fields": "userEnteredValue",
+                    }
+                }
+            )
+            sheets[sheet_name] = sheet_id
+        if SUMMARY_SHEET in sheets and materialized:
+            # Выбор месяца ничего не менял бы: таблицы бот считает за текущий месяц
+            requests.append(self._month_validation_request(sheets[SUMMARY_SHEET], None))
+        elif SUMMARY_SHEET in sheets:
+            # Summary без листа ещё нет — ensure_summary_sheet соберёт список сам
+            month_sheets = [title for title in sheets if title != SUMMARY_SHEET]
+            requests.append(
+                self._month_validation_request(sheets[SUMMARY_SHEET], month_sheets)
+            )
+        if requests:
+            self._execute(
+                self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id, body={"requests": requests}
+                )
+            )
+        self._known_sheets.update((spreadsheet_id, title) for title in sheets)
+        self._sheet_ids.update(
+            ((spreadsheet_id, title), sheet_id) for title, sheet_id in sheets.items()
+        )
+
+    @staticmethod
+    def _new_sheet_id(used_ids: Set[int]) -> int:
+        """Pick an unused sheetId so later requests of the same batch can refer to it."""
+        while True:
+            sheet_id = random.randint(1, 2**31 - 1)
+            if sheet_id not in used_ids:
+                return sheet_id
+
+    @staticmethod
+    def _month_validation_request(
+        summary_sheet_id: int, month_sheets: Optional[List[str]]
+    ) -> Dict:
+        """
+        setDataValidation request for the month dropdown in Summary!E1;
+        month_sheets=None removes the dropdown.
+        """
+        request = {
+            "range": {
+                "sheetId": summary_sheet_id,
+                "startRowIndex": 0,
+                "endRowIndex": 1,
+                "startColumnIndex": 4,
+                "endColumnIndex": 5,
+            },
+        }
+        if month_sheets is not None:
+            request["rule"] = {
+                "condition": {
+                    "type": "ONE_OF_LIST",
+                    "values": [{"userEnteredValue": name} for name in month_sheets],
+                },
+                "showCustomUi": True,
+                "strict": True,
+            }
+        return {"setDataValidation": request}
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.add_transaction")
     def add_transaction(
         self,
         spreadsheet_id: str,
-        transaction_type: str,
+        transaction_type: TransactionType,
         category: str,
-        amount: float,
+        amount: int,
         source: str,
         comment: str = "",
+        date: Optional[datetime] = None,
     ) -> None:
-        """Add a new transaction to the current month's sheet."""
-        sheet_name = self.get_current_sheet_name()
-        self.ensure_sheet_exists(spreadsheet_id, sheet_name)
+        """Add a new transaction (amount in kopecks) to the month sheet of its date."""
+        self.add_transactions(
+            spreadsheet_id,
+            [Transaction(transaction_type, amount, category, comment, date)],
+            source,
+        )
 
-        values = [
-            [
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                transaction_type,
-                category,
-                amount,
-                source,
-                comment,
-            ]
-        ]
+    @classmethod
+    def transaction_rows_by_sheet(
+        cls, transactions: List[Transaction], source: str
+    ) -> Dict[str, List[List]]:
+        """
+        Format transactions as sheet rows grouped by month sheet.
+
+        A transaction without an id gets one, so retries of the same
+        transaction write the same ID column value.
+        """
+        rows_by_sheet: Dict[str, List[List]] = {}
+        for transaction in transactions:
+            if transaction.id is None:
+                transaction.id = new_transaction_id()
+            rows_by_sheet.setdefault(
+                cls.get_sheet_name_for_date(transaction.date or datetime.now()), []
+            ).append(transaction.to_row(source))
+        return rows_by_sheet
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.add_transactions")
+    def add_transactions(
+        self, spreadsheet_id: str, transactions: List[Transaction], source: str
+    ) -> Dict[str, Dict]:
+        """Add several transactions with one values().append per month sheet."""
+        return self.write_rows(
+            spreadsheet_id, self.transaction_rows_by_sheet(transactions, source)
+        )
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.write_rows")
+    def write_rows(
+        self, spreadsheet_id: str, rows_by_sheet: Dict[str, List[List]]
+    ) -> Dict[str, Dict]:
+        """Append prepared rows to their month sheets, creating sheets as needed."""
+        responses = {}
+        for sheet_name, rows in rows_by_sheet.items():
+            self.ensure_sheet_exists(spreadsheet_id, sheet_name)
+            try:
+                responses[sheet_name] = self.append_rows(spreadsheet_id, sheet_name, rows)
+            except HttpError as e:
+                # Лист могли удалить вручную — при следующей записи проверим заново
+                if e.resp.status == 400:
+                    self._known_sheets.discard((spreadsheet_id, sheet_name))
+                raise
+        return responses
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.append_rows")
+    def append_rows(
+        self, spreadsheet_id: str, sheet_name: str, rows: List[List]
+    ) -> Dict:
+        """Append rows to a month sheet with a single values().append call."""
+        body = {"values": rows}
+
+        return self._execute(
+            self.service.spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A:{LAST_COLUMN}",
+                valueInputOption="RAW",
+                insertDataOption="INSERT_ROWS",
+                body=body,
+            )
+        )
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.get_row_ids")
+    def get_row_ids(self, spreadsheet_id: str, sheet_name: str) -> Set[str]:
+        """Transaction ids already present in a month sheet (empty if it doesn't exist)."""
+        try:
+            result = self._execute(
+                self.service.spreadsheets().values().get(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!{LAST_COLUMN}2:{LAST_COLUMN}",
+                )
+            )
+        except HttpError as e:
+            # 400 — листа ещё нет; остальные ошибки означают, что API недоступен
+            if e.resp.status == 400:
+                return set()
+            raise
+        return {row[0] for row in result.get("values", []) if row}
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.get_sheet_names")
+    def get_sheet_names(self, spreadsheet_id: str) -> List[str]:
+        """Titles of all sheets of a spreadsheet; also refreshes the sheetId cache."""
+        spreadsheet = self._execute(
+            self.service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id, fields="sheets.properties(sheetId,title)"
+            )
+        )
+        names = []
+        for sheet in spreadsheet.get("sheets", []):
+            properties = sheet["properties"]
+            self._sheet_ids[(spreadsheet_id, properties["title"])] = properties["sheetId"]
+            names.append(properties["title"])
+        return names
+
+    def get_sheet_id(self, spreadsheet_id: str, sheet_name: str) -> int:
+        """sheetId of a sheet, looked up once per spreadsheet."""
+        key = (spreadsheet_id, sheet_name)
+        if key not in self._sheet_ids:
+            self.get_sheet_names(spreadsheet_id)
+        return self._sheet_ids[key]
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.get_row")
+    def get_row(self, spreadsheet_id: str, sheet_name: str, row: int) -> List:
+        """Values of one row of a month sheet."""
+        result = self._execute(
+            self.service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A{row}:{LAST_COLUMN}{row}",
+            )
+        )
+        values = result.get("values", [])
+        return values[0] if values else []
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.find_row")
+    def find_row(self, spreadsheet_id: str, sheet_name: str, transaction_id: str) -> Optional[int]:
+        """Row number of a transaction, found by the ID column alone."""
+        result = self._execute(
+            self.service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!{LAST_COLUMN}2:{LAST_COLUMN}",
+            )
+        )
+        for offset, value in enumerate(result.get("values", [])):
+            if value and value[0] == transaction_id:
+                return offset + 2
+        return None
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.delete_row")
+    def delete_row(self, spreadsheet_id: str, sheet_name: str, row: int) -> None:
+        """Delete one row of a month sheet with a single deleteDimension."""
+        self._execute(
+            self.service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={
+                    "requests": [
+                        {
+                            "deleteDimension": {
+                                "range": {
+                                    "sheetId": self.get_sheet_id(spreadsheet_id, sheet_name),
+                                    "dimension": "ROWS",
+                                    "startIndex": row - 1,
+                                    "endIndex": row,
+                                }
+                            }
+                        }
+                    ]
+                },
+            )
+        )
 
-        body = {"values": values}
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.update_cell")
+    def update_cell(
+        self, spreadsheet_id: str, sheet_name: str, row: int, column_index: int, value
+    ) -> None:
+        """
+        Overwrite one cell of a month sheet; column_index counts from 0.
 
-        self.service.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!A:F",
-            valueInputOption="RAW",
-            body=body,
-        ).execute()
+        Only the edited cell is written: values read back by get_row are
+        formatted strings, rewriting them would turn amounts into text.
+        """
+        column = chr(ord("A") + column_index)
+        self._execute(
+            self.service.spreadsheets().values().update(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!{column}{row}",
+                valueInputOption="RAW",
+                body={"values": [[value]]},
+            )
+        )
 
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.get_month_rows")
+    def get_month_rows(self, spreadsheet_id: str, sheet_name: str) -> List[List]:
+        """All transaction rows of a month sheet (empty if it doesn't exist)."""
+        try:
+            result = self._execute(
+                self.service.spreadsheets().values().get(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!A2:{LAST_COLUMN}",
+                )
+            )
+        except HttpError as e:
+            if e.resp.status == 400:
+                return []
+            raise
+        return result.get("values", [])
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.get_row_pages")
+    def get_row_pages(self, spreadsheet_id: str, ranges: List[str]) -> List[List[List]]:
+        """Rows of several ranges with one values().batchGet (empty if the sheet doesn't exist)."""
+        try:
+            result = self._execute(
+                self.service.spreadsheets().values().batchGet(
+                    spreadsheetId=spreadsheet_id, ranges=ranges
+                )
+            )
+        except HttpError as e:
+            if e.resp.status == 400:
+                return [[] for _ in ranges]
+            raise
+        return [value_range.get("values", []) for value_range in result.get("valueRanges", [])]
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.write_summary_values")
+    def write_summary_values(
+        self, spreadsheet_id: str, values_by_range: Dict[str, List[List]]
+    ) -> None:
+        """Write precomputed Summary tables with one values().batchUpdate."""
+        self._execute(
+            self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={
+                    "valueInputOption": "USER_ENTERED",
+                    "data": [
+                        {"range": f"{SUMMARY_SHEET}!{cell_range}", "values": values}
+                        for cell_range, values in values_by_range.items()
+                    ],
+                },
+            )
+        )
+
+    @timed(SHEETS_LATENCY)
+    @traced("sheets.get_monthly_statistics")
     def get_monthly_statistics(self, spreadsheet_id: str) -> Dict:
         """Get statistics for the current month."""
         sheet_name = self.get_current_sheet_name()
         try:
-            result = (
+            result = self._execute(
                 self.service.spreadsheets()
                 .values()
                 .get(spreadsheetId=spreadsheet_id, range=f"{sheet_name}!A2:E")
-                .execute()
             )
 
             values = result.get("values", [])
@@ -111,29 +529,27 @@ class GoogleSheetsService:
                     "avg_daily_expense": 0,
                 }
 
+            # Суммы в копейках, чтобы итоги не накапливали ошибку округления
             total_income = 0
             total_expense = 0
             expenses_by_category = {}
 
             for row in values:
                 if len(row) >= 4:
-                    try:
-                        # Convert string to float, handling both comma and dot separators
-                        amount_str = str(row[3]).replace(",", ".")
-                        amount = float(amount_str)
-
-                        if row[1] == "Доход":
-                            total_income += amount
-                        else:
-                            total_expense += amount
-                            category = row[2]
-                            expenses_by_category[category] = (
-                                expenses_by_category.get(category, 0) + amount
-                            )
-                    except (ValueError, TypeError) as e:
-                        print(f"Error converting amount '{row[3]}': {e}")
+                    amount = to_kopecks(row[3])
+                    if amount is None:
+                        logger.warning("Error converting amount '%s'", row[3])
                         continue
 
+                    if row[1] == TransactionType.INCOME.value:
+                        total_income += amount
+                    else:
+                        total_expense += amount
+                        category = row[2]
+                        expenses_by_category[category] = (
+                            expenses_by_category.get(category, 0) + amount
+                        )
+
             # Calculate top expenses
             top_expenses = sorted(
                 expenses_by_category.items(), key=lambda x: x[1], reverse=True
@@ -141,19 +557,16 @@ class GoogleSheetsService:
 
             # Calculate average daily expense
             days_in_month = datetime.now().day
-            avg_daily_expense = (
-                total_expense / days_in_month if days_in_month > 0 else 0
-            )
 
             return {
-                "total_income": total_income,
-                "total_expense": total_expense,
-                "top_expenses": top_expenses,
-                "avg_daily_expense": avg_daily_expense,
+                "total_income": total_income / 100,
+                "total_expense": total_expense / 100,
+                "top_expenses": [(category, amount / 100) for category, amount in top_expenses],
+                "avg_daily_expense": total_expense / days_in_month / 100,
             }
 
         except Exception as e:
-            print(f"Error getting statistics: {e}")
+            logger.exception("Error getting statistics: %s", e)
             return {
                 "total_income": 0,
                 "total_expense": 0,
@@ -161,12 +574,13 @@ class GoogleSheetsService:
                 "avg_daily_expense": 0,
             }
 
+    @timed(SHEETS_LATENCY)
     def create_summary_charts(self, spreadsheet_id: str):
         """Создаёт диаграммы на листе Summary: круговая по категориям, столбчатая по дням (доход/расход), круговая по источникам."""
-        sheet_name = "Summary"
+        sheet_name = SUMMARY_SHEET
         # Получить id листа
-        spreadsheet = (
-            self.service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+        spreadsheet = self._execute(
+            self.service.spreadsheets().get(spreadsheetId=spreadsheet_id)
         )
         sheet_id = None
         for s in spreadsheet["sheets"]:
@@ -303,7 +717,7 @@ class GoogleSheetsService:
                                                     {
                                                         "sheetId": sheet_id,
                                                         "startRowIndex": 3 - 1,
-                                                        "endRowIndex": 32,
+                                                        "endRowIndex": 34,
                                                         "startColumnIndex": 7,
                                                         "endColumnIndex": 8,
                                                     },  # H (дата)
@@ -320,7 +734,7 @@ class GoogleSheetsService:
                                                     {
                                                         "sheetId": sheet_id,
                                                         "startRowIndex": 3 - 1,
-                                                        "endRowIndex": 32,
+                                                        "endRowIndex": 34,
                                                         "startColumnIndex": 8,
                                                         "endColumnIndex": 9,
                                                     }  # I (доход)
@@ -335,7 +749,7 @@ class GoogleSheetsService:
                                                     {
                                                         "sheetId": sheet_id,
                                                         "startRowIndex": 3 - 1,
-                                                        "endRowIndex": 32,
+                                                        "endRowIndex": 34,
                                                         "startColumnIndex": 10,
                                                         "endColumnIndex": 11,
                                                     }  # K (расход)
@@ -359,25 +773,35 @@ class GoogleSheetsService:
                 }
             }
         )
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=spreadsheet_id, body={"requests": requests}
-        ).execute()
+        self._execute(
+            self.service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id, body={"requests": requests}
+            )
+        )
+
+    @timed(SHEETS_LATENCY)
+    def ensure_summary_sheet(self, spreadsheet_id: str, materialized: bool = False):
+        """
+        Создаёт лист 'Summary' с формулами для метрик и таблиц, если его ещё нет.
 
-    def ensure_summary_sheet(self, spreadsheet_id: str):
-        """Создаёт лист 'Summary' с формулами для метрик и таблиц, если его ещё нет."""
-        sheet_name = "Summary"
+        При materialized=True формулы не пишутся: таблицы заполняет бот
+        (services.summary.SummaryMaterializer).
+        """
+        sheet_name = SUMMARY_SHEET
         # Проверка наличия листа
         try:
-            self.service.spreadsheets().get(
-                spreadsheetId=spreadsheet_id, ranges=[sheet_name]
-            ).execute()
+            self._execute(
+                self.service.spreadsheets().get(
+                    spreadsheetId=spreadsheet_id, ranges=[sheet_name]
+                )
+            )
             return  # Лист уже есть
         except Exception:
             pass  # Листа нет, создаём
 
         # Получить список всех листов (месяцев)
-        spreadsheet = (
-            self.service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+        spreadsheet = self._execute(
+            self.service.spreadsheets().get(spreadsheetId=spreadsheet_id)
         )
         month_sheets = [
             s["properties"]["title"]
@@ -386,53 +810,35 @@ class GoogleSheetsService:
         ]
 
         # 1. Создать лист и получить его sheetId
-        add_sheet_response = (
-            self.service.spreadsheets()
-            .batchUpdate(
+        add_sheet_response = self._execute(
+            self.service.spreadsheets().batchUpdate(
                 spreadsheetId=spreadsheet_id,
                 body={
                     "requests": [{"addSheet": {"properties": {"title": sheet_name}}}]
                 },
             )
-            .execute()
         )
         sheet_id = add_sheet_response["replies"][0]["addSheet"]["properties"]["sheetId"]
 
-        # 2. Вставить текст "Выберите месяц:" в D1 и выпадающий список в E1
-        self.service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!D1",
-            valueInputOption="USER_ENTERED",
-            body={"values": [["Выберите месяц:"]]},
-        ).execute()
+        # 2. Вставить текст "Выберите месяц:" в D1 и выпадающий список в E1.
+        # В режиме materialized месяц в D1:E1 пишет бот, выбора нет
+        if not materialized:
+            self._execute(
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!D1",
+                    valueInputOption="USER_ENTERED",
+                    body={"values": [["Выберите месяц:"]]},
+                )
+            )
 
-        # 3. Добавить data validation (выпадающий список) в E1
-        requests = [
-            {
-                "setDataValidation": {
-                    "range": {
-                        "sheetId": sheet_id,
-                        "startRowIndex": 0,
-                        "endRowIndex": 1,
-                        "startColumnIndex": 4,
-                        "endColumnIndex": 5,
-                    },
-                    "rule": {
-                        "condition": {
-                            "type": "ONE_OF_LIST",
-                            "values": [
-                                {"userEnteredValue": name} for name in month_sheets
-                            ],
-                        },
-                        "showCustomUi": True,
-                        "strict": True,
-                    },
-                }
-            }
-        ]
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=spreadsheet_id, body={"requests": requests}
-        ).execute()
+            # 3. Добавить data validation (выпадающий список) в E1
+            requests = [self._month_validation_request(sheet_id, month_sheets)]
+            self._execute(
+                self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id, body={"requests": requests}
+                )
+            )
 
         # Формулы с INDIRECT для выбранного месяца (E1)
         summary_values = [
@@ -454,36 +860,50 @@ class GoogleSheetsService:
         daily_expense_formula = '=QUERY(ARRAYFORMULA({INT(INDIRECT($E$1&"!A:A"))\ INDIRECT($E$1&"!B:B")\ INDIRECT($E$1&"!D:D")});"select Col1, sum(Col3) where Col2 = \'Расход\' group by Col1 order by Col1 label sum(Col3) \'Сумма\', Col1 \'Дата\'")'
         daily_income_formula = '=QUERY(ARRAYFORMULA({INT(INDIRECT($E$1&"!A:A"))\ INDIRECT($E$1&"!B:B")\ INDIRECT($E$1&"!D:D")});"select Col1, sum(Col3) where Col2 = \'Доход\' group by Col1 order by Col1 label sum(Col3) \'Сумма\', Col1 \'Дата\'")'
 
-        self.service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!A1:B7",
-            valueInputOption="USER_ENTERED",
-            body={"values": summary_values},
-        ).execute()
-        self.service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!D3",
-            valueInputOption="USER_ENTERED",
-            body={"values": [[expense_by_cat_formula]]},
-        ).execute()
-        self.service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!F3",
-            valueInputOption="USER_ENTERED",
-            body={"values": [[income_by_cat_formula]]},
-        ).execute()
-        self.service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!H3",
-            valueInputOption="USER_ENTERED",
-            body={"values": [[daily_expense_formula]]},
-        ).execute()
-        self.service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!J3",
-            valueInputOption="USER_ENTERED",
-            body={"values": [[daily_income_formula]]},
-        ).execute()
+        if materialized:
+            # Значения запишет бот, формулы по целым столбцам не нужны
+            summary_values = [[label, ""] for label, _ in summary_values]
+        self._execute(
+            self.service.spreadsheets().values().update(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A1:B7",
+                valueInputOption="USER_ENTERED",
+                body={"values": summary_values},
+            )
+        )
+        if not materialized:
+            self._execute(
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!D3",
+                    valueInputOption="USER_ENTERED",
+                    body={"values": [[expense_by_cat_formula]]},
+                )
+            )
+            self._execute(
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!F3",
+                    valueInputOption="USER_ENTERED",
+                    body={"values": [[income_by_cat_formula]]},
+                )
+            )
+            self._execute(
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!H3",
+                    valueInputOption="USER_ENTERED",
+                    body={"values": [[daily_expense_formula]]},
+                )
+            )
+            self._execute(
+                self.service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!J3",
+                    valueInputOption="USER_ENTERED",
+                    body={"values": [[daily_income_formula]]},
+                )
+            )
 
         # Применить формат даты к столбцам H и J (только дата, без времени)
         date_format_request = {
@@ -512,10 +932,12 @@ class GoogleSheetsService:
                 "fields": "userEnteredFormat.numberFormat",
             }
         }
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=spreadsheet_id,
-            body={"requests": [date_format_request, date_format_request_j]},
-        ).execute()
+        self._execute(
+            self.service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={"requests": [date_format_request, date_format_request_j]},
+            )
+        )
 
         # После вставки формул — создать диаграммы
         self.create_summary_charts(spreadsheet_id)
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import re
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from config import (
+    SHEETS_SHARD_REQUESTS_PER_MINUTE,
+    SHEETS_WRITE_BATCH_WINDOW,
+    SHEETS_WRITER_SHARDS,
+)
+from services.health import HEALTH
+from services.logging_setup import setup_worker_logging
+from services.metrics import SHEETS_LATENCY
+from services.rate_limit import TokenBucket
+from services.sheets_service import GoogleSheetsService
+from services.tracing import span
+from services.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Запросов к API на один лист в пакете: проверка листа и append
+REQUESTS_PER_SHEET = 2
+# Сколько запросов шард может сделать подряд без ожидания
+SHARD_BURST = 10
+
+_UPDATED_RANGE_START = re.compile(r"![A-Z]+(\d+)")
+
+# Listener(spreadsheet_id, rows_by_sheet, first_rows) вызывается после записи
+WriteListener = Callable[[str, Dict[str, List[List]], Dict[str, Optional[int]]], None]
+
+# Сервис Sheets внутри процесса-воркера
+_worker_service: Optional[GoogleSheetsService] = None
+
+
+def _init_worker(service_factory: Callable[[], GoogleSheetsService]) -> None:
+    global _worker_service
+    setup_worker_logging()
+    _worker_service = service_factory()
+
+
+def _write_rows(spreadsheet_id: str, rows_by_sheet: Dict[str, List[List]]) -> Dict[str, Dict]:
+    return _worker_service.write_rows(spreadsheet_id, rows_by_sheet)
+
+
+def _first_row(response: Dict) -> Optional[int]:
+    """Row number of the first appended row from a values().append response."""
+    updated_range = (response or {}).get("updates", {}).get("updatedRange", "")
+    match = _UPDATED_RANGE_START.search(updated_range)
+    return int(match.group(1)) if match else None
+
+
+@dataclass
+class _WriteJob:
+    spreadsheet_id: str
+    rows_by_sheet: Dict[str, List[List]]
+    future: asyncio.Future
+    # Смещение строк задания внутри объединённого пакета, по листам
+    offsets: Dict[str, int] = field(default_factory=dict)
+
+
+class _Shard:
+    def __init__(
+        self,
+        index: int,
+        requests_per_minute: int,
+        service_factory: Callable[[], GoogleSheetsService],
+    ):
+        self.index = index
+        self.service_factory = service_factory
+        self.bucket = TokenBucket(requests_per_minute / 60, SHARD_BURST)
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=1, initializer=_init_worker, initargs=(self.service_factory,)
+            )
+        return self.executor
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class ShardedSheetsWriter:
+    """
+    Sheets writes routed to worker processes sharded by spreadsheet id.
+
+    Every shard owns one worker process with its own Sheets client, a request
+    budget (token bucket) and a queue. Writes arriving within the batch
+    window are merged into one append per month sheet of a spreadsheet.
+    All writes of a spreadsheet go through the same shard, so they stay
+    ordered, while different spreadsheets are written in parallel.
+    """
+
+    def __init__(
+        self,
+        shards: int = SHEETS_WRITER_SHARDS,
+        requests_per_minute: int = SHEETS_SHARD_REQUESTS_PER_MINUTE,
+        batch_window: float = SHEETS_WRITE_BATCH_WINDOW,
+        service_factory: Callable[[], GoogleSheetsService] = GoogleSheetsService,
+    ):
+        self.batch_window = batch_window
+        self._shards = [
+            _Shard(index, requests_per_minute, service_factory)
+            for index in range(max(shards, 1))
+        ]
+        self._listeners: List[WriteListener] = []
+
+    @property
+    def queue_size(self) -> int:
+        return sum(shard.queue.qsize() for shard in self._shards)
+
+    def add_listener(self, listener: WriteListener) -> None:
+        """Call `listener` in the event loop after every successful write."""
+        self._listeners.append(listener)
+
+    def shard_for(self, spreadsheet_id: str) -> int:
+        return zlib.crc32(spreadsheet_id.encode("utf-8")) % len(self._shards)
+
+    async def write_rows(
+        self, spreadsheet_id: str, rows_by_sheet: Dict[str, List[List]]
+    ) -> Dict[str, Optional[int]]:
+        """
+        Append rows to month sheets of a spreadsheet.
+
+        Returns the row number of the first written row per sheet, None if
+        the API response didn't contain it.
+        """
+        shard = self._shards[self.shard_for(spreadsheet_id)]
+        if shard.task is None or shard.task.done():
+            shard.task = asyncio.create_task(self._run_shard(shard))
+        job = _WriteJob(
+            spreadsheet_id, rows_by_sheet, asyncio.get_running_loop().create_future()
+        )
+        with span(f"sheets.writer.shard{shard.index}"):
+            await shard.queue.put(job)
+            return await job.future
+
+    async def add_transactions(
+        self, spreadsheet_id: str, transactions: List[Transaction], source: str
+    ) -> Dict[str, Optional[int]]:
+        """Write transactions to the month sheets of their dates."""
+        return await self.write_rows(
+            spreadsheet_id,
+            GoogleSheetsService.transaction_rows_by_sheet(transactions, source),
+        )
+
+    async def _collect_batch(self, shard: _Shard) -> List[_WriteJob]:
+        jobs = [await shard.queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(await asyncio.wait_for(shard.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Записи, накопившиеся за время предыдущего пакета, идут вместе
+        while not shard.queue.empty():
+            jobs.append(shard.queue.get_nowait())
+        return jobs
+
+    async def _run_shard(self, shard: _Shard) -> None:
+        while True:
+            jobs = await self._collect_batch(shard)
+            by_spreadsheet: Dict[str, List[_WriteJob]] = {}
+            for job in jobs:
+                by_spreadsheet.setdefault(job.spreadsheet_id, []).append(job)
+            for spreadsheet_id, group in by_spreadsheet.items():
+                await self._write_group(shard, spreadsheet_id, group)
+
+    async def _write_group(
+        self, shard: _Shard, spreadsheet_id: str, jobs: List[_WriteJob]
+    ) -> None:
+        merged: Dict[str, List[List]] = {}
+        for job in jobs:
+            for sheet_name, rows in job.rows_by_sheet.items():
+                sheet_rows = merged.setdefault(sheet_name, [])
+                job.offsets[sheet_name] = len(sheet_rows)
+                sheet_rows.extend(rows)
+
+        # Больше ёмкости ведра не просим, иначе ожидание никогда не закончится
+        await shard.bucket.acquire(min(REQUESTS_PER_SHEET * len(merged), SHARD_BURST))
+        started_at = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            # Запросы воркеров не видны HEALTH этого процесса, учитываем пакет
+            with HEALTH.track("sheets"):
+                responses = await loop.run_in_executor(
+                    shard.get_executor(), _write_rows, spreadsheet_id, merged
+                )
+        except Exception as exc:
+            if isinstance(exc, BrokenProcessPool):
+                # Процесс-воркер упал — следующий пакет запустит новый
+                shard.executor = None
+            logger.warning(
+                "Sheets write of %s jobs to %s failed", len(jobs), spreadsheet_id, exc_info=True
+            )
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(exc)
+            return
+        finally:
+            SHEETS_LATENCY.labels("writer_batch").observe(time.perf_counter() - started_at)
+
+        logger.debug(
+            "Shard %s wrote %s jobs (%s rows) to %s",
+            shard.index,
+            len(jobs),
+            sum(len(rows) for rows in merged.values()),
+            spreadsheet_id,
+        )
+        first_rows = {sheet_name: _first_row(response) for sheet_name, response in responses.items()}
+        for job in jobs:
+            job_first_rows = {
+                sheet_name: (
+                    first_rows[sheet_name] + job.offsets[sheet_name]
+                    if first_rows.get(sheet_name) is not None
+                    else None
+                )
+                for sheet_name in job.rows_by_sheet
+            }
+            for listener in self._listeners:
+                try:
+                    listener(spreadsheet_id, job.rows_by_sheet, job_first_rows)
+                except Exception:
+                    logger.exception("Sheets write listener failed")
+            if not job.future.done():
+                job.future.set_result(job_first_rows)
+
+    async def stop(self) -> None:
+        """Stop shard loops, fail writes still queued and stop worker processes."""
+        for shard in self._shards:
+            if shard.task is not None:
+                shard.task.cancel()
+                try:
+                    await shard.task
+                except asyncio.CancelledError:
+                    pass
+                shard.task = None
+            while not shard.queue.empty():
+                job = shard.queue.get_nowait()
+                job.future.cancel()
+            shard.shutdown()
@@ -1,20 +1,19 @@
 import logging
-import aiohttp
 import time
 import ssl
 import uuid
 import re
+from typing import Optional
 from config import (
     SALUTE_SPEECH_API_AUTH_URL,
     SALUTE_SPEECH_AUTH_KEY,
     SALUTE_SPEECH_API_URL,
 )
 from services.category_service import CategoryService
+from services.health import HEALTH
+from services.metrics import SPEECH_LATENCY, timed
+from services.transaction import Transaction, TransactionType, to_kopecks
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 
@@ -27,23 +26,35 @@ class SpeechService:
         self._access_token = None
         self._token_expires_at = 0
         self.category_service = category_service
+        HEALTH.add_value("speech_token_expires_in_s", lambda: self.token_expires_in)
 
         # Create SSL context that doesn't verify certificates
         self.ssl_context = ssl.create_default_context()
         self.ssl_context.check_hostname = False
         self.ssl_context.verify_mode = ssl.CERT_NONE
 
+    @property
+    def token_expires_in(self) -> Optional[float]:
+        """Seconds until the cached access token expires, None without a token."""
+        if not self._access_token:
+            return None
+        return round(self._token_expires_at / 1000 - time.time(), 1)
+
+    @timed(SPEECH_LATENCY, "access_token")
     async def _get_access_token(self) -> str:
         """Get access token for SaluteSpeech API."""
         current_time = int(time.time() * 1000)
 
         # If token exists and not expired (with 30 seconds buffer), return it
-        logger.info(f"Current time {current_time}, expires {self._token_expires_at}")
+        logger.debug("Current time %s, expires %s", current_time, self._token_expires_at)
         if self._access_token and current_time < self._token_expires_at - 30 * 1000:
             return self._access_token
 
         # Get new token
         logger.info("POST Request to access token")
+        # aiohttp нужен только для запросов к SaluteSpeech, не при запуске
+        import aiohttp
+
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 f"{self.api_auth_url}",
@@ -58,7 +69,7 @@ class SpeechService:
             ) as response:
                 if response.status != 200:
                     error_text = await response.text()
-                    print(f"Failed to get access token: {error_text}")
+                    logger.error("Failed to get access token: %s", error_text)
                     raise Exception("Failed to get access token")
 
                 data = await response.json()
@@ -66,11 +77,14 @@ class SpeechService:
                 self._token_expires_at = data["expires_at"]
                 return self._access_token
 
+    @timed(SPEECH_LATENCY, "recognize")
     async def transcribe_voice(self, voice_file_path: str) -> str:
         """Transcribe voice message to text using SaluteSpeech API."""
+        # В HEALTH попадает весь вызов: получение токена и распознавание
+        started_at = time.perf_counter()
         try:
             # Get access token
-            logger.info("Get access token")
+            logger.debug("Get access token")
             access_token = await self._get_access_token()
 
             # Read the audio file
@@ -86,6 +100,8 @@ class SpeechService:
             params = {"sample_rate": 48000}
 
             # Send the request
+            import aiohttp
+
             async with aiohttp.ClientSession() as session:
                 async with session.post(
                     f"{self.api_url}/speech:recognize",
@@ -96,40 +112,45 @@ class SpeechService:
                 ) as response:
                     if response.status == 200:
                         result = await response.json()
+                        HEALTH.record("speech", time.perf_counter() - started_at)
                         return result.get("result", "")[0]
                     else:
                         error_text = await response.text()
-                        logger.error(f"Error from SaluteSpeech: {error_text}")
+                        logger.error("Error from SaluteSpeech: %s", error_text)
+                        HEALTH.record(
+                            "speech", time.perf_counter() - started_at, f"HTTP {response.status}"
+                        )
                         return ""
 
         except Exception as e:
             logger.exception(e)
+            HEALTH.record("speech", time.perf_counter() - started_at, f"{type(e).__name__}: {e}")
             return ""
 
-    def parse_transcription(self, text: str) -> dict:
-        """Parse transcribed text to extract transaction details."""
+    def parse_transcription(self, text: str) -> Optional[Transaction]:
+        """
+        Parse transcribed text to extract transaction details.
+
+        Returns None if the type or the amount couldn't be recognized.
+        """
         # Convert to lowercase for easier matching
         text = text.lower().rstrip(".")
 
-        # Initialize result
-        result = {"type": None, "category": None, "amount": None, "comment": text}
-
         # Determine transaction type using type synonyms
         transaction_type = self.category_service.detect_transaction_type(text)
-        if transaction_type:
-            result["type"] = "Доход" if transaction_type == "income" else "Расход"
-
-            # Extract amount (looking for numbers)
-
-            amount_match = re.search(r"\d+(?: \d{3})*(?:[.,]\d{2})?", text)
-            if amount_match:
-                result["amount"] = float(
-                    amount_match.group().replace(",", ".").replace(" ", "")
-                )
-
+        if not transaction_type:
+            return None
+
+        # Extract amount (looking for numbers)
+        amount_match = re.search(r"\d+(?: \d{3})*(?:[.,]\d{2})?", text)
+        amount = to_kopecks(amount_match.group()) if amount_match else None
+        if not amount:
+            return None
+
+        return Transaction(
+            TransactionType.from_key(transaction_type),
+            amount,
             # Try to detect category
-            category = self.category_service.detect_category(transaction_type, text)
-            if category:
-                result["category"] = category
-
-        return result
+            self.category_service.detect_category(transaction_type, text),
+            text,
+        )
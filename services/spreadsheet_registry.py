@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from config import SPREADSHEET_REGISTRY_FILE
+
+logger = logging.getLogger(__name__)
+
+_SPREADSHEET_URL_ID = re.compile(r"/spreadsheets/d/([A-Za-z0-9_-]+)")
+_SPREADSHEET_ID = re.compile(r"^[A-Za-z0-9_-]{20,}$")
+
+
+def parse_spreadsheet_id(text: str) -> Optional[str]:
+    """Extract a spreadsheet id from a Google Sheets link or a bare id."""
+    text = text.strip()
+    match = _SPREADSHEET_URL_ID.search(text)
+    if match:
+        return match.group(1)
+    return text if _SPREADSHEET_ID.match(text) else None
+
+
+class SpreadsheetRegistry:
+    """
+    Spreadsheets registered by users at runtime.
+
+    Complements the spreadsheets configured through environment variables,
+    which are shared by everybody: a registered spreadsheet is only offered
+    to the users who added it. Stored as JSON, rewritten atomically.
+    """
+
+    def __init__(self, registry_file: str = SPREADSHEET_REGISTRY_FILE):
+        self.registry_file = registry_file
+        self._lock = threading.Lock()
+        # spreadsheet_id -> {"title": ..., "user_ids": [...]}
+        self._spreadsheets: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.registry_file):
+            return
+        try:
+            with open(self.registry_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            logger.exception("Failed to load spreadsheet registry %s", self.registry_file)
+            return
+        for entry in data.get("spreadsheets", []):
+            self._spreadsheets[entry["spreadsheet_id"]] = {
+                "title": entry["title"],
+                "user_ids": list(entry.get("user_ids", [])),
+            }
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.registry_file) or ".", exist_ok=True)
+        data = {
+            "spreadsheets": [
+                {"spreadsheet_id": spreadsheet_id, **entry}
+                for spreadsheet_id, entry in self._spreadsheets.items()
+            ]
+        }
+        temp_file = f"{self.registry_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.registry_file)
+
+    def register(self, spreadsheet_id: str, title: str, user_id: int) -> None:
+        """Make the spreadsheet available to the user."""
+        with self._lock:
+            entry = self._spreadsheets.setdefault(
+                spreadsheet_id, {"title": title, "user_ids": []}
+            )
+            entry["title"] = title
+            if user_id not in entry["user_ids"]:
+                entry["user_ids"].append(user_id)
+            self._save()
+
+    def for_user(self, user_id: int) -> Dict[str, str]:
+        """Spreadsheets registered by the user: {spreadsheet_id: title}."""
+        return {
+            spreadsheet_id: entry["title"]
+            for spreadsheet_id, entry in self._spreadsheets.items()
+            if user_id in entry["user_ids"]
+        }
+
+    def all_ids(self) -> List[str]:
+        return list(self._spreadsheets)
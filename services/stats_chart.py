@@ -0,0 +1,176 @@
+import calendar
+import io
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from config import STATS_CHART_FONT
+from services.summary import MonthAggregates
+
+if TYPE_CHECKING:
+    from PIL import ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+WIDTH = 1000
+HEIGHT = 1000
+BACKGROUND = (255, 255, 255)
+TEXT_COLOR = (40, 40, 40)
+GRID_COLOR = (220, 220, 220)
+EXPENSE_COLOR = (219, 68, 55)
+INCOME_COLOR = (15, 157, 88)
+PIE_COLORS = [
+    (66, 133, 244), (219, 68, 55), (244, 180, 0), (15, 157, 88), (171, 71, 188),
+    (0, 172, 193), (255, 112, 67), (158, 157, 36), (92, 107, 192), (240, 98, 146),
+]
+# Больше секторов на круговой диаграмме не различить, остальное — «Прочее»
+MAX_PIE_SLICES = len(PIE_COLORS)
+
+_fonts: Dict[int, "ImageFont.ImageFont"] = {}
+
+
+def _font(size: int) -> "ImageFont.ImageFont":
+    from PIL import ImageFont
+
+    font = _fonts.get(size)
+    if font is None:
+        try:
+            font = ImageFont.truetype(STATS_CHART_FONT, size)
+        except OSError:
+            # Встроенный шрифт без кириллицы, но картинка хотя бы построится
+            logger.warning("Font %s is not available, using the default one", STATS_CHART_FONT)
+            font = ImageFont.load_default()
+        _fonts[size] = font
+    return font
+
+
+def _pie_slices(by_category: Dict[str, int]) -> List[Tuple[str, int]]:
+    items = sorted(
+        ((category, amount) for category, amount in by_category.items() if amount > 0),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    if len(items) > MAX_PIE_SLICES:
+        rest = sum(amount for _, amount in items[MAX_PIE_SLICES - 1:])
+        items = items[: MAX_PIE_SLICES - 1] + [("Прочее", rest)]
+    return items
+
+
+def _draw_pie(draw: "ImageDraw.ImageDraw", month: MonthAggregates, top: int) -> None:
+    draw.text((40, top), "Расходы по категориям", font=_font(26), fill=TEXT_COLOR)
+    slices = _pie_slices(month.expense_by_category)
+    box = (60, top + 60, 420, top + 420)
+    if not slices:
+        draw.text((box[0], box[1] + 160), "Расходов пока нет", font=_font(22), fill=TEXT_COLOR)
+        return
+
+    total = sum(amount for _, amount in slices)
+    angle = -90.0
+    for index, (category, amount) in enumerate(slices):
+        sweep = 360.0 * amount / total
+        draw.pieslice(box, angle, angle + sweep, fill=PIE_COLORS[index], outline=BACKGROUND)
+        angle += sweep
+
+        y = top + 70 + index * 36
+        draw.rectangle((470, y + 4, 490, y + 24), fill=PIE_COLORS[index])
+        draw.text(
+            (505, y),
+            f"{category}: {amount / 100:,.0f} ₽ ({amount / total:.0%})".replace(",", " "),
+            font=_font(20),
+            fill=TEXT_COLOR,
+        )
+
+
+def _draw_daily_bars(
+    draw: "ImageDraw.ImageDraw", month: MonthAggregates, sheet_name: str, top: int
+) -> None:
+    draw.text((40, top), "Доходы и расходы по дням", font=_font(26), fill=TEXT_COLOR)
+    try:
+        first_day = datetime.strptime(sheet_name, "%B %Y")
+    except ValueError:
+        first_day = datetime.now().replace(day=1)
+    days_in_month = calendar.monthrange(first_day.year, first_day.month)[1]
+    prefix = first_day.strftime("%Y-%m-")
+
+    left, right = 90, WIDTH - 30
+    chart_top, bottom = top + 60, HEIGHT - 60
+    values = [
+        (
+            month.daily_expense.get(f"{prefix}{day:02d}", 0),
+            month.daily_income.get(f"{prefix}{day:02d}", 0),
+        )
+        for day in range(1, days_in_month + 1)
+    ]
+    peak = max([max(pair) for pair in values] + [100])
+
+    for step in range(5):
+        y = bottom - (bottom - chart_top) * step / 4
+        draw.line((left, y, right, y), fill=GRID_COLOR)
+        draw.text(
+            (10, y - 10),
+            f"{peak * step / 400:,.0f}".replace(",", " "),
+            font=_font(16),
+            fill=TEXT_COLOR,
+        )
+
+    slot = (right - left) / days_in_month
+    bar = max(slot / 2 - 1, 1)
+    for index, (expense, income) in enumerate(values):
+        x = left + index * slot
+        for offset, amount, color in ((0, expense, EXPENSE_COLOR), (bar, income, INCOME_COLOR)):
+            if amount > 0:
+                height = (bottom - chart_top) * amount / peak
+                draw.rectangle((x + offset, bottom - height, x + offset + bar - 1, bottom), fill=color)
+        day = index + 1
+        if day == 1 or day % 5 == 0:
+            draw.text((x, bottom + 8), str(day), font=_font(16), fill=TEXT_COLOR)
+
+    legend_y = top + 20
+    for label, color, x in (("Расходы", EXPENSE_COLOR, 620), ("Доходы", INCOME_COLOR, 780)):
+        draw.rectangle((x, legend_y + 14, x + 20, legend_y + 34), fill=color)
+        draw.text((x + 28, legend_y + 10), label, font=_font(20), fill=TEXT_COLOR)
+
+
+def render_stats_chart(sheet_name: str, month: MonthAggregates) -> bytes:
+    """PNG with the category pie and daily income/expense bars of a month."""
+    # Pillow загружается при первом графике, а не при импорте бота
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (WIDTH, HEIGHT), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw.text((40, 20), sheet_name, font=_font(32), fill=TEXT_COLOR)
+    draw.text(
+        (40, 64),
+        f"Доходы: {month.income / 100:,.0f} ₽   Расходы: {month.expense / 100:,.0f} ₽".replace(
+            ",", " "
+        ),
+        font=_font(22),
+        fill=TEXT_COLOR,
+    )
+    _draw_pie(draw, month, top=110)
+    _draw_daily_bars(draw, month, sheet_name, top=560)
+
+    output = io.BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+
+class StatsChartCache:
+    """
+    Telegram file_id of the last chart sent per (spreadsheet, month).
+
+    A chart is only rendered and uploaded again when the aggregates version
+    changed; otherwise the photo is re-sent by file_id.
+    """
+
+    def __init__(self):
+        self._file_ids: Dict[Tuple[str, str], Tuple[int, str]] = {}
+
+    def get(self, spreadsheet_id: str, sheet_name: str, version: int) -> Optional[str]:
+        cached = self._file_ids.get((spreadsheet_id, sheet_name))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return None
+
+    def put(self, spreadsheet_id: str, sheet_name: str, version: int, file_id: str) -> None:
+        self._file_ids[(spreadsheet_id, sheet_name)] = (version, file_id)
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import SHEET_HEADERS, SUMMARY_REFRESH_DELAY
+from services.sheets_service import GoogleSheetsService
+from services.transaction import TransactionType, kopecks_to_cell, to_kopecks
+
+logger = logging.getLogger(__name__)
+
+TYPE_COLUMN = SHEET_HEADERS.index("Тип")
+CATEGORY_COLUMN = SHEET_HEADERS.index("Категория")
+AMOUNT_COLUMN = SHEET_HEADERS.index("Сумма")
+ID_COLUMN = SHEET_HEADERS.index("ID")
+
+# Строки таблиц категорий на листе Summary (D3:E22, F3:G22) вместе с заголовком
+CATEGORY_TABLE_ROWS = 20
+# Строки таблицы по дням (H3:K34): заголовок и до 31 дня
+DAILY_TABLE_ROWS = 32
+OTHER_CATEGORY = "Прочее"
+
+
+@dataclass
+class MonthAggregates:
+    """Totals of one month sheet in kopecks, kept up to date from written rows."""
+
+    income: int = 0
+    expense: int = 0
+    income_by_category: Dict[str, int] = field(default_factory=dict)
+    expense_by_category: Dict[str, int] = field(default_factory=dict)
+    # "YYYY-MM-DD" -> сумма
+    daily_income: Dict[str, int] = field(default_factory=dict)
+    daily_expense: Dict[str, int] = field(default_factory=dict)
+    # ID учтённых строк: одна строка может прийти и от писателя, и при чтении листа
+    row_ids: Set[str] = field(default_factory=set)
+    # Лист прочитан целиком; до этого известны только новые строки
+    loaded: bool = False
+    # Растёт с каждой учтённой строкой, ключ кэшей построенных по итогам данных
+    version: int = 0
+
+    def add_row(self, row: List) -> bool:
+        """Account a sheet row. Returns False if it was skipped."""
+        row_id = row[ID_COLUMN] if len(row) > ID_COLUMN else ""
+        if row_id and row_id in self.row_ids:
+            return False
+        if not self._apply(row, 1):
+            return False
+        if row_id:
+            self.row_ids.add(row_id)
+        return True
+
+    def remove_row(self, row: List) -> bool:
+        """Take back a deleted or edited row."""
+        row_id = row[ID_COLUMN] if len(row) > ID_COLUMN else ""
+        if row_id and row_id not in self.row_ids:
+            return False
+        if not self._apply(row, -1):
+            return False
+        self.row_ids.discard(row_id)
+        return True
+
+    def _apply(self, row: List, sign: int) -> bool:
+        if len(row) <= AMOUNT_COLUMN:
+            return False
+        amount = to_kopecks(row[AMOUNT_COLUMN])
+        if amount is None:
+            return False
+        amount *= sign
+        day = str(row[0])[:10]
+        category = row[CATEGORY_COLUMN]
+        if row[TYPE_COLUMN] == TransactionType.INCOME.value:
+            self.income += amount
+            by_category, daily = self.income_by_category, self.daily_income
+        else:
+            self.expense += amount
+            by_category, daily = self.expense_by_category, self.daily_expense
+        by_category[category] = by_category.get(category, 0) + amount
+        daily[day] = daily.get(day, 0) + amount
+        self.version += 1
+        return True
+
+    def snapshot(self) -> "MonthAggregates":
+        """Copy of the totals that can be read outside the event loop."""
+        return MonthAggregates(
+            income=self.income,
+            expense=self.expense,
+            income_by_category=dict(self.income_by_category),
+            expense_by_category=dict(self.expense_by_category),
+            daily_income=dict(self.daily_income),
+            daily_expense=dict(self.daily_expense),
+            loaded=self.loaded,
+            version=self.version,
+        )
+
+
+class SummaryAggregates:
+    """
+    Month aggregates per spreadsheet.
+
+    A month sheet is read once on first use, after that the aggregates follow
+    the rows reported by the sheets writer. Everything runs in the event
+    loop; only the sheet read happens in a thread.
+    """
+
+    def __init__(self, sheets_service: GoogleSheetsService):
+        self.sheets_service = sheets_service
+        self._months: Dict[Tuple[str, str], MonthAggregates] = {}
+        self._loading: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    def peek(self, spreadsheet_id: str, sheet_name: str) -> Optional[MonthAggregates]:
+        """Aggregates of a month if they are loaded, without touching the API."""
+        month = self._months.get((spreadsheet_id, sheet_name))
+        return month if month is not None and month.loaded else None
+
+    async def get(self, spreadsheet_id: str, sheet_name: str) -> MonthAggregates:
+        """Aggregates of a month sheet, reading the sheet on first use."""
+        key = (spreadsheet_id, sheet_name)
+        month = self._months.setdefault(key, MonthAggregates())
+        if month.loaded:
+            return month
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self._load(key, month))
+        try:
+            await asyncio.shield(loading)
+        finally:
+            if loading.done():
+                self._loading.pop(key, None)
+        return month
+
+    async def _load(self, key: Tuple[str, str], month: MonthAggregates) -> None:
+        rows = await asyncio.to_thread(self.sheets_service.get_month_rows, *key)
+        for row in rows:
+            month.add_row(row)
+        month.loaded = True
+        logger.debug("Loaded %s rows of %s into summary aggregates", len(rows), key)
+
+    def on_rows_written(
+        self,
+        spreadsheet_id: str,
+        rows_by_sheet: Dict[str, List[List]],
+        first_rows: Dict[str, Optional[int]],
+    ) -> None:
+        """Sheets writer listener."""
+        for sheet_name, rows in rows_by_sheet.items():
+            month = self._months.setdefault((spreadsheet_id, sheet_name), MonthAggregates())
+            for row in rows:
+                month.add_row(row)
+
+    def on_row_removed(self, spreadsheet_id: str, sheet_name: str, row: List) -> None:
+        """A row was deleted from the sheet (or replaced by an edit)."""
+        month = self._months.get((spreadsheet_id, sheet_name))
+        if month is not None:
+            month.remove_row(row)
+
+
+def _category_table(by_category: Dict[str, int]) -> List[List]:
+    items = sorted(by_category.items(), key=lambda item: item[1], reverse=True)
+    items = [(category, amount) for category, amount in items if amount]
+    limit = CATEGORY_TABLE_ROWS - 1
+    if len(items) > limit:
+        items = items[: limit - 1] + [
+            (OTHER_CATEGORY, sum(amount for _, amount in items[limit - 1:]))
+        ]
+    table = [["Категория", "Сумма"]] + [
+        [category, kopecks_to_cell(amount)] for category, amount in items
+    ]
+    return table + [["", ""]] * (CATEGORY_TABLE_ROWS - len(table))
+
+
+def _daily_table(month: MonthAggregates) -> List[List]:
+    days = sorted(set(month.daily_expense) | set(month.daily_income))
+    table = [["Дата", "Сумма", "Дата", "Сумма"]] + [
+        [
+            day,
+            kopecks_to_cell(month.daily_expense.get(day, 0)),
+            day,
+            kopecks_to_cell(month.daily_income.get(day, 0)),
+        ]
+        for day in days[-(DAILY_TABLE_ROWS - 1):]
+    ]
+    return table + [["", "", "", ""]] * (DAILY_TABLE_ROWS - len(table))
+
+
+def summary_values(sheet_name: str, month: MonthAggregates) -> Dict[str, List[List]]:
+    """
+    Summary sheet contents as {range: values}.
+
+    The ranges are the ones the formulas of `ensure_summary_sheet` fill and
+    the charts of `create_summary_charts` read, padded so that shrinking
+    tables don't leave stale rows behind.
+    """
+    return {
+        "A1:B3": [
+            ["Общая сумма доходов", kopecks_to_cell(month.income)],
+            ["Общая сумма расходов", kopecks_to_cell(month.expense)],
+            ["Баланс", kopecks_to_cell(month.income - month.expense)],
+        ],
+        "D1:E1": [["Месяц:", sheet_name]],
+        f"D3:E{2 + CATEGORY_TABLE_ROWS}": _category_table(month.expense_by_category),
+        f"F3:G{2 + CATEGORY_TABLE_ROWS}": _category_table(month.income_by_category),
+        f"H3:K{2 + DAILY_TABLE_ROWS}": _daily_table(month),
+    }
+
+
+class SummaryMaterializer:
+    """
+    Writes the Summary sheet as plain values instead of whole-column formulas.
+
+    Spreadsheets touched by the sheets writer are marked dirty; after
+    `delay` seconds the current month tables of every dirty spreadsheet are
+    rebuilt from the aggregates and written with one values().batchUpdate.
+    Only the current month is shown: E1 is a label, not a dropdown
+    (prepare_month_sheet removes the validation in this mode).
+    """
+
+    def __init__(
+        self,
+        aggregates: SummaryAggregates,
+        sheets_service: GoogleSheetsService,
+        delay: float = SUMMARY_REFRESH_DELAY,
+    ):
+        self.aggregates = aggregates
+        self.sheets_service = sheets_service
+        self.delay = delay
+        self._dirty: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def mark_dirty(self, spreadsheet_id: str) -> None:
+        self._dirty.add(spreadsheet_id)
+        self._wakeup.set()
+
+    def on_rows_written(
+        self,
+        spreadsheet_id: str,
+        rows_by_sheet: Dict[str, List[List]],
+        first_rows: Dict[str, Optional[int]],
+    ) -> None:
+        """Sheets writer listener; register it after the aggregates listener."""
+        self.mark_dirty(spreadsheet_id)
+
+    async def refresh(self, spreadsheet_id: str) -> None:
+        sheet_name = self.sheets_service.get_sheet_name_for_date(datetime.now())
+        month = await self.aggregates.get(spreadsheet_id, sheet_name)
+        await asyncio.to_thread(
+            self.sheets_service.write_summary_values,
+            spreadsheet_id,
+            summary_values(sheet_name, month),
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Записи, пришедшие за время ожидания, попадут в одно обновление
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            dirty, self._dirty = self._dirty, set()
+            for spreadsheet_id in dirty:
+                try:
+                    await self.refresh(spreadsheet_id)
+                except Exception:
+                    logger.warning(
+                        "Failed to refresh Summary of %s", spreadsheet_id, exc_info=True
+                    )
+                    self._dirty.add(spreadsheet_id)
+            if self._dirty:
+                # Повторим после следующей записи или через паузу
+                self._wakeup.set()
+                await asyncio.sleep(self.delay)
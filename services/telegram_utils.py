@@ -1,9 +1,20 @@
 import asyncio
 import logging
-from typing import Any
+import time
+from typing import Any, Tuple
 
 from telegram import Message
 from telegram.error import NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
+
+from services.health import HEALTH, POLLING
+from services.metrics import TELEGRAM_RETRIES
+from services.outbound_scheduler import (
+    PRIORITY_CONFIRMATION,
+    PRIORITY_DEFAULT,
+    OutboundScheduler,
+)
+from services.tracing import traced
 
 
 logger = logging.getLogger(__name__)
@@ -11,9 +22,22 @@ logger = logging.getLogger(__name__)
 SEND_RETRY_ATTEMPTS = 2
 SEND_RETRY_DELAY_SECONDS = 1
 
+# Запускается в post_init приложения; до этого отправка идёт напрямую
+outbound_scheduler = OutboundScheduler(SEND_RETRY_ATTEMPTS, SEND_RETRY_DELAY_SECONDS)
+
 
-async def safe_reply_text(message: Message, text: str, **kwargs: Any):
+@traced("telegram.reply")
+async def safe_reply_text(
+    message: Message, text: str, priority: int = PRIORITY_DEFAULT, **kwargs: Any
+):
     """Send a Telegram message with a small retry budget for transient errors."""
+    if outbound_scheduler.running:
+        return await outbound_scheduler.submit(
+            message.chat_id,
+            lambda: message.reply_text(text, **kwargs),
+            priority=priority,
+        )
+
     for attempt in range(1, SEND_RETRY_ATTEMPTS + 1):
         try:
             return await message.reply_text(text, **kwargs)
@@ -21,6 +45,7 @@ async def safe_reply_text(message: Message, text: str, **kwargs: Any):
             if attempt == SEND_RETRY_ATTEMPTS:
                 raise
             wait_seconds = max(int(exc.retry_after), SEND_RETRY_DELAY_SECONDS)
+            TELEGRAM_RETRIES.inc("reply", "retry_after")
             logger.warning(
                 "Telegram requested retry after %s seconds while sending reply",
                 wait_seconds,
@@ -29,6 +54,7 @@ async def safe_reply_text(message: Message, text: str, **kwargs: Any):
         except (TimedOut, NetworkError):
             if attempt == SEND_RETRY_ATTEMPTS:
                 raise
+            TELEGRAM_RETRIES.inc("reply", "network")
             logger.warning(
                 "Transient Telegram send failure on attempt %s/%s",
                 attempt,
@@ -38,8 +64,22 @@ async def safe_reply_text(message: Message, text: str, **kwargs: Any):
             await asyncio.sleep(SEND_RETRY_DELAY_SECONDS)
 
 
-async def safe_edit_text(message: Message, text: str, **kwargs: Any):
+@traced("telegram.edit")
+async def safe_edit_text(
+    message: Message, text: str, priority: int = PRIORITY_CONFIRMATION, **kwargs: Any
+):
     """Edit a Telegram message with retry for transient API failures."""
+    if outbound_scheduler.running:
+        # Ожидающая правка того же сообщения заменяется новой; подтверждения
+        # не ждут лимита чата, от перегрузки их защищает пауза RetryAfter
+        return await outbound_scheduler.submit(
+            message.chat_id,
+            lambda: message.edit_text(text, **kwargs),
+            priority=priority,
+            merge_key=("edit", message.chat_id, message.message_id),
+            chat_budget=priority != PRIORITY_CONFIRMATION,
+        )
+
     for attempt in range(1, SEND_RETRY_ATTEMPTS + 1):
         try:
             return await message.edit_text(text, **kwargs)
@@ -47,6 +87,7 @@ async def safe_edit_text(message: Message, text: str, **kwargs: Any):
             if attempt == SEND_RETRY_ATTEMPTS:
                 raise
             wait_seconds = max(int(exc.retry_after), SEND_RETRY_DELAY_SECONDS)
+            TELEGRAM_RETRIES.inc("edit", "retry_after")
             logger.warning(
                 "Telegram requested retry after %s seconds while editing message",
                 wait_seconds,
@@ -55,6 +96,7 @@ async def safe_edit_text(message: Message, text: str, **kwargs: Any):
         except (TimedOut, NetworkError):
             if attempt == SEND_RETRY_ATTEMPTS:
                 raise
+            TELEGRAM_RETRIES.inc("edit", "network")
             logger.warning(
                 "Transient Telegram edit failure on attempt %s/%s",
                 attempt,
@@ -62,3 +104,58 @@ async def safe_edit_text(message: Message, text: str, **kwargs: Any):
                 exc_info=True,
             )
             await asyncio.sleep(SEND_RETRY_DELAY_SECONDS)
+
+
+@traced("telegram.reply_photo")
+async def safe_reply_photo(
+    message: Message, photo: Any, priority: int = PRIORITY_DEFAULT, **kwargs: Any
+):
+    """Send a photo (bytes or a file_id) through the outbound scheduler."""
+    if outbound_scheduler.running:
+        return await outbound_scheduler.submit(
+            message.chat_id,
+            lambda: message.reply_photo(photo, **kwargs),
+            priority=priority,
+        )
+    return await message.reply_photo(photo, **kwargs)
+
+
+@traced("telegram.reply_document")
+async def safe_reply_document(
+    message: Message, document: Any, priority: int = PRIORITY_DEFAULT, **kwargs: Any
+):
+    """Send a document through the outbound scheduler."""
+    if outbound_scheduler.running:
+        return await outbound_scheduler.submit(
+            message.chat_id,
+            lambda: message.reply_document(document, **kwargs),
+            priority=priority,
+        )
+    return await message.reply_document(document, **kwargs)
+
+
+class TrackedHTTPXRequest(HTTPXRequest):
+    """
+    HTTPXRequest that reports Bot API availability to HEALTH.
+
+    getUpdates goes to its own dependency without latency: a long poll
+    lasts until an update arrives or the poll timeout ends.
+    """
+
+    async def do_request(
+        self, url: str, method: str, *args: Any, **kwargs: Any
+    ) -> Tuple[int, bytes]:
+        name = POLLING if url.endswith("/getUpdates") else "telegram"
+        started_at = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as exc:
+            HEALTH.record(name, None, f"{type(exc).__name__}: {exc}")
+            raise
+        # 4xx — ответ Telegram на сам запрос, API доступен
+        HEALTH.record(
+            name,
+            None if name == POLLING else time.perf_counter() - started_at,
+            f"HTTP {code}" if code >= 500 else None,
+        )
+        return code, payload
@@ -0,0 +1,184 @@
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from telegram import Update
+
+from config import TRACE_SLOW_MS
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк статистики профилировщика писать в лог
+PROFILE_TOP_FUNCTIONS = 25
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name: str, start: Optional[float] = None):
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = time.perf_counter() if self.end is None else self.end
+        return (end - self.start) * 1000
+
+    def format(self, origin: float, depth: int = 0) -> List[str]:
+        lines = [
+            f"{'  ' * depth}{self.name}: {self.duration_ms:.1f} ms "
+            f"(+{(self.start - origin) * 1000:.1f} ms)"
+        ]
+        for child in self.children:
+            lines.extend(child.format(origin, depth + 1))
+        return lines
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_dispatch_started_at: ContextVar[Optional[float]] = ContextVar(
+    "dispatch_started_at", default=None
+)
+
+
+def mark_dispatch_start() -> None:
+    """Remember when the application started routing the current update."""
+    _dispatch_started_at.set(time.perf_counter())
+
+
+@contextmanager
+def span(name: str):
+    """Record a child span of the current trace. No-op outside a traced update."""
+    parent = _current_span.get()
+    if parent is None:
+        yield
+        return
+    child = Span(name)
+    # list.append атомарен, поэтому спаны из потоков Sheets безопасны
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator recording a span around a sync or async function."""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class UpdateProfiler:
+    """
+    Opt-in cProfile sampling of 1 in N traced updates.
+
+    The profiler is enabled for the whole duration of the handler, so other
+    coroutines running on the event loop meanwhile show up in the profile as
+    well. Only one update is profiled at a time.
+    """
+
+    def __init__(self):
+        self.sample_every = 0
+        self._counter = 0
+        self._active = False
+
+    def configure(self, sample_every: int) -> None:
+        self.sample_every = max(sample_every, 0)
+        self._counter = 0
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if not self.sample_every or self._active:
+            return None
+        self._counter += 1
+        if self._counter % self.sample_every:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Другой профилировщик уже активен в этом потоке
+            return None
+        self._active = True
+        return profile
+
+    def finish(self, profile: cProfile.Profile, name: str) -> None:
+        profile.disable()
+        self._active = False
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(
+            PROFILE_TOP_FUNCTIONS
+        )
+        logger.info("Profile of %s:\n%s", name, output.getvalue())
+
+
+profiler = UpdateProfiler()
+
+
+def trace_update(func):
+    """
+    Decorator tracing one update handled by `func`.
+
+    Stack it above require_auth so the auth check becomes part of the trace.
+    Traces slower than TRACE_SLOW_MS are written to the log as a span tree.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(update: Update, *args, **kwargs):
+        root = Span(func.__name__)
+        dispatch_started_at = _dispatch_started_at.get()
+        if dispatch_started_at is not None:
+            # Фоновые задачи копируют контекст — не считаем им маршрутизацию
+            _dispatch_started_at.set(None)
+            routing = Span("routing", dispatch_started_at)
+            routing.end = root.start
+            root.children.append(routing)
+            root.start = dispatch_started_at
+
+        token = _current_span.set(root)
+        profile = profiler.start()
+        try:
+            return await func(update, *args, **kwargs)
+        finally:
+            if profile is not None:
+                profiler.finish(profile, func.__name__)
+            root.end = time.perf_counter()
+            _current_span.reset(token)
+            if root.duration_ms >= TRACE_SLOW_MS:
+                update_id = getattr(update, "update_id", None)
+                logger.warning(
+                    "Slow update %s took %.1f ms:\n%s",
+                    update_id,
+                    root.duration_ms,
+                    "\n".join(root.format(root.start)),
+                )
+
+    return wrapper
@@ -0,0 +1,142 @@
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from enum import Enum
+from typing import Dict, List, Optional
+
+from services.receipt_index import ReceiptKey
+
+
+class TransactionType(str, Enum):
+    """Transaction type; the value is the label written to the sheet."""
+
+    INCOME = "Доход"
+    EXPENSE = "Расход"
+
+    @property
+    def key(self) -> str:
+        """Name used by CategoryService: "income" or "expense"."""
+        return "income" if self is TransactionType.INCOME else "expense"
+
+    @classmethod
+    def from_key(cls, key: str) -> "TransactionType":
+        return cls.INCOME if key == "income" else cls.EXPENSE
+
+    @classmethod
+    def from_label(cls, label: str) -> "TransactionType":
+        """Type of a sheet row; anything but "Доход" counts as expense."""
+        return cls.INCOME if label == cls.INCOME.value else cls.EXPENSE
+
+
+def to_kopecks(value) -> Optional[int]:
+    """
+    Amount in kopecks from a number or a sheet cell.
+
+    Goes through Decimal so that 0.1 + 0.2 style float noise doesn't change
+    the result. Returns None if the value is not a number.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value * 100
+    try:
+        amount = Decimal(str(value).replace(",", ".").replace(" ", "").replace("\xa0", ""))
+        return int((amount * 100).to_integral_value())
+    except (InvalidOperation, ValueError, OverflowError):
+        return None
+
+
+def kopecks_to_cell(kopecks: int):
+    """Amount for the sheet: whole rubles as int, otherwise rubles with kopecks."""
+    if kopecks % 100 == 0:
+        return kopecks // 100
+    return kopecks / 100
+
+
+def format_rubles(kopecks: int) -> str:
+    return f"{kopecks / 100:.2f}"
+
+
+@dataclass(slots=True)
+class Transaction:
+    """
+    A transaction on its way from a message to the sheet.
+
+    Amounts are integer kopecks, so sums are exact. Category names are
+    interned: pending transactions of all users share one string per
+    category. Pickled as a plain tuple to keep persisted user_data small.
+    """
+
+    type: TransactionType
+    # Сумма в копейках
+    amount: int
+    category: Optional[str] = None
+    comment: str = ""
+    # Дата операции; None — момент записи
+    date: Optional[datetime] = None
+    # ID строки в таблице, назначается при первой записи
+    id: Optional[str] = None
+    receipt_key: Optional[ReceiptKey] = None
+
+    def __post_init__(self):
+        if self.category is not None:
+            self.category = sys.intern(self.category)
+
+    def set_category(self, category: str) -> None:
+        self.category = sys.intern(category)
+
+    @property
+    def rubles(self) -> float:
+        return self.amount / 100
+
+    def to_row(self, source: str) -> List:
+        """Row of a month sheet, in SHEET_HEADERS order."""
+        return [
+            (self.date or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+            self.type.value,
+            self.category,
+            kopecks_to_cell(self.amount),
+            source,
+            self.comment,
+            self.id,
+        ]
+
+    def __reduce__(self):
+        return (
+            _restore_transaction,
+            (
+                self.type is TransactionType.INCOME,
+                self.amount,
+                self.category,
+                self.comment,
+                self.date,
+                self.id,
+                self.receipt_key,
+            ),
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Transaction":
+        """Transaction from the dict form kept in user_data by older versions."""
+        return cls(
+            TransactionType.from_label(data["type"]),
+            to_kopecks(data["amount"]) or 0,
+            data.get("category"),
+            data.get("comment") or "",
+            data.get("date"),
+            data.get("id"),
+            data.get("receipt_key"),
+        )
+
+
+def _restore_transaction(
+    income, amount, category, comment, date, transaction_id, receipt_key
+) -> Transaction:
+    return Transaction(
+        TransactionType.INCOME if income else TransactionType.EXPENSE,
+        amount,
+        category,
+        comment,
+        date,
+        transaction_id,
+        receipt_key,
+    )
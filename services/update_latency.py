@@ -0,0 +1,64 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from services.metrics import UPDATE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Раз в сколько апдейтов писать сводку в лог
+LATENCY_REPORT_EVERY = 100
+
+
+class UpdateLatencyTracker:
+    """
+    Measures delay between receiving an update and the start of handling.
+
+    In webhook mode the receive time is stamped by the HTTP server with
+    perf_counter precision. In polling mode only the Telegram message date
+    (1 s precision) is available, which still allows comparing both modes.
+    """
+
+    def __init__(self, report_every: int = LATENCY_REPORT_EVERY):
+        self.report_every = report_every
+        self._received_at: Dict[int, float] = {}
+        self._samples: List[float] = []
+        # time.monotonic() последнего обновления, для /health
+        self.last_update_at: Optional[float] = None
+
+    def mark_received(self, update_id: int) -> None:
+        self._received_at[update_id] = time.perf_counter()
+
+    def observe(self, update: Update) -> None:
+        self.last_update_at = time.monotonic()
+        received_at = self._received_at.pop(update.update_id, None)
+        if received_at is not None:
+            latency_ms = (time.perf_counter() - received_at) * 1000
+        elif update.effective_message and update.effective_message.date:
+            sent_at = update.effective_message.date
+            latency_ms = (datetime.now(timezone.utc) - sent_at).total_seconds() * 1000
+        else:
+            return
+
+        UPDATE_LATENCY.labels().observe(latency_ms / 1000)
+        self._samples.append(latency_ms)
+        if len(self._samples) >= self.report_every:
+            samples = sorted(self._samples)
+            self._samples.clear()
+            logger.info(
+                "Update-to-handler latency over %s updates: p50=%.1f ms, p95=%.1f ms, max=%.1f ms",
+                len(samples),
+                samples[len(samples) // 2],
+                samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                samples[-1],
+            )
+
+    async def handle_update(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        """TypeHandler callback registered in a group before all other handlers."""
+        self.observe(update)
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import SimpleUpdateProcessor
+
+from services.tracing import mark_dispatch_start
+
+
+class PerUserUpdateProcessor(SimpleUpdateProcessor):
+    """
+    Processes updates concurrently while keeping each user's updates in order.
+
+    Updates of one user (or chat, if there is no user) are serialized with a
+    FIFO lock, so ConversationHandler transitions for that user happen in the
+    order Telegram delivered them. Updates of different users run in
+    parallel, bounded by max_concurrent_updates. The per-user lock is taken
+    before the global semaphore, so a user with a long queue doesn't occupy
+    slots needed by others.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._queued: Dict[Hashable, int] = {}
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[Hashable]:
+        """Return the key whose updates must be processed sequentially."""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return "user", update.effective_user.id
+        if update.effective_chat:
+            return "chat", update.effective_chat.id
+        return None
+
+    @property
+    def queued_updates(self) -> int:
+        """Number of updates waiting for or holding a per-user lock."""
+        return sum(self._queued.values())
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Начало маршрутизации — отсчёт для спана routing в трассировке
+        mark_dispatch_start()
+        await coroutine
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._queued[key] = self._queued.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._queued[key] -= 1
+            if not self._queued[key]:
+                # Никто больше не ждёт — освобождаем память
+                del self._queued[key]
+                del self._locks[key]
@@ -0,0 +1,231 @@
+"""
+Cold-start benchmark: import time of bot.py and time to the first getUpdates.
+
+Usage:
+    python tools/cold_start_bench.py --runs 5 --max-import-ms 600 --max-start-ms 1500
+
+Every run starts a fresh interpreter. The import phase runs
+`python -X importtime -c "import bot"` and reports the heaviest top-level
+imports; the startup phase runs bot.main() against a fake Bot API that
+exits on the first getUpdates, so it measures everything before polling
+starts. Both phases work in a temporary directory with the checkout's .env;
+Google Sheets are only contacted by the background warm-up after startup.
+
+Exits with status 1 if a median exceeds its limit or a module from
+DEFERRED_MODULES is imported by `import bot` — these are loaded on first use.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_TOKEN = "123456:COLDSTART"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Cold", "username": "cold_bot"}
+
+# Модули, которые не должны загружаться при импорте bot
+DEFERRED_MODULES = (
+    "googleapiclient.discovery",
+    "google.oauth2.service_account",
+    "httplib2",
+    "aiohttp",
+    "openpyxl",
+    "pandas",
+    "numpy",
+    "PIL",
+    "pyzbar",
+)
+
+
+def prepare_workspace() -> str:
+    """Working directory with the categories and no users or state files."""
+    workspace = tempfile.mkdtemp(prefix="bot-cold-start-")
+    os.makedirs(os.path.join(workspace, "data"))
+    shutil.copy(
+        os.path.join(ROOT_DIR, "data", "categories.json"),
+        os.path.join(workspace, "data", "categories.json"),
+    )
+    return workspace
+
+
+def child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def parse_importtime(stderr: str) -> Tuple[Optional[float], Dict[str, float], List[str]]:
+    """Total import time of bot in ms, cumulative ms of its direct imports, all modules."""
+    total = None
+    top_level: Dict[str, float] = {}
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        module = name.strip()
+        modules.append(module)
+        if module == "bot" and depth == 0:
+            total = int(cumulative) / 1000
+        elif depth == 1:
+            top_level[module] = int(cumulative) / 1000
+    return total, top_level, modules
+
+
+def measure_import(workspace: str) -> Tuple[float, Dict[str, float], List[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        cwd=workspace,
+        env=child_env(),
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    total, top_level, modules = parse_importtime(result.stderr)
+    if result.returncode != 0 or total is None:
+        sys.stderr.write(result.stderr[-2000:])
+        raise SystemExit("import bot failed")
+    return total, top_level, modules
+
+
+def measure_startup(workspace: str) -> Dict[str, float]:
+    started_at = time.time()
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", repr(started_at)],
+        cwd=workspace,
+        env=child_env(),
+        capture_output=True,
+        text=True,
+        check=False,
+        timeout=120,
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith("{"):
+            return json.loads(line)
+    sys.stderr.write(result.stderr[-2000:])
+    raise SystemExit("bot did not reach getUpdates")
+
+
+def run_child(started_at: float) -> None:
+    """Run bot.main() until the first getUpdates and print the timings."""
+    sys.path.insert(0, ROOT_DIR)
+    import functools
+
+    import bot
+    from telegram.request import BaseRequest
+
+    imported_at = time.time()
+
+    class FirstPollRequest(BaseRequest):
+        """Bot API stand-in that stops the process on the first getUpdates."""
+
+        async def initialize(self) -> None:
+            pass
+
+        async def shutdown(self) -> None:
+            pass
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            endpoint = url.rsplit("/", 1)[-1]
+            if endpoint == "getUpdates":
+                now = time.time()
+                print(
+                    json.dumps(
+                        {
+                            "interpreter_and_import_ms": (imported_at - started_at) * 1000,
+                            "first_get_updates_ms": (now - started_at) * 1000,
+                        }
+                    ),
+                    flush=True,
+                )
+                os._exit(0)
+            if endpoint == "getMe":
+                result = dict(BOT_USER, can_join_groups=True, supports_inline_queries=False)
+            else:
+                result = True
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    # Замеряем запуск в режиме polling и без сервера метрик
+    bot.BOT_MODE = "polling"
+    bot.METRICS_PORT = 0
+    bot.HEALTH_PORT = 0
+    bot.build_application = functools.partial(
+        bot.build_application,
+        token=BOT_TOKEN,
+        request=FirstPollRequest(),
+        persistence_file=os.path.join("data", "bot_state.sqlite3"),
+    )
+    bot.main()
+
+
+def report(name: str, values: List[float], limit: float) -> bool:
+    median = statistics.median(values)
+    within = not limit or median <= limit
+    print(
+        f"{name}: median {median:.0f} ms, min {min(values):.0f} ms, max {max(values):.0f} ms"
+        + (f" (limit {limit:.0f} ms{'' if within else ' EXCEEDED'})" if limit else "")
+    )
+    return within
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="heaviest imports to show")
+    parser.add_argument("--max-import-ms", type=float, default=0, help="0 disables the check")
+    parser.add_argument("--max-start-ms", type=float, default=0, help="0 disables the check")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        run_child(args.child)
+        return
+
+    workspace = prepare_workspace()
+    ok = True
+    try:
+        imports, tops = [], []
+        deferred_loaded = set()
+        for _ in range(args.runs):
+            total, top_level, modules = measure_import(workspace)
+            imports.append(total)
+            tops.append(top_level)
+            deferred_loaded.update(
+                module
+                for module in modules
+                if any(module == name or module.startswith(name + ".") for name in DEFERRED_MODULES)
+            )
+        ok &= report("import bot", imports, args.max_import_ms)
+        heaviest = sorted(tops[-1].items(), key=lambda item: item[1], reverse=True)
+        for module, cumulative in heaviest[: args.top]:
+            print(f"  {cumulative:7.1f} ms  {module}")
+        if deferred_loaded:
+            ok = False
+            print("Deferred modules imported by bot: " + ", ".join(sorted(deferred_loaded)))
+
+        startups = [measure_startup(workspace) for _ in range(args.runs)]
+        report(
+            "interpreter start + import",
+            [startup["interpreter_and_import_ms"] for startup in startups],
+            0,
+        )
+        ok &= report(
+            "first getUpdates",
+            [startup["first_get_updates_ms"] for startup in startups],
+            args.max_start_ms,
+        )
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Synthetic load test for the bot's handlers.
+
+Builds the real Application with build_application() against a fake Bot
+API and in-process fakes of Google Sheets and SaluteSpeech, then runs
+virtual users through text, voice, callback and command flows at several
+concurrency levels. Reports throughput, handler latency percentiles per
+update kind and event-loop lag.
+
+Usage:
+    python tools/load_test.py --levels 1,10,50 --duration 10 \\
+        --sheets-latency 0.3 --speech-latency 0.8 --telegram-latency 0.05
+
+Every level runs with the outbound scheduler, so per-chat Telegram budgets
+apply as in production; --direct-sends measures the handlers alone. The
+tool works in a temporary directory with its own allowed users and state
+files, so data/ of the checkout is left untouched.
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+import services.sheets_service  # noqa: E402
+import services.sheets_writer  # noqa: E402
+import services.speech_service  # noqa: E402
+from config import SHEETS_SHARD_REQUESTS_PER_MINUTE, SHEETS_WRITER_SHARDS  # noqa: E402
+from services.logging_setup import setup_logging  # noqa: E402
+from services.sheets_writer import ShardedSheetsWriter  # noqa: E402
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Load", "username": "load_bot"}
+FAKE_SHEET_TITLE = "Нагрузочный тест"
+LOOP_LAG_INTERVAL = 0.01
+# Доли сценариев в смеси нагрузки
+SCENARIO_WEIGHTS = {"text": 5, "voice": 2, "command": 3}
+
+
+class FakeSheetsService(services.sheets_service.GoogleSheetsService):
+    """
+    Google Sheets stand-in sleeping in the calling thread like real API calls.
+
+    Writes run in the writer's worker processes, so they sleep there and
+    scale with --writer-shards.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def _call(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_available_sheets(self, spreadsheet_ids):
+        return [(FAKE_SHEET_TITLE, "load-test")]
+
+    def write_rows(self, spreadsheet_id, rows_by_sheet):
+        self._call()
+        return {
+            sheet_name: {"updates": {"updatedRange": f"'{sheet_name}'!A2:F{len(rows) + 1}"}}
+            for sheet_name, rows in rows_by_sheet.items()
+        }
+
+    def prepare_month_sheet(self, spreadsheet_id, sheet_name, materialized=False):
+        self._call()
+
+    def get_sheet_names(self, spreadsheet_id):
+        self._call()
+        return []
+
+    def get_month_rows(self, spreadsheet_id, sheet_name):
+        self._call()
+        return []
+
+    def get_monthly_statistics(self, spreadsheet_id):
+        self._call()
+        return {
+            "total_income": 100000.0,
+            "total_expense": 42000.0,
+            "top_expenses": [("Продукты", 20000.0), ("Транспорт", 5000.0)],
+            "avg_daily_expense": 1400.0,
+        }
+
+
+class FakeSpeechService(services.speech_service.SpeechService):
+    """SaluteSpeech stand-in returning a fixed phrase after a delay."""
+
+    latency = 0.0
+    phrase = "потратил 350"
+
+    async def transcribe_voice(self, voice_file_path: str) -> str:
+        await asyncio.sleep(self.latency)
+        return self.phrase
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Bot API stand-in answering every method locally after a fixed delay."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._message_ids = itertools.count(1_000_000)
+        # Последняя клавиатура, отправленная в чат, — её «нажимают» пользователи
+        self.keyboards: Dict[int, Tuple[int, list]] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, parameters: dict, message_id: Optional[int] = None) -> dict:
+        chat_id = int(parameters["chat_id"])
+        message_id = message_id or next(self._message_ids)
+        markup = parameters.get("reply_markup")
+        if markup and "inline_keyboard" in markup:
+            self.keyboards[chat_id] = (message_id, markup["inline_keyboard"])
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": parameters.get("text", ""),
+        }
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> Tuple[int, bytes]:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if "/file/bot" in url:
+            return 200, b"OggS" + bytes(1024)
+
+        endpoint = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = dict(BOT_USER, can_join_groups=True, supports_inline_queries=False)
+        elif endpoint == "sendMessage":
+            result = self._message(parameters)
+        elif endpoint == "editMessageText":
+            result = self._message(parameters, int(parameters["message_id"]))
+        elif endpoint == "getFile":
+            result = {
+                "file_id": parameters["file_id"],
+                "file_unique_id": parameters["file_id"],
+                "file_path": f"voice/{parameters['file_id']}.ogg",
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LoadRunner:
+    def __init__(self, application, telegram: FakeTelegramRequest, think_time: float):
+        self.application = application
+        self.telegram = telegram
+        self.think_time = think_time
+        self._update_ids = itertools.count(1)
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+    def _message_update(self, user_id: int, **fields) -> dict:
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "message": dict(
+                message_id=update_id,
+                date=int(time.time()),
+                chat={"id": user_id, "type": "private"},
+                **{"from": self._user(user_id)},
+                **fields,
+            ),
+        }
+
+    def _callback_update(self, user_id: int, message_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "",
+                },
+            },
+        }
+
+    async def _send(self, kind: str, data: dict) -> None:
+        update = Update.de_json(data, self.application.bot)
+        started_at = time.perf_counter()
+        try:
+            # Так же, как Application: через процессор с порядком по пользователям
+            await self.application.update_processor.process_update(
+                update, self.application.process_update(update)
+            )
+        except Exception:
+            self.errors += 1
+            logging.getLogger(__name__).exception("Update %s failed", kind)
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - started_at)
+
+    async def _press_first_button(self, user_id: int) -> None:
+        if user_id not in self.telegram.keyboards:
+            return
+        message_id, keyboard = self.telegram.keyboards.pop(user_id)
+        data = keyboard[0][0]["callback_data"]
+        await self._send("callback", self._callback_update(user_id, message_id, data))
+
+    async def _transaction_flow(self, kind: str, user_id: int, **fields) -> None:
+        await self._send(kind, self._message_update(user_id, **fields))
+        # Категория (если бот спросил) и подтверждение «Да»
+        for _ in range(2):
+            await self._press_first_button(user_id)
+
+    async def scenario(self, user_id: int) -> None:
+        kind = random.choices(
+            list(SCENARIO_WEIGHTS), weights=list(SCENARIO_WEIGHTS.values())
+        )[0]
+        if kind == "text":
+            await self._transaction_flow("text", user_id, text="потратил 500")
+        elif kind == "voice":
+            voice = {"file_id": f"voice{user_id}", "file_unique_id": f"v{user_id}", "duration": 2}
+            await self._transaction_flow("voice", user_id, voice=voice)
+        else:
+            command = random.choice(["/stats", "/help"])
+            entities = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+            await self._send("command", self._message_update(user_id, text=command, entities=entities))
+
+    async def virtual_user(self, user_id: int, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            await self.scenario(user_id)
+            if self.think_time:
+                await asyncio.sleep(random.uniform(0, 2 * self.think_time))
+
+
+async def measure_loop_lag(lags: List[float], stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lags.append(max(loop.time() - expected, 0.0))
+
+
+async def run_level(runner: LoadRunner, users: int, duration: float) -> None:
+    runner.latencies = {}
+    runner.errors = 0
+    lags: List[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lags, stop))
+
+    started_at = time.monotonic()
+    deadline = started_at + duration
+    await asyncio.gather(
+        *(runner.virtual_user(user_id, deadline) for user_id in range(1, users + 1))
+    )
+    elapsed = time.monotonic() - started_at
+    stop.set()
+    await lag_task
+
+    total = sum(len(values) for values in runner.latencies.values())
+    print(
+        f"\n{users} users: {total} updates in {elapsed:.1f} s, "
+        f"{total / elapsed:.1f} updates/s, errors: {runner.errors}"
+    )
+    for kind, values in sorted(runner.latencies.items()):
+        print(
+            f"  {kind:<8} n={len(values):<6} "
+            f"p50={percentile(values, 0.5) * 1000:7.1f} ms "
+            f"p95={percentile(values, 0.95) * 1000:7.1f} ms "
+            f"p99={percentile(values, 0.99) * 1000:7.1f} ms "
+            f"max={max(values) * 1000:7.1f} ms"
+        )
+    print(
+        f"  loop lag p50={percentile(lags, 0.5) * 1000:.1f} ms "
+        f"p99={percentile(lags, 0.99) * 1000:.1f} ms "
+        f"max={max(lags, default=0) * 1000:.1f} ms"
+    )
+
+
+def prepare_workspace(max_users: int) -> str:
+    """Create a working directory with synthetic allowed users and categories."""
+    workspace = tempfile.mkdtemp(prefix="bot-load-")
+    os.makedirs(os.path.join(workspace, "data"))
+    shutil.copy(
+        os.path.join(ROOT_DIR, "data", "categories.json"),
+        os.path.join(workspace, "data", "categories.json"),
+    )
+    users = [
+        {"user_id": user_id, "selected_spreadsheet_id": "load-test"}
+        for user_id in range(1, max_users + 1)
+    ]
+    with open(os.path.join(workspace, "data", "allowed_users.json"), "w", encoding="utf-8") as f:
+        json.dump({"allowed_users": users}, f, ensure_ascii=False)
+    return workspace
+
+
+async def run(args: argparse.Namespace) -> None:
+    levels = [int(level) for level in args.levels.split(",")]
+    workspace = prepare_workspace(max(levels))
+    os.chdir(workspace)
+
+    # Подменяем классы сервисов до импорта bot: он берёт их при импорте,
+    # а создаёт сервисы в build_application()
+    FakeSpeechService.latency = args.speech_latency
+    services.sheets_service.GoogleSheetsService = lambda: FakeSheetsService(args.sheets_latency)
+    services.speech_service.SpeechService = FakeSpeechService
+    # Писатель создаёт сам bot, чтобы на нём были его слушатели записей
+    # (агрегаты, индексы поиска и строк) и повтор очереди
+    services.sheets_writer.ShardedSheetsWriter = functools.partial(
+        ShardedSheetsWriter,
+        shards=args.writer_shards or SHEETS_WRITER_SHARDS,
+        requests_per_minute=args.shard_quota or SHEETS_SHARD_REQUESTS_PER_MINUTE,
+        service_factory=functools.partial(FakeSheetsService, args.sheets_latency),
+    )
+    import bot
+
+    # Таблица фейка — единственная общая таблица из .env
+    bot.SPREADSHEET_IDS[:] = ["load-test"]
+    setup_logging(logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        # Под нагрузкой медленных трасс много, они заглушили бы отчёт
+        logging.getLogger("services.tracing").setLevel(logging.ERROR)
+
+    telegram = FakeTelegramRequest(args.telegram_latency)
+    application = bot.build_application(
+        token=BOT_TOKEN,
+        request=telegram,
+        persistence_file=os.path.join(workspace, "data", "bot_state.sqlite3"),
+    )
+    async with application:
+        await application.start()
+        if not args.direct_sends:
+            bot.outbound_scheduler.start()
+        runner = LoadRunner(application, telegram, args.think_time)
+        try:
+            for users in levels:
+                await run_level(runner, users, args.duration)
+        finally:
+            await bot.outbound_scheduler.stop()
+            await bot.sheets_writer.stop()
+            await application.stop()
+    print(f"\nFake Bot API requests: {telegram.requests}")
+    shutil.rmtree(workspace, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--levels", default="1,10,50", help="comma-separated user counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between flows")
+    parser.add_argument("--sheets-latency", type=float, default=0.3)
+    parser.add_argument("--speech-latency", type=float, default=0.8)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--writer-shards", type=int, default=0, help="override SHEETS_WRITER_SHARDS")
+    parser.add_argument(
+        "--shard-quota", type=int, default=0, help="override SHEETS_SHARD_REQUESTS_PER_MINUTE"
+    )
+    parser.add_argument("--direct-sends", action="store_true", help="bypass the outbound scheduler")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logs")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
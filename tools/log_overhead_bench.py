@@ -0,0 +1,117 @@
+"""
+Per-update cost of logging in the calling thread.
+
+Usage:
+    python tools/log_overhead_bench.py --updates 20000 --runs 5
+
+Replays the log calls of a voice transaction (transcribed text, the parsed
+transaction, a disabled debug line) for every update and measures the time
+spent in the caller — the event loop in the bot — with three setups:
+
+    direct    StreamHandler on the root logger, formatting and writing inline
+    queued    setup_logging() without sampling: the caller only enqueues
+    sampled   setup_logging() as in the bot, repetitive records are sampled
+
+Records go to a temporary file, so the numbers don't depend on the terminal.
+The drain column is the time until the listener thread has written all
+queued records.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LOG_SAMPLE_INTERVAL  # noqa: E402
+from services.logging_setup import LOG_FORMAT, setup_logging, stop_logging  # noqa: E402
+from services.transaction import Transaction, TransactionType  # noqa: E402
+
+bench_logger = logging.getLogger("bot")
+
+
+def emit_update(number: int, transaction: Transaction) -> None:
+    """Log calls made by the bot while handling one voice transaction."""
+    bench_logger.debug("Get access token")
+    bench_logger.info("Transcribed text: %s", f"расход {number} рублей продукты")
+    bench_logger.info("Transaction: %s", transaction)
+
+
+def configure_direct(stream) -> Callable[[], None]:
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+    def teardown() -> None:
+        root.removeHandler(handler)
+        handler.flush()
+
+    return teardown
+
+
+def configure_queued(stream, interval: float) -> Callable[[], None]:
+    listener = setup_logging(logging.INFO)
+    # Пишем в файл вместо stderr; interval=0 отключает выборку
+    listener.handlers[0].setStream(stream)
+    for handler in logging.getLogger().handlers:
+        for log_filter in handler.filters:
+            log_filter.interval = interval
+
+    def teardown() -> None:
+        stop_logging()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+
+    return teardown
+
+
+def run(setup: str, updates: int) -> Tuple[float, float, int]:
+    """Caller µs per update, drain ms, records written."""
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as stream:
+        if setup == "direct":
+            teardown = configure_direct(stream)
+        else:
+            teardown = configure_queued(stream, 0 if setup == "queued" else LOG_SAMPLE_INTERVAL)
+        transaction = Transaction(TransactionType.EXPENSE, 150000, "Продукты", "продукты")
+        started_at = time.perf_counter()
+        for number in range(updates):
+            emit_update(number, transaction)
+        emitted_at = time.perf_counter()
+        teardown()
+        drained_at = time.perf_counter()
+        stream.seek(0)
+        written = sum(1 for _ in stream)
+    return (
+        (emitted_at - started_at) / updates * 1e6,
+        (drained_at - emitted_at) * 1000,
+        written,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'setup':<8} {'µs/update':>10} {'drain ms':>10} {'records':>10}")
+    for setup in ("direct", "queued", "sampled"):
+        results: List[Tuple[float, float, int]] = [
+            run(setup, args.updates) for _ in range(args.runs)
+        ]
+        print(
+            f"{setup:<8} {statistics.median(r[0] for r in results):>10.2f}"
+            f" {statistics.median(r[1] for r in results):>10.1f}"
+            f" {results[-1][2]:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
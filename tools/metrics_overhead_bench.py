@@ -0,0 +1,65 @@
+"""
+Measure per-call overhead of the metrics instrumentation.
+
+Usage:
+    python tools/metrics_overhead_bench.py --calls 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.metrics import Histogram, timed  # noqa: E402
+
+
+def bench_sync(calls: int) -> float:
+    histogram = Histogram("bench_sync_seconds", "bench", ["function"])
+
+    def plain():
+        return None
+
+    instrumented = timed(histogram)(plain)
+
+    started_at = time.perf_counter()
+    for _ in range(calls):
+        plain()
+    baseline = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for _ in range(calls):
+        instrumented()
+    return (time.perf_counter() - started_at - baseline) / calls * 1e6
+
+
+async def bench_async(calls: int) -> float:
+    histogram = Histogram("bench_async_seconds", "bench", ["function"])
+
+    async def plain():
+        return None
+
+    instrumented = timed(histogram)(plain)
+
+    started_at = time.perf_counter()
+    for _ in range(calls):
+        await plain()
+    baseline = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for _ in range(calls):
+        await instrumented()
+    return (time.perf_counter() - started_at - baseline) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+    print(f"sync overhead:  {bench_sync(args.calls):.3f} us/call")
+    print(f"async overhead: {asyncio.run(bench_async(args.calls)):.3f} us/call")
+
+
+if __name__ == "__main__":
+    main()
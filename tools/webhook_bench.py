@@ -0,0 +1,83 @@
+"""
+Post synthetic updates to a running webhook server and report latency.
+
+Usage:
+    python tools/webhook_bench.py --url http://127.0.0.1:8443/telegram \\
+        --secret "$WEBHOOK_SECRET_TOKEN" --count 500 --concurrency 20
+
+Updates are unknown commands from a fake user, so they pass through the
+webhook and the latency tracker without calling Sheets or sending messages.
+Handler-side latency is logged by UpdateLatencyTracker in the bot logs.
+"""
+import argparse
+import asyncio
+import itertools
+import sys
+import time
+import os
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.webhook_server import SECRET_TOKEN_HEADER  # noqa: E402
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Load"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": "/webhook_bench",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 14}],
+        },
+    }
+
+
+async def run(url: str, secret: str, count: int, concurrency: int, user_id: int) -> None:
+    update_ids = itertools.count(int(time.time()))
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession(headers={SECRET_TOKEN_HEADER: secret}) as session:
+
+        async def post_one() -> None:
+            async with semaphore:
+                started_at = time.perf_counter()
+                async with session.post(url, json=make_update(next(update_ids), user_id)) as response:
+                    await response.read()
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                latencies.append((time.perf_counter() - started_at) * 1000)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(post_one() for _ in range(count)))
+        elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    print(f"updates: {count}, concurrency: {concurrency}, statuses: {statuses}")
+    print(f"throughput: {count / elapsed:.1f} updates/s")
+    print(
+        "latency ms: "
+        f"p50={latencies[len(latencies) // 2]:.2f} "
+        f"p95={latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.2f} "
+        f"max={latencies[-1]:.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET_TOKEN", ""))
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--user-id", type=int, default=999999999)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.secret, args.count, args.concurrency, args.user_id))
+
+
+if __name__ == "__main__":
+    main()